@@ -1,66 +1,72 @@
+import io
 import streamlit as st
 from funcoes import *
-from joblib import load
-from numpy import load as load_numpy
 
+medir_pagina("modelo") #Duração de cada execução da página (métricas exportadas pelo funcoes)
 #Configuração da página
 st.set_page_config(page_title="Análise de Medicamentos", layout="wide")
 st.title(":blue[Pharma Insights Modelo]")
 
 #Configuração da Barra Lateral
 
-valores_unicos = {} #Dicionário para armazenar os valores únicos de cada coluna
-categoricas = ["Action Class", "Chemical Class", "Habit Forming", "Therapeutic Class", "use0"]
-for coluna in categoricas:
-    valores_unicos[coluna] = load(f"objects/encoder_{coluna}.joblib")
-cross_val = load_numpy("objects/cross_val.npy", allow_pickle=True).item() #Carregamento e exibição do cross_val
-st.markdown(f"<div style='font-size: 18px; font-weight: bold'> Acurácia aproximada do Modelo: {cross_val*100:.2f}%</div>", unsafe_allow_html=True)
+artefatos = carregar_artefatos() #Encoders, scaler, modelo e acurácia carregados uma única vez por processo
+inferencia = obter_inferencia(artefatos) #Previsão de uma linha sem pandas, compilada uma única vez por processo
+valores_unicos = artefatos["encoders"] #Dicionário com os encoders (e valores únicos) de cada coluna
+categoricas = CATEGORICAS
+cross_val = artefatos["cross_val"] #Exibição do cross_val
+avaliacao = artefatos["avaliacao"] #Métricas da seleção de modelos (validação cruzada no treino e conjunto de teste separado)
+if avaliacao:
+    validacao, teste = avaliacao["validacao_cruzada"], avaliacao["teste"]
+    st.markdown(f"<div style='font-size: 18px; font-weight: bold'> Acurácia do Modelo ({avaliacao['modelo']}) na validação cruzada\
+                ({validacao['folds']} folds estratificados no treino): {validacao['acuracia']*100:.2f}% ± {validacao['acuracia_desvio']*100:.2f}\
+                | No conjunto de teste: {teste['acuracia']*100:.2f}% (ROC-AUC {teste['roc_auc']:.3f})</div>", unsafe_allow_html=True)
+else:
+    st.markdown(f"<div style='font-size: 18px; font-weight: bold'> Acurácia aproximada do Modelo: {cross_val*100:.2f}%</div>", unsafe_allow_html=True)
 
 
 with st.sidebar:
     with st.expander("Expanda para inserir os dados do novo medicamento", expanded=True):
-        dados = load_data("medicamentos_final.csv")
         classe_acao = st.selectbox("Classe de Ação", valores_unicos["Action Class"].classes_, help="Selecione a classe de ação do medicamento")
         classe_quimica = st.selectbox("Classe Química", valores_unicos["Chemical Class"].classes_, help="Selecione a classe química do medicamento")
         formador_habito = st.selectbox("Formador de Hábito", valores_unicos["Habit Forming"].classes_, help="Selecione se o medicamento é formador de hábito")
         classe_terapeutica = st.selectbox("Classe Terapêutica", valores_unicos["Therapeutic Class"].classes_, help="Selecione a classe terapêutica do medicamento")
         uso = st.selectbox("Uso", valores_unicos["use0"].classes_, help="Selecione o uso do medicamento")                        
         dosagem = st.number_input("Dosagem", value=0, help="Selecione a dosagem do medicamento")
-        novos_dados = pd.DataFrame({
+        valores_inseridos = {
             "Action Class": classe_acao,
             "Chemical Class": classe_quimica,
             "Habit Forming": formador_habito,            
             "Therapeutic Class": classe_terapeutica,            
             "use0": uso,
             "dosage": dosagem
-        }, index=[0])    
+        }
     processar = st.button(":blue[Processar os dados]", help="Clique para processar os dados inseridos e gerar a previsão.")
+    with st.expander("Pontuação em lote (arquivo CSV)"):
+        arquivo_lote = st.file_uploader("Arquivo com os medicamentos candidatos", type="csv",
+                                        help="O arquivo deve conter as colunas Action Class, Chemical Class, Habit Forming,\
+                                        \n Therapeutic Class, use0 e dosage.")
+        shap_lote = st.checkbox("Incluir os valores SHAP", help="Adiciona a contribuição de cada variável para a classe prevista em cada previsão.")
+        processar_lote = st.button(":blue[Pontuar o arquivo]", disabled=arquivo_lote is None)
   
 if processar:
     progresso = st.progress(50, 
                             text="Processando os dados inseridos... Por favor aguarde um momento.")    
     try:            
-        for nome_coluna in categoricas: # Carregamento do encoder para cada coluna categórica
-            arquivo_encoder = f'objects/encoder_{nome_coluna}.joblib'
-            encoder = load(arquivo_encoder)
-            novos_dados[nome_coluna] = encoder.transform(novos_dados[nome_coluna])    
-        
-        scaler = load("objects/scaler.joblib")  #Carregamento do scaler
-        novos_dados["dosage"] = scaler.transform(novos_dados[["dosage"]]) #Transformação da dosagem no dadoframe
-        
+        linha = inferencia.codificar(valores_inseridos) #Limitador de categorias, encoders e scaler pré-compilados
     except ValueError as erro: #Tratamento de erro caso o valor não esteja no encoder
-        st.error(f"Erro ao transformar valor {novos_dados[nome_coluna]}: {erro}")    
+        st.error(f"Erro ao transformar os valores inseridos: {erro}")    
+        st.stop()
 
-    modelo = load("objects/best_model.joblib") #Carregamento do Modelo    
+    modelo = artefatos["modelo"] #Modelo compartilhado pelo pacote de artefatos    
+    novos_dados = pd.DataFrame([linha], columns=inferencia.colunas) #Linha codificada, para o gráfico SHAP
     
-    #Geração da previsão e probabilidade
-    previsao = modelo.predict(novos_dados)
-    previsao_proba = modelo.predict_proba(novos_dados)
+    #Geração da previsão e probabilidade (uma única passagem pela floresta)
+    previsao, previsao_proba = inferencia.prever_linha(linha)
 
     # Exibição dos resultados    
     
     progresso.progress(75, "Gerando Interpretação!")
-    figura = Treexplainer(modelo, novos_dados)
+    figura = Treexplainer(modelo, novos_dados, obter_explicador(artefatos)) #Explicador compartilhado, com cache das explicações
     st.markdown("<h1 style='text-align: center; color: #33A6F9'>Interpretação do Modelo</h1>", unsafe_allow_html=True)        
     st_shap(figura, height=200, width=1600) # Plotar o gráfico SHAP    
     progresso.progress(100, "Processamento concluído!")   
@@ -74,19 +80,55 @@ if processar:
     st.markdown("<hr style='border: 1px solid #33A6F9; margin-top: 20px; margin-bottom: 20px;'>", unsafe_allow_html=True)
     st.markdown("<h1 style='text-align: center; color: #33A6F9'>Resultados da Previsão:</h1>", unsafe_allow_html=True)    
     dicionario_previsao = {0: "Baixo risco de efeitos adversos", 1: "Alto risco de efeitos adversos"}
-    if previsao[0] == 0:
-        st.markdown(f"<div style='font-size: 28px; font-weight:bold'>Previsão absoluta: {dicionario_previsao[previsao[0]]}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size: 28px; font-weight: bold'>Probabilidade: {previsao_proba[0][0]*100:.2f}%</div>", unsafe_allow_html=True)
+    if previsao == 0:
+        st.markdown(f"<div style='font-size: 28px; font-weight:bold'>Previsão absoluta: {dicionario_previsao[previsao]}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size: 28px; font-weight: bold'>Probabilidade: {previsao_proba[0]*100:.2f}%</div>", unsafe_allow_html=True)
     else:
-        st.markdown(f"<div style='font-size: 28px; font-weight:bold'>Previsão absoluta:  {dicionario_previsao[previsao[0]]}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size: 28px; font-weight: bold'>Probabilidade: {previsao_proba[0][1]*100:.2f}%</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size: 28px; font-weight:bold'>Previsão absoluta:  {dicionario_previsao[previsao]}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size: 28px; font-weight: bold'>Probabilidade: {previsao_proba[1]*100:.2f}%</div>", unsafe_allow_html=True)
     
     st.markdown("")
     st.markdown("<div style='font-size: 18px; font-weight: bold'>Este indicador representa a probabilidade de ocorrência de efeitos adversos inferiores à média observada,\
     destacando a segurança relativa do medicamento em comparação com outras opções disponíveis no mercado. Embora, de forma geral, todos os medicamentos apresentem\
     algum nível de risco à saúde, aqueles classificados como 'Baixo risco' possuem, mesmo sem comprovação científica definitiva, um potencial promissor para servir\
-    de base a futuras pesquisas. Tais estudos podem resultar no desenvolvimento de medicamentos ainda mais seguros, o que é um aspecto relevante a ser levado em consideração. </div>", unsafe_allow_html=True)    
-    
-    
-    
+    de base a futuras pesquisas. Tais estudos podem resultar no desenvolvimento de medicamentos ainda mais seguros, o que é um aspecto relevante a ser levado em consideração. </div>", unsafe_allow_html=True)
+
+    #Visão global: SHAP de todo o treino agregado por grupo (calculado offline com python construir_dados.py cubo_shap)
+    cubo = carregar_cubo_shap()
+    if cubo is not None:
+        resumo, n_grupo, grupo = cubo.consultar_medicamento(classe_terapeutica, classe_acao, dosagem) #Consulta ao cubo, sem TreeSHAP
+        geral, n_treino = cubo.consultar()
+        st.markdown("<hr style='border: 1px solid #33A6F9; margin-top: 20px; margin-bottom: 20px;'>", unsafe_allow_html=True)
+        st.markdown("<h1 style='text-align: center; color: #33A6F9'>Visão Global do Modelo</h1>", unsafe_allow_html=True)
+        if n_grupo:
+            escala = "no log-odds" if cubo.ligacao == "logit" else "na probabilidade" #Modelos de saída única são explicados em log-odds
+            st.markdown(f"<div style='font-size: 18px; font-weight: bold'>Impacto médio de cada variável {escala} de alto risco\
+                        nos {n_grupo:,} medicamentos de treino do grupo {html.escape(grupo)}, comparado aos {n_treino:,} medicamentos de todo o treino.\
+                        O texto de cada barra indica a direção média: valores positivos aumentam o risco previsto.</div>", unsafe_allow_html=True)
+            st.plotly_chart(figura_cubo_shap(resumo, geral, cubo.ligacao), use_container_width=True)
+        else:
+            st.info("Não há medicamentos de treino na classe terapêutica selecionada.")
 
+
+if processar_lote:
+    progresso_lote = st.progress(0, text="Pontuando o arquivo... Por favor aguarde um momento.")
+    saida_lote = io.StringIO()
+    total, com_erro = 0, 0
+    try:
+        for numero, lote in enumerate(pontuar_lote(arquivo_lote, artefatos, com_shap=shap_lote)):
+            lote.to_csv(saida_lote, header=numero == 0, index=False)
+            total += len(lote)
+            com_erro += int((lote["erro"] != "").sum())
+            progresso_lote.progress(min(99, numero + 1), text=f"{total:,} linhas processadas...")
+    except ValueError as erro: #Arquivo sem as colunas necessárias
+        st.error(f"Erro ao pontuar o arquivo: {erro}")
+        st.stop()
+    progresso_lote.progress(100, "Processamento concluído!")
+
+    st.markdown("<hr style='border: 1px solid #33A6F9; margin-top: 20px; margin-bottom: 20px;'>", unsafe_allow_html=True)
+    st.markdown("<h1 style='text-align: center; color: #33A6F9'>Pontuação em Lote</h1>", unsafe_allow_html=True)
+    st.markdown(f"<div style='font-size: 18px; font-weight: bold'>Linhas processadas: {total:,} | Linhas com erro: {com_erro:,}</div>",
+                unsafe_allow_html=True)
+    if com_erro:
+        st.warning("Algumas linhas possuem categorias desconhecidas ou dosagem inválida. Consulte a coluna 'erro' no arquivo gerado.")
+    st.download_button(":blue[Baixar os resultados]", saida_lote.getvalue(), file_name="previsoes.csv", mime="text/csv")
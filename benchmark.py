@@ -0,0 +1,496 @@
+"""
+Medições de desempenho dos caminhos críticos do Pharma Insights.
+
+A suíte mede as funções de funcoes.py usadas pelas páginas em catálogos sintéticos de medicamentos
+gerados em múltiplos do tamanho do conjunto real (1x, 10x, 100x), com nomes, substitutos e efeitos
+colaterais distribuídos como no original (poucos valores muito frequentes e uma cauda longa).
+Os resultados são gravados em JSON e o comando comparar termina com código de saída 1 quando
+alguma medição piora além do limite informado em relação à referência.
+
+Uso:
+    python benchmark.py inferencia --repeticoes 2000
+    python benchmark.py sugestoes --escalas 1 10 --consultas 500
+    python benchmark.py catalogo --escalas 1 10 100
+    python benchmark.py suite --escalas 1 10 --saida referencia.json
+    python benchmark.py suite --escalas 1 10 --saida atual.json
+    python benchmark.py comparar referencia.json atual.json --limite 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from funcoes import (CATEGORICAS, COLUNAS_MODELO, ConjuntoDados, ExplicadorSHAP, GrafoSubstitutos, IndiceNomes,
+                     IndiceTrigramas, Treexplainer, assinatura_arquivos, carregar_artefatos, criar_grafo, filter_dosage,
+                     gerar_nuvem, limit_unique_values, load_and_process_data, load_data, nuvem_classe, obter_cubo_efeitos,
+                     obter_inferencia, tipar_colunas)
+
+
+LINHAS_REAIS = 248218 #Linhas do medicine_dataset original
+DIRETORIO_CATALOGOS = os.path.join("cache", "benchmark")
+SILABAS = np.array(["ra", "zi", "to", "mox", "cef", "lin", "pra", "dol", "vas", "tel",
+                    "mi", "ne", "cor", "xa", "ben", "flo", "gen", "pan", "tri", "sul"], dtype=object)
+FORMAS = {"Tablet": 0.55, "Capsule": 0.12, "Injection": 0.1, "Syrup": 0.08, "Cream": 0.05,
+          "Drop": 0.04, "Suspension": 0.03, "Gel": 0.03}
+DOSAGENS = {0: 0.12, 5: 0.08, 10: 0.1, 20: 0.07, 40: 0.06, 50: 0.07, 100: 0.1, 250: 0.1,
+            500: 0.14, 625: 0.05, 650: 0.04, 1000: 0.07}
+CLASSES_TERAPEUTICAS = ["ANTI INFECTIVES", "PAIN ANALGESICS", "GASTRO INTESTINAL", "RESPIRATORY", "CARDIAC",
+                        "ANTI DIABETIC", "DERMA", "NEURO CNS", "VITAMINS MINERALS NUTRIENTS", "GYNAECOLOGICAL",
+                        "OPHTHAL", "ANTI NEOPLASTICS", "HORMONES", "UROLOGY", "BLOOD RELATED", "OTOLOGICALS",
+                        "ANTI MALARIALS", "VACCINES", "STOMATOLOGICALS", "OTHERS"]
+EFEITOS_COMUNS = ["Nausea", "Headache", "Dizziness", "Vomiting", "Diarrhea", "Rash", "Sleepiness", "Stomach pain",
+                  "Constipation", "Dryness in mouth", "Fatigue", "Injection site pain", "Abdominal pain", "Itching"]
+N_SUBSTITUTOS = {0: 0.3, 1: 0.05, 2: 0.05, 3: 0.05, 4: 0.05, 5: 0.5}
+N_COLUNAS_EFEITOS = 11 #sideEffect0...sideEffect10, como em effects.csv
+
+
+#================================================================================
+
+#Catálogos sintéticos
+def amostra_zipf(rng, n_valores, tamanho, expoente=1.0):
+    """Índices em [0, n_valores) com frequência proporcional a 1 / posição^expoente (poucos valores comuns e uma cauda longa)."""
+    pesos = np.cumsum(1.0 / np.arange(1, n_valores + 1) ** expoente)
+    return np.minimum(np.searchsorted(pesos / pesos[-1], rng.random(tamanho)), n_valores - 1)
+
+
+def amostra(rng, distribuicao, tamanho):
+    """Valores sorteados de um dicionário {valor: probabilidade}."""
+    valores = np.array(list(distribuicao))
+    probabilidades = np.array(list(distribuicao.values()))
+    return valores[rng.choice(len(valores), tamanho, p=probabilidades / probabilidades.sum())]
+
+
+def nomes_marcas(n_marcas):
+    """
+    Nomes de marca pronunciáveis, um por id: as sílabas são os dígitos do id na base 20, todos com a mesma
+    quantidade de sílabas para que nenhuma marca seja prefixo de outra (como nos nomes reais).
+    """
+    ids = np.arange(n_marcas)
+    n_silabas = max(2, int(np.ceil(np.log(max(n_marcas, 2)) / np.log(len(SILABAS)))))
+    nomes = pd.Series("", index=ids, dtype=object)
+    for _ in range(n_silabas):
+        nomes = nomes + SILABAS[ids % len(SILABAS)]
+        ids = ids // len(SILABAS)
+    return nomes.str.capitalize().to_numpy(dtype=object)
+
+
+def nomes_medicamentos(rng, marcas, tamanho):
+    """Nomes no formato do catálogo ("Marca 500mg Tablet"), com marcas populares se repetindo e as dosagens de cada nome."""
+    marca = marcas[amostra_zipf(rng, len(marcas), tamanho, expoente=0.6)]
+    dosagem = amostra(rng, DOSAGENS, tamanho)
+    texto_dosagem = np.where(dosagem > 0, pd.Series(dosagem).astype(str).to_numpy(dtype=object) + "mg ", "")
+    return pd.Series(marca + " " + texto_dosagem + amostra(rng, FORMAS, tamanho).astype(object)), dosagem
+
+
+def gerar_parte(rng, n_linhas, marcas, usos, efeitos):
+    """Gera uma parte do catálogo com as colunas da tabela do dashboard e de effects.csv."""
+    nomes, dosagens = nomes_medicamentos(rng, marcas, n_linhas)
+    parte = {"name": nomes}
+    n_substitutos = amostra(rng, N_SUBSTITUTOS, n_linhas)
+    for k in range(5):
+        substitutos, _ = nomes_medicamentos(rng, marcas, n_linhas)
+        parte[f"substitute{k}"] = substitutos.where(k < n_substitutos, "Not Applicable")
+    parte["n_substitutes"] = n_substitutos
+    parte["use0"] = usos[amostra_zipf(rng, len(usos), n_linhas, expoente=1.1)]
+    n_efeitos = np.minimum(1 + rng.poisson(3.5, n_linhas), 42)
+    for k in range(N_COLUNAS_EFEITOS):
+        sorteados = efeitos[amostra_zipf(rng, len(efeitos), n_linhas)]
+        parte[f"sideEffect{k}"] = np.where(k < n_efeitos, sorteados, "Not Applicable")
+    parte["n_effects"] = n_efeitos
+    parte["dosage"] = dosagens
+    parte["Therapeutic Class"] = np.array(CLASSES_TERAPEUTICAS, dtype=object)[amostra_zipf(rng, len(CLASSES_TERAPEUTICAS), n_linhas, 0.8)]
+    return tipar_colunas(pd.DataFrame(parte))
+
+
+def erros_digitacao(rng, familias):
+    """
+    Versões dos nomes com um erro de digitação (letra omitida, trocada, repetida ou invertida com a seguinte)
+    e com as maiúsculas trocadas em metade dos casos, como as consultas que não encontram nenhum medicamento.
+    """
+    erros = []
+    for familia in familias:
+        posicao, tipo = rng.integers(len(familia)), rng.integers(4)
+        if tipo == 0 and len(familia) > 1:
+            familia = familia[:posicao] + familia[posicao + 1:]
+        elif tipo == 1:
+            familia = familia[:posicao] + str(rng.choice(list("aeioulnrst"))) + familia[posicao + 1:]
+        elif tipo == 2:
+            familia = familia[:posicao] + familia[posicao] + familia[posicao:]
+        elif posicao < len(familia) - 1:
+            familia = familia[:posicao] + familia[posicao + 1] + familia[posicao] + familia[posicao + 2:]
+        erros.append(familia.upper() if rng.random() < 0.25 else familia.lower() if rng.random() < 0.33 else familia)
+    return erros
+
+
+def caminho_catalogo(escala, diretorio=DIRETORIO_CATALOGOS):
+    return os.path.join(diretorio, f"catalogo_{escala}x.parquet")
+
+
+def gerar_catalogo(escala, diretorio=DIRETORIO_CATALOGOS, semente=42):
+    """
+    Gera (se ainda não existir) o catálogo sintético com escala x LINHAS_REAIS linhas.
+    O catálogo é escrito em partes do tamanho do conjunto real, então a memória usada não cresce com a escala.
+    Parâmetros:
+      escala (int): Múltiplo do tamanho do conjunto real.
+      diretorio (str): Pasta dos catálogos.
+      semente (int): Semente dos sorteios (mesma semente, mesmo catálogo).
+    Retorno: caminho (str): Arquivo Parquet do catálogo.
+    """
+    caminho = caminho_catalogo(escala, diretorio)
+    if os.path.exists(caminho):
+        return caminho
+    os.makedirs(diretorio, exist_ok=True)
+    embaralhar = np.random.default_rng(semente).permutation #As marcas mais frequentes não ficam em ordem alfabética
+    marcas = embaralhar(nomes_marcas(max(1000, escala * LINHAS_REAIS // 4)))
+    usos = np.array([f"Treatment of {doenca}" for doenca in embaralhar(nomes_marcas(600))], dtype=object)
+    efeitos = np.array(EFEITOS_COMUNS + [f"{nome} reaction" for nome in embaralhar(nomes_marcas(2000))], dtype=object)
+
+    escritor, esquema = None, None
+    for numero in range(escala):
+        rng = np.random.default_rng([semente, escala, numero])
+        tabela = pa.Table.from_pandas(gerar_parte(rng, LINHAS_REAIS, marcas, usos, efeitos), preserve_index=False)
+        if escritor is None:
+            #Índices dos dicionários em int32 para que todas as partes tenham o mesmo esquema
+            esquema = pa.schema([campo.with_type(pa.dictionary(pa.int32(), campo.type.value_type))
+                                 if pa.types.is_dictionary(campo.type) else campo for campo in tabela.schema],
+                                metadata=tabela.schema.metadata)
+            escritor = pq.ParquetWriter(caminho + ".tmp", esquema)
+        escritor.write_table(tabela.cast(esquema))
+    escritor.close()
+    os.replace(caminho + ".tmp", caminho)
+    return caminho
+
+
+#================================================================================
+
+#Medições
+def medir(funcao, repeticoes, aquecimento=20):
+    """Executa a função repetidas vezes e retorna as latências (em microssegundos) de cada chamada."""
+    for _ in range(aquecimento):
+        funcao()
+    latencias = np.empty(repeticoes)
+    for indice in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        latencias[indice] = time.perf_counter() - inicio
+    return latencias * 1e6
+
+
+def cronometrar(funcao, repeticoes, preparar=None, aquecimento=1):
+    """
+    Tempo (em segundos) de cada repetição da função.
+    A preparação (por exemplo, a limpeza dos caches do Streamlit) é executada antes de cada repetição, fora da medição.
+    """
+    tempos = []
+    for numero in range(aquecimento + repeticoes):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        if numero >= aquecimento:
+            tempos.append(time.perf_counter() - inicio)
+    return np.array(tempos)
+
+
+def resumo(nome, latencias):
+    """Linha com a mediana e os percentis 90 e 99 das latências."""
+    p50, p90, p99 = np.percentile(latencias, [50, 90, 99])
+    return f"{nome:<28} p50 {p50:9.1f} µs | p90 {p90:9.1f} µs | p99 {p99:9.1f} µs"
+
+
+def inferencia(args):
+    """Compara a previsão de uma linha pela página original (pandas + sklearn) e pela InferenciaCompilada."""
+    artefatos = carregar_artefatos(args.objetos)
+    compilada = obter_inferencia(artefatos)
+    valores = {coluna: artefatos["encoders"][coluna].classes_[0] for coluna in CATEGORICAS}
+    valores["dosage"] = 500
+
+    def pagina_original():
+        novos_dados = pd.DataFrame(valores, index=[0])
+        for coluna in CATEGORICAS:
+            novos_dados[coluna] = artefatos["encoders"][coluna].transform(novos_dados[coluna])
+        novos_dados["dosage"] = artefatos["scaler"].transform(novos_dados[["dosage"]])
+        return artefatos["modelo"].predict(novos_dados), artefatos["modelo"].predict_proba(novos_dados)
+
+    original = medir(pagina_original, max(1, args.repeticoes // 10))
+    otimizada = medir(lambda: compilada.prever(valores), args.repeticoes)
+    print(resumo("página original", original))
+    print(resumo("inferência compilada", otimizada))
+    print(f"Ganho na mediana: {np.median(original) / np.median(otimizada):.0f}x")
+
+
+def latencias_consultas(funcao, consultas):
+    """Latência (em microssegundos) da função em cada uma das consultas."""
+    latencias = np.empty(len(consultas))
+    for indice, consulta in enumerate(consultas):
+        inicio = time.perf_counter()
+        funcao(consulta)
+        latencias[indice] = time.perf_counter() - inicio
+    return latencias * 1e6
+
+
+def sugestoes(args):
+    """
+    Compara a validação do nome por varredura (str.contains em todos os nomes, sem diferenciar maiúsculas)
+    com o índice de nomes e o índice de trigramas, em consultas com erros de digitação nos catálogos sintéticos.
+    """
+    for escala in args.escalas:
+        caminho = gerar_catalogo(escala, args.diretorio, args.semente)
+        conjunto = ConjuntoDados(pq.read_table(caminho, memory_map=True), assinatura_arquivos([caminho]))
+        nomes = conjunto["name"]
+        inicio = time.perf_counter()
+        indice = IndiceNomes(nomes, conjunto["dosage"])
+        construcao_nomes = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        trigramas = IndiceTrigramas(nomes)
+        construcao_trigramas = time.perf_counter() - inicio
+
+        rng = np.random.default_rng(args.semente)
+        familias = [nome.split(" ")[0] for nome in nomes.to_numpy(dtype=object)[rng.choice(len(nomes), args.consultas)]]
+        erros = erros_digitacao(rng, familias)
+        acertos = np.mean([familia.lower() in {sugestao.lower() for sugestao, _ in trigramas.sugerir(erro)}
+                           for familia, erro in zip(familias, erros)])
+
+        print(f"Catálogo {escala}x: {len(nomes):,} nomes, {len(trigramas.familias):,} famílias, "
+              f"{len(trigramas.codigos):,} trigramas | construção: IndiceNomes {construcao_nomes:.1f}s, "
+              f"IndiceTrigramas {construcao_trigramas:.1f}s")
+        varredura = erros[:max(1, args.consultas // 20)] #A varredura é lenta demais para todas as consultas
+        print(resumo("varredura (str.contains)", latencias_consultas(
+            lambda erro: bool(nomes.str.contains(erro, case=False, regex=False).any()), varredura)))
+        print(resumo("IndiceNomes.existe", latencias_consultas(indice.existe, erros)))
+        print(resumo("IndiceTrigramas.corrigir", latencias_consultas(trigramas.corrigir, erros)))
+        print(resumo("IndiceTrigramas.sugerir", latencias_consultas(trigramas.sugerir, erros)))
+        print(f"Nome original entre as 5 sugestões em {acertos:.1%} das consultas com erro de digitação", flush=True)
+
+
+#================================================================================
+
+#Suíte de funções em catálogos sintéticos
+FUNCOES_SUITE = ["load_data", "load_and_process_data", "filter_dosage", "sugerir", "limit_unique_values",
+                 "plot_cloud", "nuvem_classe", "criar_grafo", "Treexplainer", "predict"]
+
+
+def plot_cloud(data, classe, output_file=None):
+    """
+    Caminho anterior da nuvem de palavras, mantido apenas como referência de comparação para nuvem_classe:
+    a nuvem é desenhada em uma figura do Matplotlib (opcionalmente salva em 600 dpi) em vez de codificada direto em PNG.
+    Parâmetros:
+      data (ConjuntoDados): Os dados dos efeitos colaterais.
+      classe (str): A classe terapêutica.
+      output_file (str): O nome de salvamento da nuvem (se omitido, a imagem não é salva em disco).
+    Retorno: fig (Figure): A figura da nuvem de palavras.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(5, 5))
+    ax.imshow(gerar_nuvem(obter_cubo_efeitos(data), classe), interpolation="bilinear")
+    ax.axis("off")
+    if output_file is not None:
+        fig.savefig(output_file, bbox_inches="tight", dpi=600)
+    plt.close(fig)
+    return fig
+
+
+def medicoes_catalogo(caminho, n_consultas, rng):
+    """
+    Medições que dependem do tamanho do catálogo: nome -> (função, preparação, operações por repetição).
+    As consultas são nomes sorteados do próprio catálogo, então os medicamentos populares aparecem mais.
+    """
+    conjunto = ConjuntoDados(pq.read_table(caminho, memory_map=True), assinatura_arquivos([caminho]))
+    indice = IndiceNomes(conjunto["name"], conjunto["dosage"])
+    trigramas = IndiceTrigramas(conjunto["name"])
+    rede = GrafoSubstitutos(conjunto)
+    linhas = rng.choice(len(conjunto), n_consultas)
+    familias = conjunto["name"].to_numpy(dtype=object)[linhas]
+    familias = [nome.split(" ")[0] for nome in familias]
+    erros = erros_digitacao(rng, familias)
+    dosagens = conjunto["dosage"].to_numpy()[linhas]
+    posicoes = [filter_dosage(indice, familia, None) for familia in familias]
+    usos = conjunto["use0"].astype(object)
+    classe = conjunto["Therapeutic Class"].astype(object).mode()[0]
+
+    def limpar_nuvem():
+        nuvem_classe.clear()
+        obter_cubo_efeitos.clear()
+
+    return {
+        "load_data": (lambda: load_data(caminho), load_data.clear, 1),
+        "load_and_process_data": (lambda: [load_and_process_data(indice, familia) for familia in familias], None, n_consultas),
+        "filter_dosage": (lambda: [filter_dosage(indice, familia, dosagem) for familia, dosagem in zip(familias, dosagens)],
+                          None, n_consultas),
+        "sugerir": (lambda: [trigramas.sugerir(erro) for erro in erros], None, n_consultas),
+        "limit_unique_values": (lambda: limit_unique_values(pd.DataFrame({"use0": usos}), "use0", 20), None, 1),
+        "plot_cloud": (lambda: plot_cloud(conjunto, classe), limpar_nuvem, 1),
+        "nuvem_classe": (lambda: nuvem_classe(conjunto, classe, diretorio=DIRETORIO_CATALOGOS), limpar_nuvem, 1), #Sem nuvens pré-renderizadas
+        "criar_grafo": (lambda: [criar_grafo(rede, posicao) for posicao in posicoes], None, n_consultas),
+    }
+
+
+def linhas_modelo(artefatos, n_linhas, rng):
+    """Features codificadas sorteadas dentro das classes conhecidas pelos encoders (ordem de COLUNAS_MODELO)."""
+    colunas = {coluna: rng.integers(0, len(artefatos["encoders"][coluna].classes_), n_linhas) for coluna in CATEGORICAS}
+    colunas["dosage"] = rng.normal(0, 1, n_linhas)
+    return pd.DataFrame(colunas, columns=COLUNAS_MODELO)
+
+
+def medicoes_modelo(artefatos, n_linhas, n_consultas, repeticoes, rng):
+    """
+    Medições do modelo: explicação SHAP de linhas novas (sem acertos no cache do explicador)
+    e previsão em lote de um catálogo inteiro pela floresta servida.
+    """
+    X = linhas_modelo(artefatos, n_linhas, rng)
+    novas = linhas_modelo(artefatos, n_consultas * (repeticoes + 1), rng)
+    explicador = ExplicadorSHAP(artefatos["modelo"])
+    proximas = iter(range(len(novas)))
+
+    def explicar():
+        for _ in range(n_consultas):
+            linha = next(proximas)
+            Treexplainer(artefatos["modelo"], novas.iloc[linha:linha + 1], explicador)
+
+    return {
+        "Treexplainer": (explicar, None, n_consultas),
+        "predict": (lambda: artefatos["floresta"].predict_proba(X.to_numpy()), None, n_linhas),
+    }
+
+
+def executar_medicoes(medicoes, funcoes, escala, repeticoes, resultados):
+    """Executa as medições selecionadas e registra tempos e estatísticas com a chave "funcao@escala"."""
+    for nome, (funcao, preparar, operacoes) in medicoes.items():
+        if nome not in funcoes:
+            continue
+        tempos = cronometrar(funcao, repeticoes, preparar)
+        if preparar is not None:
+            preparar() #Libera os caches preenchidos pela última repetição
+        chave = f"{nome}@{escala}x"
+        resultados[chave] = {"funcao": nome, "escala": escala, "linhas": escala * LINHAS_REAIS, "operacoes": operacoes,
+                             "mediana_s": float(np.median(tempos)), "minimo_s": float(tempos.min()),
+                             "p90_s": float(np.percentile(tempos, 90)), "tempos_s": tempos.tolist()}
+        print(f"{chave:<30} mediana {np.median(tempos) * 1e3:10.2f} ms | mínimo {tempos.min() * 1e3:10.2f} ms "
+              f"| {operacoes:,} operações por repetição", flush=True)
+
+
+def metadados_ambiente(args):
+    """Versões e máquina usadas na medição (comparações entre máquinas diferentes não são confiáveis)."""
+    import sklearn
+    return {"data": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "pyarrow": pa.__version__, "sklearn": sklearn.__version__,
+            "plataforma": platform.platform(), "processador": platform.processor(), "nucleos": os.cpu_count(),
+            "repeticoes": args.repeticoes, "consultas": args.consultas, "semente": args.semente}
+
+
+def suite(args):
+    """Executa a suíte nas escalas pedidas e grava os resultados em JSON."""
+    funcoes = args.funcoes or FUNCOES_SUITE
+    resultados = {}
+    for escala in args.escalas:
+        inicio = time.perf_counter()
+        caminho = gerar_catalogo(escala, args.diretorio, args.semente)
+        print(f"Catálogo {escala}x: {escala * LINHAS_REAIS:,} linhas ({time.perf_counter() - inicio:.1f}s)", flush=True)
+        rng = np.random.default_rng(args.semente)
+        executar_medicoes(medicoes_catalogo(caminho, args.consultas, rng), funcoes, escala, args.repeticoes, resultados)
+
+        if {"Treexplainer", "predict"} & set(funcoes):
+            try:
+                artefatos = carregar_artefatos(args.objetos)
+            except FileNotFoundError as erro:
+                print(f"Medições do modelo ignoradas (artefatos ausentes): {erro}")
+            else:
+                medicoes = medicoes_modelo(artefatos, escala * LINHAS_REAIS, args.consultas, args.repeticoes, rng)
+                executar_medicoes(medicoes, funcoes, escala, args.repeticoes, resultados)
+
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump({"metadados": metadados_ambiente(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+
+
+def comparar(args):
+    """Compara os resultados atuais com a referência e termina com código 1 se houver regressões além do limite."""
+    with open(args.referencia, encoding="utf-8") as arquivo:
+        referencia = json.load(arquivo)["resultados"]
+    with open(args.atual, encoding="utf-8") as arquivo:
+        atual = json.load(arquivo)["resultados"]
+
+    regressoes = []
+    for chave in sorted(referencia.keys() & atual.keys(), key=lambda chave: (atual[chave]["escala"], chave)):
+        razao = atual[chave][args.metrica] / referencia[chave][args.metrica]
+        if razao > 1 + args.limite:
+            situacao = "REGRESSÃO"
+            regressoes.append(chave)
+        elif razao < 1 / (1 + args.limite):
+            situacao = "melhora"
+        else:
+            situacao = "estável"
+        print(f"{chave:<30} {referencia[chave][args.metrica] * 1e3:10.2f} ms -> {atual[chave][args.metrica] * 1e3:10.2f} ms "
+              f"({razao:6.2f}x) {situacao}")
+    for chave in sorted(referencia.keys() - atual.keys()):
+        print(f"{chave:<30} ausente nos resultados atuais")
+
+    if regressoes:
+        print(f"{len(regressoes)} regressão(ões) acima de {args.limite:.0%}: {', '.join(regressoes)}")
+        sys.exit(1)
+    print(f"Nenhuma regressão acima de {args.limite:.0%}.")
+
+
+def catalogo(args):
+    """Gera os catálogos sintéticos das escalas pedidas (sem executar as medições)."""
+    for escala in args.escalas:
+        inicio = time.perf_counter()
+        caminho = gerar_catalogo(escala, args.diretorio, args.semente)
+        print(f"{caminho}: {escala * LINHAS_REAIS:,} linhas, {os.path.getsize(caminho) / 1e6:.1f} MB "
+              f"({time.perf_counter() - inicio:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Pharma Insights.")
+    medicoes = parser.add_subparsers(dest="medicao", required=True)
+
+    parser_inferencia = medicoes.add_parser("inferencia", help="Latência da previsão de uma única linha.")
+    parser_inferencia.add_argument("--repeticoes", type=int, default=2000)
+    parser_inferencia.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    parser_inferencia.set_defaults(funcao=inferencia)
+
+    parser_sugestoes = medicoes.add_parser("sugestoes", help="Latência das sugestões de nomes em consultas com erros de digitação.")
+    parser_sugestoes.add_argument("--escalas", type=int, nargs="+", default=[1], help="Múltiplos do tamanho do conjunto real.")
+    parser_sugestoes.add_argument("--consultas", type=int, default=500)
+    parser_sugestoes.add_argument("--diretorio", default=DIRETORIO_CATALOGOS)
+    parser_sugestoes.add_argument("--semente", type=int, default=42)
+    parser_sugestoes.set_defaults(funcao=sugestoes)
+
+    parser_catalogo = medicoes.add_parser("catalogo", help="Gera os catálogos sintéticos usados pela suíte.")
+    parser_catalogo.add_argument("--escalas", type=int, nargs="+", default=[1, 10, 100], help="Múltiplos do tamanho do conjunto real.")
+    parser_catalogo.add_argument("--diretorio", default=DIRETORIO_CATALOGOS)
+    parser_catalogo.add_argument("--semente", type=int, default=42)
+    parser_catalogo.set_defaults(funcao=catalogo)
+
+    parser_suite = medicoes.add_parser("suite", help="Mede as funções críticas nos catálogos sintéticos e grava os resultados em JSON.")
+    parser_suite.add_argument("--escalas", type=int, nargs="+", default=[1, 10, 100], help="Múltiplos do tamanho do conjunto real.")
+    parser_suite.add_argument("--funcoes", nargs="+", choices=FUNCOES_SUITE, help="Funções medidas (padrão: todas).")
+    parser_suite.add_argument("--repeticoes", type=int, default=5)
+    parser_suite.add_argument("--consultas", type=int, default=100, help="Consultas por repetição nas funções de busca e de grafo.")
+    parser_suite.add_argument("--saida", default="benchmark.json", help="Arquivo JSON dos resultados.")
+    parser_suite.add_argument("--diretorio", default=DIRETORIO_CATALOGOS, help="Pasta dos catálogos sintéticos.")
+    parser_suite.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    parser_suite.add_argument("--semente", type=int, default=42)
+    parser_suite.set_defaults(funcao=suite)
+
+    parser_comparar = medicoes.add_parser("comparar", help="Compara resultados com uma referência e falha se houver regressões.")
+    parser_comparar.add_argument("referencia", help="JSON de referência (gerado pelo comando suite).")
+    parser_comparar.add_argument("atual", help="JSON com os resultados atuais.")
+    parser_comparar.add_argument("--limite", type=float, default=0.1, help="Piora relativa tolerada (0.1 = 10%%).")
+    parser_comparar.add_argument("--metrica", choices=["mediana_s", "minimo_s", "p90_s"], default="mediana_s")
+    parser_comparar.set_defaults(funcao=comparar)
+
+    args = parser.parse_args()
+    args.funcao(args)
+
+
+if __name__ == "__main__":
+    main()
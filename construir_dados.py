@@ -0,0 +1,107 @@
+"""
+Etapas de construção dos conjuntos de dados usados pelo Streamlit.
+
+Uso:
+    python construir_dados.py colunar medicamentos.csv effects.csv medicamentos_final.csv
+    python construir_dados.py colunar effects.csv --formato feather
+    python construir_dados.py tabela
+    python construir_dados.py nuvens --processos 4
+    python construir_dados.py floresta
+    python construir_dados.py cubo_shap --processos 4
+"""
+
+import argparse
+import os
+import time
+from funcoes import (converter_para_colunar, construir_tabela_medicamentos, pre_renderizar_nuvens, exportar_floresta,
+                     exportar_cubo_shap, ARQUIVO_TABELA, DIRETORIO_NUVENS, DIRETORIO_FLORESTA, ARQUIVO_CUBO_SHAP)
+
+
+def colunar(args):
+    """Converte os CSVs informados para o formato colunar tipado."""
+    for arquivo in args.arquivos:
+        inicio = time.perf_counter()
+        destino = converter_para_colunar(arquivo, args.formato)
+        tamanho_csv = os.path.getsize(arquivo) / 1e6
+        tamanho_destino = os.path.getsize(destino) / 1e6
+        print(f"{arquivo} -> {destino}: {tamanho_csv:.1f} MB -> {tamanho_destino:.1f} MB "
+              f"({time.perf_counter() - inicio:.1f}s)")
+
+
+def tabela(args):
+    """Une medicamentos e efeitos colaterais na tabela usada pelo dashboard."""
+    inicio = time.perf_counter()
+    destino = construir_tabela_medicamentos(args.medicamentos, args.efeitos, args.destino)
+    print(f"Tabela unida gravada em {destino} ({time.perf_counter() - inicio:.1f}s)")
+
+
+def nuvens(args):
+    """Pré-renderiza as nuvens de palavras de todas as classes terapêuticas."""
+    inicio = time.perf_counter()
+    arquivos = pre_renderizar_nuvens(args.efeitos, args.destino, args.processos)
+    print(f"{len(arquivos)} nuvens gravadas em {args.destino} ({time.perf_counter() - inicio:.1f}s)")
+
+
+def floresta(args):
+    """Exporta o modelo servido para a floresta compacta e compara os tamanhos."""
+    inicio = time.perf_counter()
+    compacta = exportar_floresta(args.objetos, quantizar=not args.sem_quantizar, podar=not args.sem_podar)
+    if compacta is None:
+        print("best_model.joblib não é uma floresta do sklearn: o modelo é servido diretamente (ModeloDireto).")
+        return
+    tamanho_modelo = os.path.getsize(os.path.join(args.objetos, "best_model.joblib")) / 1e6
+    print(f"best_model.joblib ({tamanho_modelo:.1f} MB) -> {os.path.join(args.objetos, DIRETORIO_FLORESTA)}: "
+          f"{compacta.n_nos:,} nós, {compacta.nbytes / 1e6:.1f} MB ({time.perf_counter() - inicio:.1f}s)")
+
+
+def cubo_shap(args):
+    """Calcula o cubo SHAP global do modelo no conjunto de treino."""
+    inicio = time.perf_counter()
+    cubo = exportar_cubo_shap(args.objetos, args.dados, args.teste, args.semente, args.processos)
+    caminho = os.path.join(args.objetos, ARQUIVO_CUBO_SHAP)
+    _, n = cubo.consultar()
+    print(f"{n:,} linhas de treino -> {caminho}: {len(cubo.tabela):,} linhas (grupos x features), "
+          f"{os.path.getsize(caminho) / 1e3:.0f} kB ({time.perf_counter() - inicio:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construção dos conjuntos de dados do Pharma Insights.")
+    etapas = parser.add_subparsers(dest="etapa", required=True)
+
+    parser_colunar = etapas.add_parser("colunar", help="Converte CSVs para Parquet/Feather com tipos compactos.")
+    parser_colunar.add_argument("arquivos", nargs="+", help="Arquivos CSV a serem convertidos.")
+    parser_colunar.add_argument("--formato", choices=["parquet", "feather"], default="parquet")
+    parser_colunar.set_defaults(funcao=colunar)
+
+    parser_tabela = etapas.add_parser("tabela", help="Gera a tabela unida de medicamentos e efeitos colaterais.")
+    parser_tabela.add_argument("--medicamentos", default="medicamentos.csv")
+    parser_tabela.add_argument("--efeitos", default="effects.csv")
+    parser_tabela.add_argument("--destino", default=ARQUIVO_TABELA)
+    parser_tabela.set_defaults(funcao=tabela)
+
+    parser_nuvens = etapas.add_parser("nuvens", help="Pré-renderiza as nuvens de palavras de todas as classes em paralelo.")
+    parser_nuvens.add_argument("--efeitos", default="effects.csv")
+    parser_nuvens.add_argument("--destino", default=DIRETORIO_NUVENS)
+    parser_nuvens.add_argument("--processos", type=int, default=None, help="Quantidade de processos (padrão: um por núcleo).")
+    parser_nuvens.set_defaults(funcao=nuvens)
+
+    parser_floresta = etapas.add_parser("floresta", help="Exporta o modelo para a floresta compacta usada na inferência.")
+    parser_floresta.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    parser_floresta.add_argument("--sem-quantizar", action="store_true", help="Mantém os limiares em float64.")
+    parser_floresta.add_argument("--sem-podar", action="store_true", help="Mantém os ramos inalcançáveis.")
+    parser_floresta.set_defaults(funcao=floresta)
+
+    parser_cubo = etapas.add_parser("cubo_shap", help="Calcula os valores SHAP do treino agregados por classe e faixa de dosagem.")
+    parser_cubo.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    parser_cubo.add_argument("--dados", default="medicamentos_final.csv", help="Conjunto usado no treinamento.")
+    parser_cubo.add_argument("--teste", type=float, default=0.2, help="Proporção do teste na divisão usada no treinamento.")
+    parser_cubo.add_argument("--semente", type=int, default=42, help="Semente da divisão usada no treinamento.")
+    parser_cubo.add_argument("--processos", type=int, default=None, help="Quantidade de processos (padrão: um por núcleo).")
+    parser_cubo.set_defaults(funcao=cubo_shap)
+
+    args = parser.parse_args()
+    args.funcao(args)
+
+
+if __name__ == "__main__":
+    main()
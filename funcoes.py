@@ -5,34 +5,797 @@ a limpeza e a performance do código.
 As funções foram divididas em seções para facilitar a leitura e a manutenção do código.
 """
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-from wordcloud import WordCloud, STOPWORDS
-import plotly.express as px
+import os
+import io
+import re
+import html
+import json
+import time
+import atexit
+import bisect
+import hashlib
+import socket
+import warnings
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import subprocess
+import sys
 import pandas as pd
 import numpy as np
-from streamlit import cache_resource, cache_data
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import streamlit
 import streamlit.components.v1 as components
-from graphviz import Digraph
-import shap
+from joblib import load, dump
+
+# Bibliotecas pesadas (matplotlib, seaborn, wordcloud, plotly, networkx, scipy, graphviz e shap)
+# são importadas dentro das funções que as utilizam: cada página carrega apenas o que usa.
+
+
+#================================================================================
+#Instrumentação (latência das funções, caches e páginas) exportada no formato de texto do Prometheus
+INSTRUMENTACAO_ATIVA = os.environ.get("PHARMA_INSTRUMENTACAO", "1") != "0"
+#Cada processo (worker do Streamlit, serviço) grava o seu próprio arquivo, com o rótulo "processo" em todas as séries:
+#um arquivo compartilhado ficaria apenas com as métricas do último processo que o gravou
+PROCESSO = f"{socket.gethostname()}:{os.getpid()}"
+ARQUIVO_METRICAS = os.environ.get("PHARMA_METRICAS_ARQUIVO",
+                                  os.path.join("cache", "metricas", f"{socket.gethostname()}_{os.getpid()}.prom"))
+PORTA_METRICAS = os.environ.get("PHARMA_METRICAS_PORTA") #Se informada, as métricas também são servidas em http://:porta/metrics (uma porta por processo)
+INTERVALO_EXPORTACAO = 15 #Intervalo mínimo (em segundos) entre duas gravações do arquivo de métricas
+LIMITES_HISTOGRAMA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DESCRICOES_METRICAS = {
+    "pharma_funcao_duracao_segundos": ("histogram", "Latência das chamadas das funções instrumentadas de funcoes.py (caminhos críticos das páginas)."),
+    "pharma_pagina_duracao_segundos": ("histogram", "Duração de cada execução (rerun) das páginas do Streamlit."),
+    "pharma_cache_acertos_total": ("counter", "Chamadas das funções em cache respondidas pelo cache."),
+    "pharma_cache_falhas_total": ("counter", "Chamadas das funções em cache que executaram a função."),
+    "pharma_cache_descartes_total": ("counter", "Estimativa dos descartes por max_entries (cada falha com o cache cheio conta um descarte;"
+                                                 " expirações por TTL não são vistas)."),
+    "pharma_cache_entradas": ("gauge", "Estimativa das entradas no cache de cada função (falhas desde o início do processo ou a última"
+                                       " limpeza, limitadas ao max_entries; expirações por TTL e caches já aquecidos não são vistos)."),
+    #Serviço HTTP (servico.py): declaradas aqui para que o formato exportado não dependa dos módulos importados
+    "pharma_servico_duracao_segundos": ("histogram", "Latência das requisições do serviço HTTP, por rota."),
+    "pharma_servico_requisicoes_total": ("counter", "Requisições respondidas pelo serviço HTTP, por rota e status."),
+    "pharma_servico_lotes_total": ("counter", "Lotes processados por rota."),
+    "pharma_servico_linhas_total": ("counter", "Linhas processadas por rota (linhas / lotes = tamanho médio dos lotes)."),
+    "pharma_servico_fila": ("gauge", "Requisições aguardando na fila de cada rota."),
+}
+
+
+class Metricas:
+    """
+    Registro das métricas do processo (histogramas e contadores), compartilhado por todas as sessões.
+    Cada observação custa uma busca binária na lista de limites e um incremento sob uma trava,
+    então a instrumentação pode ficar ligada em produção.
+    Parâmetros:
+      limites (tuple): Limites superiores (em segundos) das faixas dos histogramas.
+    """
+
+    def __init__(self, limites=LIMITES_HISTOGRAMA):
+        self.limites = limites
+        self._histogramas = {} #(nome, rótulos) -> contagens por faixa (+Inf na última) e soma
+        self._valores = {} #(nome, rótulos) -> valor dos contadores e medidores
+        self._entradas = {} #Função em cache -> entradas estimadas (para estimar os descartes)
+        self._trava = threading.Lock()
+
+    def observar(self, nome, rotulos, valor):
+        """Registra um valor (em segundos) no histograma."""
+        faixa = bisect.bisect_left(self.limites, valor)
+        with self._trava:
+            histograma = self._histogramas.get((nome, rotulos))
+            if histograma is None:
+                histograma = self._histogramas[(nome, rotulos)] = [0] * (len(self.limites) + 1) + [0.0]
+            histograma[faixa] += 1
+            histograma[-1] += valor
+
+    def incrementar(self, nome, rotulos, valor=1):
+        with self._trava:
+            self._valores[(nome, rotulos)] = self._valores.get((nome, rotulos), 0) + valor
+
+    def definir(self, nome, rotulos, valor):
+        """Atualiza o valor de um medidor (gauge)."""
+        with self._trava:
+            self._valores[(nome, rotulos)] = valor
+
+    def registrar_cache(self, funcao, falha, max_entries):
+        """
+        Conta um acerto ou uma falha do cache da função. Os acertos e as falhas são medidos; as entradas e os descartes
+        são estimados supondo que cada falha grava uma nova entrada e que uma falha com o cache já cheio (max_entries)
+        descarta outra. O Streamlit não expõe o tamanho dos caches, então expirações por TTL e entradas gravadas
+        antes da instrumentação (ou por outro processo) fazem a estimativa se afastar do valor real.
+        """
+        rotulos = (("funcao", funcao),)
+        with self._trava:
+            chave = "pharma_cache_falhas_total" if falha else "pharma_cache_acertos_total"
+            self._valores[(chave, rotulos)] = self._valores.get((chave, rotulos), 0) + 1
+            if falha:
+                if max_entries is not None and self._entradas.get(funcao, 0) >= max_entries:
+                    chave = ("pharma_cache_descartes_total", rotulos)
+                    self._valores[chave] = self._valores.get(chave, 0) + 1
+                else:
+                    self._entradas[funcao] = self._entradas.get(funcao, 0) + 1
+            self._valores[("pharma_cache_entradas", rotulos)] = self._entradas.get(funcao, 0)
+
+    def limpar_cache(self, funcao):
+        """Zera as entradas estimadas de uma função cujo cache foi limpo."""
+        with self._trava:
+            self._entradas[funcao] = 0
+            self._valores[("pharma_cache_entradas", (("funcao", funcao),))] = 0
+
+    def texto_prometheus(self, rotulos_extras=()):
+        """
+        Todas as métricas no formato de texto de exposição do Prometheus.
+        Parâmetros: rotulos_extras (tuple): Pares (nome, valor) acrescentados a todas as séries (ex.: o processo).
+        """
+        with self._trava:
+            histogramas = {chave: list(valores) for chave, valores in self._histogramas.items()}
+            valores = dict(self._valores)
+        linhas = []
+        for nome, (tipo, descricao) in DESCRICOES_METRICAS.items():
+            series = sorted(chave for chave in (histogramas if tipo == "histogram" else valores) if chave[0] == nome)
+            if not series:
+                continue
+            linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} {tipo}"]
+            for _, rotulos in series:
+                if tipo != "histogram":
+                    linhas.append(f"{nome}{_rotulos_prometheus(rotulos_extras + rotulos)} {valores[(nome, rotulos)]}")
+                    continue
+                contagens = histogramas[(nome, rotulos)]
+                rotulos = rotulos_extras + rotulos
+                acumulado = 0
+                for limite, contagem in zip(self.limites + ("+Inf",), contagens):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_sum{_rotulos_prometheus(rotulos)} {contagens[-1]:.6f}")
+                linhas.append(f"{nome}_count{_rotulos_prometheus(rotulos)} {acumulado}")
+        return "\n".join(linhas) + "\n"
+
+
+def _rotulos_prometheus(rotulos):
+    """Rótulos no formato {nome="valor",...}, com as aspas, barras e quebras de linha escapadas."""
+    pares = ",".join('{}="{}"'.format(nome, str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                     for nome, valor in rotulos)
+    return "{" + pares + "}"
+
+
+METRICAS = Metricas()
+_pilha_cache = threading.local() #Pilha (por thread) das chamadas em cache em andamento, para identificar as falhas
+
+
+def instrumentar(funcao):
+    """
+    Decorador que registra a latência de cada chamada da função no histograma pharma_funcao_duracao_segundos.
+    Parâmetros: funcao (callable): Função a ser medida.
+    Retorno: envoltorio (callable): A função instrumentada (a própria função se a instrumentação estiver desligada).
+    """
+    if not INSTRUMENTACAO_ATIVA:
+        return funcao
+    rotulos = (("funcao", funcao.__name__),)
+
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            METRICAS.observar("pharma_funcao_duracao_segundos", rotulos, time.perf_counter() - inicio)
+
+    return envoltorio
+
+
+def _cache_instrumentado(decorador):
+    """
+    Envolve st.cache_data/st.cache_resource contando acertos, falhas e descartes de cada função em cache
+    e medindo a latência das chamadas (incluindo as respondidas pelo cache). Aceita os mesmos usos do decorador
+    original (@cache_data ou @cache_resource(max_entries=..., ...)) e mantém o método clear.
+    """
+    if not INSTRUMENTACAO_ATIVA:
+        return decorador
+
+    def cache(funcao=None, **opcoes):
+        if funcao is None:
+            return lambda funcao: cache(funcao, **opcoes)
+        nome = funcao.__name__
+        max_entries = opcoes.get("max_entries")
+
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs): #Só é executada quando a chamada não está no cache
+            pilha = getattr(_pilha_cache, "chamadas", None)
+            if pilha:
+                pilha[-1] = True
+            return funcao(*args, **kwargs)
+
+        em_cache = decorador(**opcoes)(executar)
+
+        @instrumentar
+        @functools.wraps(funcao)
+        def chamar(*args, **kwargs):
+            if not hasattr(_pilha_cache, "chamadas"):
+                _pilha_cache.chamadas = []
+            _pilha_cache.chamadas.append(False)
+            try:
+                return em_cache(*args, **kwargs)
+            finally:
+                METRICAS.registrar_cache(nome, _pilha_cache.chamadas.pop(), max_entries)
+
+        def limpar():
+            em_cache.clear()
+            METRICAS.limpar_cache(nome)
+
+        chamar.clear = limpar
+        return chamar
+
+    return cache
+
+
+cache_data = _cache_instrumentado(streamlit.cache_data)
+cache_resource = _cache_instrumentado(streamlit.cache_resource)
+
+
+def exportar_metricas(caminho=ARQUIVO_METRICAS, intervalo=INTERVALO_EXPORTACAO):
+    """
+    Grava as métricas em um arquivo .prom (lido pelo textfile collector do node_exporter, por exemplo),
+    no máximo uma vez a cada 'intervalo' segundos. A gravação é atômica (arquivo temporário + os.replace).
+    Por padrão cada processo grava o seu próprio arquivo, com o rótulo "processo" (host:pid), removido ao encerrar
+    o processo; com PHARMA_METRICAS_ARQUIVO, cada processo precisa de um caminho próprio.
+    Parâmetros:
+      caminho (str): Arquivo de destino.
+      intervalo (float): Intervalo mínimo entre duas gravações (0 grava sempre).
+    Retorno: gravado (bool): Se o arquivo foi gravado nesta chamada.
+    """
+    global _ultima_exportacao
+    agora = time.monotonic()
+    with _trava_exportacao:
+        if agora - _ultima_exportacao < intervalo:
+            return False
+        _ultima_exportacao = agora
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        arquivo.write(METRICAS.texto_prometheus((("processo", PROCESSO),)))
+    os.replace(temporario, caminho)
+    if caminho not in _arquivos_exportados: #Processos encerrados não deixam métricas antigas para o coletor
+        _arquivos_exportados.add(caminho)
+        atexit.register(_remover_arquivo_metricas, caminho)
+    return True
+
+
+def _remover_arquivo_metricas(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+_ultima_exportacao = float("-inf")
+_arquivos_exportados = set()
+_trava_exportacao = threading.Lock()
+_servidor_metricas = None
+
+
+def iniciar_servidor_metricas(porta):
+    """
+    Serve as métricas em http://:porta/metrics em uma thread própria (uma única vez por processo).
+    Parâmetros: porta (int): Porta HTTP do servidor de métricas.
+    Retorno: servidor (ThreadingHTTPServer): Servidor em execução (None se a porta estiver ocupada).
+    """
+    global _servidor_metricas
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Requisicao(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            conteudo = METRICAS.texto_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(conteudo)))
+            self.end_headers()
+            self.wfile.write(conteudo)
+
+        def log_message(self, *args): #Sem registro de cada coleta no terminal do Streamlit
+            pass
+
+    with _trava_exportacao:
+        if _servidor_metricas is None:
+            try:
+                _servidor_metricas = ThreadingHTTPServer(("", int(porta)), Requisicao)
+            except OSError as erro: #Outro processo (ou worker) já usa a porta
+                warnings.warn(f"Servidor de métricas não iniciado na porta {porta}: {erro}")
+                _servidor_metricas = False
+            else:
+                threading.Thread(target=_servidor_metricas.serve_forever, daemon=True).start()
+    return _servidor_metricas or None
+
+
+def medir_pagina(pagina):
+    """
+    Mede a duração de uma execução (rerun) da página a partir de uma única chamada no início do script.
+    O fim da execução é registrado pelo sinal de término do ScriptRunner do Streamlit, emitido também
+    quando a execução é interrompida por st.stop(), por uma exceção ou por um novo rerun, e as métricas
+    são exportadas nesse momento (respeitando INTERVALO_EXPORTACAO).
+    Fora de uma execução do Streamlit (sem ScriptRunner na thread atual) nada é medido.
+    Parâmetros: pagina (str): Nome da página (rótulo "pagina" do histograma).
+    """
+    if not INSTRUMENTACAO_ATIVA:
+        return
+    if PORTA_METRICAS:
+        iniciar_servidor_metricas(PORTA_METRICAS)
+    executor = getattr(getattr(threading.current_thread(), "_target", None), "__self__", None) #ScriptRunner da sessão
+    if not hasattr(executor, "on_event"):
+        return
+    _execucao_pagina.atual = (pagina, time.perf_counter())
+    executor.on_event.connect(_fim_execucao_pagina) #Conexão idempotente (o blinker ignora receptores repetidos)
+
+
+def _fim_execucao_pagina(executor, event=None, **dados):
+    """Receptor dos eventos do ScriptRunner: registra a duração da página quando a execução termina."""
+    atual = getattr(_execucao_pagina, "atual", None)
+    if atual is None or event is None or not event.name.startswith("SCRIPT_STOPPED"):
+        return
+    _execucao_pagina.atual = None
+    pagina, inicio = atual
+    METRICAS.observar("pharma_pagina_duracao_segundos", (("pagina", pagina),), time.perf_counter() - inicio)
+    exportar_metricas()
+
+
+_execucao_pagina = threading.local() #Página e início da execução em andamento (cada sessão roda na sua thread)
 
 
 #================================================================================
 #Função para cache de dados
 @cache_data
-def load_data(path):
+def load_data(path, columns=None):
     """
-    Função para carregar os dados do arquivo CSV e armazená-los em cache.
-    Parâmetros: path (str): Caminho do arquivo CSV.
+    Função para carregar os dados do arquivo e armazená-los em cache.
+    Parâmetros: path (str): Caminho do arquivo CSV (ou .parquet/.feather).
+    columns (list): Colunas a serem carregadas (se omitido, todas as colunas são carregadas).
     Retorno: data (DataFrame): DataFrame com os dados carregados.
     """
-    data = pd.read_csv(path)
+    return ler_dados(path, columns)
+
+
+def ler_dados(path, columns=None):
+    """
+    Lê o arquivo de dados sem cache.
+    Se existir uma versão colunar (Feather ou Parquet) do CSV tão recente quanto ele,
+    a versão colunar é lida com mapeamento em memória e apenas as colunas pedidas.
+    Parâmetros: path (str): Caminho do arquivo CSV (ou .parquet/.feather).
+    columns (list): Colunas a serem carregadas (se omitido, todas as colunas são carregadas).
+    Retorno: data (DataFrame): DataFrame com os dados carregados.
+    """
+    caminho = caminho_colunar(path)
+    if caminho.endswith(".feather"):
+        data = feather.read_table(caminho, columns=columns, memory_map=True).to_pandas()
+    elif caminho.endswith(".parquet"):
+        data = pq.read_table(caminho, columns=columns, memory_map=True).to_pandas()
+    else:
+        data = pd.read_csv(path, usecols=columns)
     return data
 
 #================================================================================
 
+#Armazenamento colunar dos conjuntos de dados (Parquet/Feather)
+COLUNAS_INTEIRAS = ["n_effects", "n_substitutes", "dosage"]
+COLUNAS_CATEGORIAS = ["Therapeutic Class", "Action Class", "Chemical Class", "Habit Forming", "use0"]
+PREFIXOS_CATEGORIAS = ("substitute", "sideEffect")
+
+
+def caminho_colunar(path):
+    """
+    Localiza a versão colunar de um arquivo CSV (mesmo nome, extensão .feather ou .parquet).
+    A versão colunar só é usada se for tão recente quanto o CSV.
+    Parâmetros: path (str): Caminho do arquivo.
+    Retorno: caminho (str): Caminho do arquivo que deve ser lido.
+    """
+    base, extensao = os.path.splitext(path)
+    if extensao != ".csv":
+        return path
+    for alternativo in (base + ".feather", base + ".parquet"):
+        if os.path.exists(alternativo) and (not os.path.exists(path) or os.path.getmtime(alternativo) >= os.path.getmtime(path)):
+            return alternativo
+    return path
+
+
+def tipar_colunas(df):
+    """
+    Converte as colunas para tipos compactos: categorias codificadas em dicionário
+    (classes, indicações, substitutos e efeitos colaterais) e inteiros estreitos para as contagens e a dosagem.
+    Parâmetros: df (DataFrame): O conjunto de dados de entrada.
+    Retorno: df (DataFrame): O conjunto de dados com os tipos convertidos.
+    """
+    df = df.copy()
+    for coluna in df.columns:
+        if coluna in COLUNAS_INTEIRAS:
+            df[coluna] = pd.to_numeric(df[coluna], downcast="integer")
+        elif coluna in COLUNAS_CATEGORIAS or coluna.startswith(PREFIXOS_CATEGORIAS):
+            df[coluna] = df[coluna].astype("category")
+    return df
+
+
+def converter_para_colunar(path, formato="parquet"):
+    """
+    Converte um arquivo CSV para Parquet (ou Feather) ao lado do original, com os tipos compactos de tipar_colunas.
+    O Feather é gravado sem compressão para permitir leitura sem cópia por mapeamento em memória.
+    Parâmetros: path (str): Caminho do arquivo CSV.
+    formato (str): "parquet" ou "feather".
+    Retorno: destino (str): Caminho do arquivo gerado.
+    """
+    data = tipar_colunas(pd.read_csv(path))
+    destino = os.path.splitext(path)[0] + "." + formato
+    if formato == "feather":
+        data.to_feather(destino, compression="uncompressed")
+    elif formato == "parquet":
+        data.to_parquet(destino, engine="pyarrow", index=False)
+    else:
+        raise ValueError(f"Formato '{formato}' não suportado. Utilize 'parquet' ou 'feather'.")
+    return destino
+
+#================================================================================
+#================================================================================
+
+#Conjunto de dados compartilhado (somente leitura) entre as sessões
+class ConjuntoDados:
+    """
+    Conjunto de dados imutável, mantido como tabela Arrow e compartilhado por todas as sessões do processo.
+    As colunas são convertidas para pandas uma única vez (e marcadas como somente leitura),
+    e as páginas recebem apenas as linhas que precisam, em vez de uma cópia do DataFrame inteiro.
+    Parâmetros:
+      tabela (pyarrow.Table): Dados carregados.
+      versao (str): Assinatura dos arquivos de origem, usada como chave dos caches.
+    """
+
+    def __init__(self, tabela, versao):
+        self.tabela = tabela
+        self.versao = versao
+        self.columns = tabela.column_names
+        self._colunas = {}
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return self.tabela.num_rows
+
+    def __getitem__(self, chave):
+        """Coluna (se a chave for um nome) ou linhas selecionadas (máscara booleana ou posições)."""
+        if isinstance(chave, str):
+            return self.coluna(chave)
+        return self.linhas(chave)
+
+    def coluna(self, nome):
+        """Retorna a coluna como Series somente leitura, convertida uma única vez por processo."""
+        with self._trava:
+            if nome not in self._colunas:
+                serie = self.tabela.column(nome).to_pandas().rename(nome)
+                if isinstance(serie.dtype, np.dtype):
+                    serie.to_numpy().flags.writeable = False
+                self._colunas[nome] = serie
+            return self._colunas[nome]
+
+    def linhas(self, posicoes, colunas=None):
+        """
+        Seleciona algumas linhas do conjunto de dados sem copiar o restante.
+        Parâmetros: posicoes (array): Posições das linhas (ou máscara booleana).
+        colunas (list): Colunas desejadas (se omitido, todas as colunas).
+        Retorno: dados (DataFrame): Novo DataFrame apenas com as linhas selecionadas.
+        """
+        posicoes = np.asarray(posicoes)
+        if posicoes.dtype == bool:
+            posicoes = np.flatnonzero(posicoes)
+        tabela = self.tabela if colunas is None else self.tabela.select(colunas)
+        return tabela.take(pa.array(posicoes, type=pa.int64())).to_pandas()
+
+
+@cache_resource(max_entries=8, show_spinner=False)
+def _carregar_conjunto(path, versao):
+    """Lê o arquivo uma única vez para cada versão em disco."""
+    caminho = caminho_colunar(path)
+    if caminho.endswith(".feather"):
+        tabela = feather.read_table(caminho, memory_map=True)
+    elif caminho.endswith(".parquet"):
+        tabela = pq.read_table(caminho, memory_map=True)
+    else:
+        tabela = pa.Table.from_pandas(tipar_colunas(pd.read_csv(path)), preserve_index=False)
+    return ConjuntoDados(tabela, versao)
+
+
+@instrumentar
+def carregar_conjunto(path):
+    """
+    Retorna o conjunto de dados compartilhado do arquivo (CSV ou sua versão colunar).
+    É recarregado automaticamente quando o arquivo em disco é alterado.
+    Parâmetros: path (str): Caminho do arquivo CSV.
+    Retorno: conjunto (ConjuntoDados): Conjunto de dados somente leitura.
+    """
+    return _carregar_conjunto(path, assinatura_arquivos([path, caminho_colunar(path)]))
+
+
+HASH_CONJUNTO = {ConjuntoDados: lambda conjunto: conjunto.versao} #Caches indexados pela versão, sem serializar os dados
+
+#================================================================================
+
+#Tabela unida de medicamentos e efeitos colaterais
+ARQUIVO_TABELA = "medicamentos_completo.parquet"
+COLUNAS_TABELA = ["name"] + [f"substitute{i}" for i in range(5)] + ["n_substitutes", "use0", "n_effects", "dosage", "Therapeutic Class"]
+CHAVE_METADADOS = b"pharma_insights"
+
+
+def checksum_nomes(nomes):
+    """
+    Calcula um checksum da coluna de nomes, sensível à ordem das linhas.
+    Parâmetros: nomes (Series): Coluna "name".
+    Retorno: checksum (str): Hash hexadecimal.
+    """
+    hashes = pd.util.hash_pandas_object(nomes.astype(str), index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def unir_medicamentos_efeitos(medicamentos, efeitos):
+    """
+    Une os medicamentos (substitutos e uso) às contagens de efeitos colaterais em uma única tabela.
+    Se os efeitos possuem a coluna "name", a união é feita pela chave; caso contrário (arquivos antigos),
+    a união é posicional e exige que os dois conjuntos tenham a mesma quantidade de linhas.
+    Parâmetros:
+      medicamentos (DataFrame): Conteúdo de medicamentos.csv.
+      efeitos (DataFrame): Conteúdo de effects.csv.
+    Retorno: tabela (pyarrow.Table): Tabela tipada, com a quantidade de linhas e o checksum dos nomes nos metadados.
+    """
+    colunas_efeitos = [coluna for coluna in ["n_effects", "Therapeutic Class"] if coluna in efeitos.columns]
+    if "name" in efeitos.columns:
+        unida = medicamentos.merge(efeitos[["name"] + colunas_efeitos], on="name", how="left", validate="one_to_one")
+    elif len(medicamentos) == len(efeitos):
+        unida = pd.concat((medicamentos.reset_index(drop=True), efeitos[colunas_efeitos].reset_index(drop=True)), axis=1)
+    else:
+        raise ValueError(f"Medicamentos ({len(medicamentos)} linhas) e efeitos ({len(efeitos)} linhas) não estão alinhados "
+                         "e os efeitos não possuem a coluna 'name' para a união por chave.")
+
+    if "dosage" not in unida.columns:
+        unida["dosage"] = extrair_dosagem(unida["name"])
+    unida = tipar_colunas(unida[[coluna for coluna in COLUNAS_TABELA if coluna in unida.columns]])
+
+    tabela = pa.Table.from_pandas(unida, preserve_index=False)
+    metadados = {"linhas": len(unida), "checksum": checksum_nomes(unida["name"])}
+    return tabela.replace_schema_metadata({**(tabela.schema.metadata or {}), CHAVE_METADADOS: json.dumps(metadados).encode()})
+
+
+def verificar_tabela(tabela):
+    """
+    Confere a quantidade de linhas e o checksum dos nomes gravados na construção da tabela unida.
+    Parâmetros: tabela (pyarrow.Table): Tabela gerada por unir_medicamentos_efeitos.
+    Retorno: Nenhum. Gera ValueError caso a tabela esteja desalinhada ou corrompida.
+    """
+    metadados = (tabela.schema.metadata or {}).get(CHAVE_METADADOS)
+    if metadados is None:
+        raise ValueError("A tabela de medicamentos não possui os metadados de verificação. Gere a tabela novamente.")
+    metadados = json.loads(metadados)
+    if tabela.num_rows != metadados["linhas"]:
+        raise ValueError(f"A tabela de medicamentos possui {tabela.num_rows} linhas, mas foram gravadas {metadados['linhas']}.")
+    if checksum_nomes(tabela.column("name").to_pandas()) != metadados["checksum"]:
+        raise ValueError("O checksum dos nomes não confere: a tabela de medicamentos está desalinhada. Gere a tabela novamente.")
+
+
+def construir_tabela_medicamentos(medicamentos="medicamentos.csv", efeitos="effects.csv", destino=ARQUIVO_TABELA):
+    """
+    Etapa de construção da tabela unida de medicamentos, gravada em Parquet.
+    Parâmetros: medicamentos (str), efeitos (str): Caminhos dos arquivos de origem.
+    destino (str): Caminho do arquivo Parquet gerado.
+    Retorno: destino (str): Caminho do arquivo gerado.
+    """
+    tabela = unir_medicamentos_efeitos(ler_dados(medicamentos), ler_dados(efeitos))
+    pq.write_table(tabela, destino)
+    return destino
+
+
+@cache_resource(max_entries=2, show_spinner=False)
+def _carregar_tabela_medicamentos(path, medicamentos, efeitos, versao):
+    """Lê (ou monta em memória, se estiver ausente ou desatualizada) e verifica a tabela uma única vez por versão."""
+    origens = [arquivo for arquivo in (medicamentos, efeitos) if os.path.exists(arquivo)]
+    atualizada = os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(arquivo) for arquivo in origens)
+    if atualizada:
+        tabela = pq.read_table(path, memory_map=True)
+    else:
+        tabela = unir_medicamentos_efeitos(ler_dados(medicamentos), ler_dados(efeitos))
+    verificar_tabela(tabela)
+    return ConjuntoDados(tabela, versao)
+
+
+@instrumentar
+def carregar_tabela_medicamentos(path=ARQUIVO_TABELA, medicamentos="medicamentos.csv", efeitos="effects.csv"):
+    """
+    Retorna a tabela unida de medicamentos (substitutos, uso, n_substitutes, n_effects e dosagem),
+    compartilhada entre as sessões e verificada uma única vez por versão.
+    Parâmetros: path (str): Caminho da tabela gerada por construir_tabela_medicamentos.
+    medicamentos (str), efeitos (str): Arquivos de origem, usados se a tabela estiver ausente ou desatualizada.
+    Retorno: conjunto (ConjuntoDados): Tabela unida somente leitura.
+    """
+    return _carregar_tabela_medicamentos(path, medicamentos, efeitos, assinatura_arquivos([path, medicamentos, efeitos]))
+
+#================================================================================
+
+#Pacote de artefatos do modelo (encoders, scaler, modelo e acurácia)
+CATEGORICAS = ["Action Class", "Chemical Class", "Habit Forming", "Therapeutic Class", "use0"]
+COLUNAS_MODELO = CATEGORICAS + ["dosage"] #Ordem das features usada no treinamento do modelo
+VERSAO_PACOTE = 4 #Deve ser incrementada sempre que a estrutura do pacote for alterada
+ARQUIVO_LIMITADOR = "limitador_categorias.joblib"
+ARQUIVO_PACOTE = "artefatos.joblib"
+ARQUIVO_AVALIACAO = "avaliacao_modelo.json" #Métricas da seleção de modelos (selecao_modelos.py)
+
+
+def arquivos_artefatos(diretorio="objects"):
+    """
+    Lista os arquivos individuais gerados no notebook de modelagem.
+    Parâmetros: diretorio (str): Pasta onde os artefatos foram salvos.
+    Retorno: arquivos (list): Caminhos dos encoders, do limitador de categorias, do scaler, do modelo, da floresta compacta, da acurácia
+      e da avaliação da seleção de modelos.
+    """
+    arquivos = [os.path.join(diretorio, f"encoder_{coluna}.joblib") for coluna in CATEGORICAS]
+    arquivos += [os.path.join(diretorio, ARQUIVO_LIMITADOR),
+                 os.path.join(diretorio, "scaler.joblib"),
+                 os.path.join(diretorio, "best_model.joblib"),
+                 os.path.join(diretorio, DIRETORIO_FLORESTA, "metadados.json"),
+                 os.path.join(diretorio, "cross_val.npy"),
+                 os.path.join(diretorio, ARQUIVO_AVALIACAO)]
+    return arquivos
+
+
+def assinatura_arquivos(caminhos):
+    """
+    Gera uma assinatura curta a partir do tamanho e da data de modificação dos arquivos.
+    Funciona como número de versão dos dados em disco: qualquer alteração gera uma nova assinatura.
+    Parâmetros: caminhos (list): Caminhos dos arquivos (arquivos inexistentes também entram na assinatura).
+    Retorno: assinatura (str): Hash hexadecimal com 16 caracteres.
+    """
+    hash_arquivos = hashlib.sha1()
+    for caminho in caminhos:
+        try:
+            info = os.stat(caminho)
+            hash_arquivos.update(f"{caminho}:{info.st_size}:{info.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            hash_arquivos.update(f"{caminho}:ausente;".encode())
+    return hash_arquivos.hexdigest()[:16]
+
+
+def _ler_artefatos_individuais(diretorio):
+    """Lê os artefatos salvos separadamente e os organiza no formato do pacote."""
+    encoders = {coluna: load(os.path.join(diretorio, f"encoder_{coluna}.joblib")) for coluna in CATEGORICAS}
+    caminho_limitador = os.path.join(diretorio, ARQUIVO_LIMITADOR)
+    if os.path.exists(caminho_limitador):
+        limitador = load(caminho_limitador)
+    else: #Artefatos gerados antes do limitador: as categorias mantidas são as classes dos encoders
+        limitador = LimitadorCategorias.a_partir_dos_encoders(encoders)
+    modelo = load(os.path.join(diretorio, "best_model.joblib"), mmap_mode="r")
+    caminho_floresta = os.path.join(diretorio, DIRETORIO_FLORESTA)
+    metadados_floresta = os.path.join(caminho_floresta, "metadados.json")
+    if not FlorestaCompacta.suporta(modelo): #Modelo vencedor da seleção que não é uma floresta do sklearn
+        floresta = ModeloDireto(modelo)
+    elif os.path.exists(metadados_floresta) and os.path.getmtime(metadados_floresta) >= os.path.getmtime(os.path.join(diretorio, "best_model.joblib")):
+        floresta = FlorestaCompacta.carregar(caminho_floresta)
+    else: #Floresta ainda não exportada (ou mais antiga que o modelo): exportada em memória
+        floresta = FlorestaCompacta.exportar(modelo, dominios_encoders(encoders))
+    caminho_avaliacao = os.path.join(diretorio, ARQUIVO_AVALIACAO)
+    avaliacao = None
+    if os.path.exists(caminho_avaliacao) and os.path.getmtime(caminho_avaliacao) >= os.path.getmtime(os.path.join(diretorio, "best_model.joblib")):
+        with open(caminho_avaliacao, encoding="utf-8") as arquivo:
+            avaliacao = json.load(arquivo)
+    return {
+        "versao_pacote": VERSAO_PACOTE,
+        "colunas": list(COLUNAS_MODELO),
+        "encoders": encoders,
+        "limitador": limitador,
+        "scaler": load(os.path.join(diretorio, "scaler.joblib")),
+        "modelo": modelo,
+        "floresta": floresta,
+        "cross_val": float(np.load(os.path.join(diretorio, "cross_val.npy"), allow_pickle=True).item()),
+        "avaliacao": avaliacao, #None para modelos treinados fora da seleção de modelos (apenas cross_val)
+    }
+
+
+def montar_pacote_artefatos(diretorio="objects"):
+    """
+    Reúne encoders, scaler, modelo, acurácia e ordem das features em um único arquivo versionado.
+    O arquivo é salvo sem compressão para que os arrays numpy possam ser mapeados em memória
+    e compartilhados entre os processos do servidor.
+    Parâmetros: diretorio (str): Pasta onde os artefatos individuais foram salvos.
+    Retorno: destino (str): Caminho do pacote gerado.
+    """
+    pacote = _ler_artefatos_individuais(diretorio)
+    destino = os.path.join(diretorio, ARQUIVO_PACOTE)
+    dump(pacote, destino)
+    return destino
+
+
+@cache_resource(max_entries=1, show_spinner=False)
+def _carregar_artefatos(diretorio, versao):
+    """Carrega o pacote (ou os arquivos individuais, caso o pacote esteja desatualizado) uma única vez por versão."""
+    caminho_pacote = os.path.join(diretorio, ARQUIVO_PACOTE)
+    individuais = [arquivo for arquivo in arquivos_artefatos(diretorio) if os.path.exists(arquivo)]
+    pacote_atualizado = os.path.exists(caminho_pacote) and all(
+        os.path.getmtime(caminho_pacote) >= os.path.getmtime(arquivo) for arquivo in individuais)
+
+    if pacote_atualizado:
+        pacote = load(caminho_pacote, mmap_mode="r")
+        if pacote.get("versao_pacote") != VERSAO_PACOTE:
+            raise ValueError(f"O pacote '{caminho_pacote}' foi gerado na versão {pacote.get('versao_pacote')}, "
+                             f"mas a versão esperada é {VERSAO_PACOTE}. Gere o pacote novamente.")
+    else:
+        pacote = _ler_artefatos_individuais(diretorio)
+    pacote["versao"] = versao
+    return pacote
+
+
+@instrumentar
+def carregar_artefatos(diretorio="objects"):
+    """
+    Retorna o pacote de artefatos do modelo compartilhado por todas as sessões do processo.
+    O pacote é recarregado automaticamente quando algum arquivo em disco é alterado.
+    Parâmetros: diretorio (str): Pasta dos artefatos.
+    Retorno: pacote (dict): Dicionário com "encoders", "limitador", "scaler", "modelo", "floresta", "cross_val", "avaliacao",
+      "colunas" e "versao".
+    """
+    versao = assinatura_arquivos(arquivos_artefatos(diretorio) + [os.path.join(diretorio, ARQUIVO_PACOTE)])
+    return _carregar_artefatos(diretorio, versao)
+
+#================================================================================
+
 #Gráficos de Barras para Análise Exploratória
-def plot_barras(df, color, maiores):
+def agregar_colunas(df, maiores):
+    """
+    Calcula, em uma única passagem pelas colunas categóricas, os valores mais frequentes de cada uma.
+    Parâmetros:
+      df (DataFrame): O conjunto de dados de entrada.
+      maiores (int): Quantidade de itens com maior valor a serem selecionados por coluna.
+    Retorno (dict): Series com as maiores contagens de cada coluna categórica."""
+    return {col: df[col].value_counts().nlargest(maiores)
+            for col in df.columns if df[col].dtype == "object" or isinstance(df[col].dtype, pd.CategoricalDtype)}
+
+
+def figura_barras(col, agrupado, color, maiores):
+    """Gráfico de Barras de uma coluna, com estilização dinâmica, a partir das contagens já agregadas.
+    
+    Parâmetros:
+      col (str): Nome da coluna.
+      agrupado (Series): Contagens dos maiores valores da coluna.
+      color (str): Nome da cor para plotagem do gráfico
+      maiores (int): Quantidade de itens selecionados (usada no título).
+    
+    Retorno (fig): Figura do Matplotlib """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Configurar o estilo do gráfico
+    sns.set_style(style="dark")
+
+    # Configurar a paleta de cores
+    colors = sns.color_palette(str(color), len(agrupado))
+
+    # Criar o gráfico
+    fig, ax = plt.subplots()
+    bars = ax.bar(agrupado.index.astype(str), agrupado.values, color=colors)
+
+    # Adicionar rótulos nas barras
+    for bar in bars:
+        height = bar.get_height()
+        ax.annotate('{}'.format(height),
+                    xy=(bar.get_x() + bar.get_width() / 2, height),
+                    xytext=(0, 3),  # 3 pontos de deslocamento
+                    textcoords="offset points",
+                    ha='center', va='bottom')
+
+    # Personalizar os eixos e o título
+    ax.set_ylabel(f'Frequência de {col}', fontsize=10, fontweight="bold")
+    ax.set_xlabel(f'Valores de {col}', fontsize=10, fontweight="bold")
+    ax.set_title(f'Visualização dos {maiores} maiores valores de {col}', fontsize=15, fontweight='bold')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+
+    # Remover as bordas desnecessárias e ajustar layout
+    sns.despine(ax=ax, left=True, bottom=True)
+    fig.tight_layout()
+    return fig
+
+
+def plot_barras(df, color, maiores, mostrar=True):
     """Gráfico de Barras com estilização dinâmica e seleção de
      maiores valores para serem exibidos na análise exploratória.
     (Para conjuntos de dados complexos, com muitos valores únicos)
@@ -41,65 +804,320 @@ def plot_barras(df, color, maiores):
       df (DataFrame): O conjunto de dados de entrada.
       color (str): Nome da cor para plotagem do gráfico
     maiores (int): Quantidade de itens com maior valor a serem selecionados por coluna.
+    mostrar (bool): Se True, exibe cada figura (plt.show); use False para execução sem interface.
     
-    Retorno (fig): Figura do Plotly """
-    
-    # Configurar o estilo do gráfico
-    sns.set_style(style="dark")
+    Retorno (list): Figuras do Matplotlib, uma por coluna categórica """
+    import matplotlib.pyplot as plt
 
-    for col in df.columns:
-        if df[col].dtype == "object":
-            agrupado = df[col].value_counts().nlargest(maiores)
-
-            # Configurar a paleta de cores
-            colors = sns.color_palette(str(color), len(agrupado))
-
-            # Criar o gráfico
-            fig, ax = plt.subplots()
-            bars = ax.bar(agrupado.index, agrupado.values, color=colors)
-
-            # Adicionar rótulos nas barras
-            for bar in bars:
-                height = bar.get_height()
-                ax.annotate('{}'.format(height),
-                            xy=(bar.get_x() + bar.get_width() / 2, height),
-                            xytext=(0, 3),  # 3 pontos de deslocamento
-                            textcoords="offset points",
-                            ha='center', va='bottom')
-
-            # Personalizar os eixos e o título
-            ax.set_ylabel(f'Frequência de {col}', fontsize=10, fontweight="bold")
-            ax.set_xlabel(f'Valores de {col}', fontsize=10, fontweight="bold")
-            ax.set_title(f'Visualização dos {maiores} maiores valores de {col}', fontsize=15, fontweight='bold')
-            plt.xticks(rotation=45, ha='right')
-
-            # Remover as bordas desnecessárias e ajustar layout
-            sns.despine(left=True, bottom=True)
-            plt.tight_layout()
+    figuras = []
+    for col, agrupado in agregar_colunas(df, maiores).items():
+        fig = figura_barras(col, agrupado, color, maiores)
+        if mostrar:
             plt.show()
+        figuras.append(fig)
             
-    return fig
+    return figuras
+
+
+def _iniciar_processo_relatorio():
+    """Usa o backend sem interface do Matplotlib nos processos do relatório."""
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _renderizar_barras(col, agrupado, color, maiores, caminho):
+    """Renderiza e grava o gráfico de uma coluna (executado nos processos do relatório)."""
+    import matplotlib.pyplot as plt
+
+    inicio = time.perf_counter()
+    fig = figura_barras(col, agrupado, color, maiores)
+    fig.savefig(caminho, dpi=100)
+    plt.close(fig)
+    return col, time.perf_counter() - inicio
+
+
+def gerar_relatorio_eda(df, destino, color="Blues_r", maiores=15, processos=None):
+    """
+    Gera um relatório estático (HTML + PNG) com os gráficos de barras de todas as colunas categóricas.
+    As contagens são calculadas uma única vez e os gráficos são renderizados em paralelo.
+    Parâmetros:
+      df (DataFrame): O conjunto de dados de entrada.
+      destino (str): Pasta do relatório (index.html, imagens e tempos.json).
+      color (str): Nome da paleta de cores dos gráficos.
+      maiores (int): Quantidade de itens com maior valor por coluna.
+      processos (int): Quantidade de processos (se omitido, um por núcleo).
+    Retorno (dict): Tempo (em segundos) de renderização de cada gráfico e do relatório completo.
+    """
+    inicio = time.perf_counter()
+    os.makedirs(destino, exist_ok=True)
+    agregados = agregar_colunas(df, maiores)
+    tempo_agregacao = time.perf_counter() - inicio
+    arquivos = {col: "{:02d}_{}.png".format(indice, re.sub(r"[^\w]+", "_", col).strip("_"))
+                for indice, col in enumerate(agregados)}
+
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo_relatorio) as executor:
+        tarefas = [executor.submit(_renderizar_barras, col, agrupado, color, maiores, os.path.join(destino, arquivos[col]))
+                   for col, agrupado in agregados.items()]
+        tempos = dict(tarefa.result() for tarefa in tarefas)
+
+    relatorio = {"agregacao": tempo_agregacao, "figuras": tempos, "total": time.perf_counter() - inicio}
+    linhas = "\n".join(f"<tr><td>{html.escape(col)}</td><td>{tempo * 1000:.0f} ms</td></tr>" for col, tempo in tempos.items())
+    imagens = "\n".join(f"<h2>{html.escape(col)}</h2><img src='{arquivo}'>" for col, arquivo in arquivos.items())
+    with open(os.path.join(destino, "index.html"), "w", encoding="utf-8") as pagina:
+        pagina.write(f"<html><head><meta charset='utf-8'><title>Análise Exploratória</title></head><body>"
+                     f"<h1>Análise Exploratória ({len(df):,} linhas)</h1>"
+                     f"<p>Agregação: {tempo_agregacao * 1000:.0f} ms | Total: {relatorio['total']:.1f} s</p>"
+                     f"<table><tr><th>Coluna</th><th>Renderização</th></tr>{linhas}</table>{imagens}</body></html>")
+    with open(os.path.join(destino, "tempos.json"), "w", encoding="utf-8") as arquivo_tempos:
+        json.dump(relatorio, arquivo_tempos, indent=2, ensure_ascii=False)
+    return relatorio
 
 #===============================================================================================================
 
 
-@cache_resource
-def load_and_process_data(data, medicamento):
-    """Função para filtrar os dados de acordo com o medicamento inserido.
+#Extração das dosagens a partir dos nomes dos medicamentos
+def extrair_dosagem(nomes):
+    """
+    Extrai a dosagem (primeiro número do nome) de cada medicamento, uma única vez na construção do conjunto de dados.
+    Medicamentos sem uma dosagem específica recebem 0.
+    Parâmetros: nomes (Series): Coluna "name" do conjunto de dados.
+    Retorno: dosagens (Series): Dosagens no menor tipo inteiro capaz de representá-las.
+    """
+    dosagens = pd.to_numeric(nomes.str.extract(r"(\d+)")[0], errors="coerce").fillna(0)
+    return pd.to_numeric(dosagens.astype(np.int64), downcast="integer").rename("dosage")
+
+
+#Índice dos nomes (e das dosagens) dos medicamentos
+class IndiceNomes:
+    """
+    Índice dos medicamentos pelo primeiro nome (a "família" do medicamento) e pela dosagem, construído uma única vez.
+    As posições das linhas ficam agrupadas por família em ordem alfabética (e por dosagem dentro de cada família),
+    então a busca por prefixo é resolvida com duas buscas binárias e uma fatia contígua do array de posições,
+    e cada par (família, dosagem) corresponde a um grupo pré-calculado.
     Parâmetros:
-      data (DataFrame): O conjunto de dados de entrada.
+      nomes (Series): Coluna "name" do conjunto de dados.
+      dosagens (Series): Coluna "dosage" já extraída (se omitida, é extraída dos nomes na construção).
+    """
+
+    def __init__(self, nomes, dosagens=None):
+        if dosagens is None:
+            dosagens = extrair_dosagem(nomes)
+        self.nomes = nomes.to_numpy(dtype=object)
+        primeiros_nomes = nomes.str.split(" ").str[0] #Única separação dos nomes, feita na construção do índice
+        codigos, familias = pd.factorize(primeiros_nomes, sort=True)
+        dosagens = np.asarray(dosagens)
+        self.familias = np.asarray(familias, dtype=object) #Famílias ordenadas para as buscas por prefixo
+        self.posicoes = np.lexsort((dosagens, codigos)) #Posições das linhas agrupadas por família e dosagem
+        codigos_ordenados = codigos[self.posicoes]
+        dosagens_ordenadas = dosagens[self.posicoes]
+        self.inicios = np.searchsorted(codigos_ordenados, np.arange(len(self.familias) + 1)) #Início de cada família
+
+        # Grupos (família, dosagem): início de cada grupo no array de posições
+        mudancas = (np.diff(codigos_ordenados) != 0) | (np.diff(dosagens_ordenadas) != 0)
+        self.grupos_inicio = np.r_[0, np.flatnonzero(mudancas) + 1, len(self.posicoes)]
+        self.grupos_familia = codigos_ordenados[self.grupos_inicio[:-1]]
+        self.grupos_dosagem = dosagens_ordenadas[self.grupos_inicio[:-1]]
+
+    def _intervalo(self, prefixo):
+        """Intervalo [inicio, fim) das famílias que começam com o prefixo informado."""
+        inicio = np.searchsorted(self.familias, prefixo, side="left")
+        fim = np.searchsorted(self.familias, prefixo + "\U0010ffff", side="left")
+        return inicio, fim
+
+    def _intervalos(self, texto):
+        """
+        Intervalos [inicio, fim) das famílias encontradas para o texto: as que começam com ele (uma única fatia)
+        ou, quando nenhuma começa, as que o contêm em qualquer posição (a busca original com str.contains,
+        que diferencia maiúsculas e minúsculas), percorrendo apenas as famílias e não as linhas.
+        Retorno: intervalos (list): Pares (inicio, fim) em ordem crescente.
+        """
+        inicio, fim = self._intervalo(texto)
+        if fim > inicio:
+            return [(inicio, fim)]
+        return [(codigo, codigo + 1) for codigo in np.flatnonzero([texto in familia for familia in self.familias])]
+
+    def _grupos(self, familia):
+        """Intervalos [inicio, fim) dos grupos (família, dosagem) das famílias encontradas para o texto."""
+        return [tuple(np.searchsorted(self.grupos_familia, intervalo, side="left")) for intervalo in self._intervalos(familia)]
+
+    def buscar(self, medicamento):
+        """
+        Localiza os medicamentos cujo nome começa com o texto informado (ou, se nenhum começa, que o contêm).
+        Parâmetros: medicamento (str): Nome (ou parte do nome) do medicamento.
+        Retorno: posicoes (array): Posições das linhas encontradas, em ordem crescente.
+        """
+        medicamento = str(medicamento).strip()
+        partes = medicamento.split(" ")
+        intervalos = self._intervalos(partes[0])
+        fatias = [self.posicoes[self.inicios[inicio]:self.inicios[fim]] for inicio, fim in intervalos]
+        posicoes = np.concatenate(fatias) if fatias else np.empty(0, dtype=np.int64)
+        if len(partes) > 1: #O restante do nome é conferido apenas nas linhas das famílias encontradas
+            inicio, fim = self._intervalo(partes[0])
+            conferir = str.startswith if fim > inicio else str.__contains__ #Mesmo critério usado para as famílias
+            posicoes = posicoes[np.array([conferir(nome, medicamento) for nome in self.nomes[posicoes]], dtype=bool)]
+        return np.sort(posicoes)
+
+    def existe(self, medicamento):
+        """Verifica se existe algum medicamento cujo nome começa com o texto informado (ou o contém)."""
+        medicamento = str(medicamento).strip()
+        if " " not in medicamento:
+            return len(self._intervalos(medicamento)) > 0
+        return len(self.buscar(medicamento)) > 0
+
+    def dosagens(self, familia):
+        """Dosagens disponíveis (ordenadas e sem repetição) para as famílias encontradas para o texto informado."""
+        fatias = [self.grupos_dosagem[inicio:fim] for inicio, fim in self._grupos(str(familia).strip())]
+        return np.unique(np.concatenate(fatias)) if fatias else np.unique(self.grupos_dosagem[:0])
+
+    def buscar_dosagem(self, familia, dosagem):
+        """Posições (em ordem crescente) das linhas das famílias informadas que possuem a dosagem informada."""
+        fatias = [self.posicoes[self.grupos_inicio[grupo]:self.grupos_inicio[grupo + 1]]
+                  for inicio, fim in self._grupos(str(familia).strip())
+                  for grupo in inicio + np.flatnonzero(self.grupos_dosagem[inicio:fim] == dosagem)]
+        return np.sort(np.concatenate(fatias)) if fatias else np.empty(0, dtype=np.int64)
+
+
+@cache_resource(max_entries=4, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def obter_indice_nomes(conjunto):
+    """
+    Retorna o índice de nomes do conjunto de dados, compartilhado entre as sessões e reconstruído
+    apenas quando uma nova versão do conjunto é carregada.
+    Parâmetros: conjunto (ConjuntoDados): Conjunto com a coluna "name" (e, opcionalmente, "dosage").
+    Retorno: indice (IndiceNomes): Índice dos nomes e dosagens do conjunto.
+    """
+    dosagens = conjunto["dosage"] if "dosage" in conjunto.columns else None
+    return IndiceNomes(conjunto["name"], dosagens)
+
+
+#Índice de trigramas para sugestões de nomes ("você quis dizer")
+class IndiceTrigramas:
+    """
+    Índice invertido de trigramas de caracteres das famílias de medicamentos (primeiro nome, sem diferenciar maiúsculas),
+    construído uma única vez e usado quando o texto digitado não corresponde a nenhum medicamento.
+    Cada trigrama aponta para as famílias que o contêm (arrays contíguos, como em uma matriz CSR), então uma sugestão
+    soma apenas as listas dos trigramas do texto digitado, sem percorrer os nomes do conjunto.
+    A similaridade é a de Jaccard entre os trigramas (com o nome completado por espaços, como no pg_trgm do PostgreSQL),
+    e o empate é decidido pela quantidade de medicamentos da família.
+    Parâmetros: nomes (Series): Coluna "name" do conjunto de dados.
+    """
+
+    BLOCO = 65536 #Famílias convertidas em trigramas por vez na construção (limita a memória da matriz de caracteres)
+
+    def __init__(self, nomes):
+        primeiros_nomes = nomes.astype(object).str.split(" ").str[0].fillna("")
+        contagens = primeiros_nomes.value_counts()
+        contagens = contagens[contagens.index != ""]
+        # Famílias que diferem apenas nas maiúsculas são unidas (exibidas com a grafia mais frequente)
+        grafias = pd.DataFrame({"familia": contagens.index, "chave": contagens.index.str.lower(), "n": contagens.to_numpy()})
+        familias = grafias.groupby("chave", sort=True).agg(familia=("familia", "first"), n=("n", "sum"))
+        self.chaves = familias.index.to_numpy(dtype=object) #Nomes em minúsculas, ordenados para as buscas por prefixo
+        self.familias = familias["familia"].to_numpy(dtype=object)
+        self.frequencias = familias["n"].to_numpy()
+
+        codigos, ids = [], []
+        for inicio in range(0, len(self.chaves), self.BLOCO):
+            bloco_codigos, bloco_ids = self._trigramas_bloco(self.chaves[inicio:inicio + self.BLOCO])
+            codigos.append(bloco_codigos)
+            ids.append(bloco_ids + inicio)
+        codigos, ids = np.concatenate(codigos), np.concatenate(ids)
+        self.codigos, trigramas = np.unique(codigos, return_inverse=True) #Trigramas distintos, ordenados
+        pares = np.unique(trigramas.astype(np.int64) * len(self.chaves) + ids) #(trigrama, família) sem repetição
+        self.listas = (pares % len(self.chaves)).astype(np.int32) #Famílias de cada trigrama, em sequência
+        self.inicios = np.searchsorted(pares // len(self.chaves), np.arange(len(self.codigos) + 1))
+        self.n_trigramas = np.bincount(self.listas, minlength=len(self.chaves))
+
+    @staticmethod
+    def _trigramas_bloco(chaves):
+        """Códigos (int64) dos trigramas de cada nome e o número da linha de origem, com operações vetorizadas."""
+        textos = np.asarray(chaves, dtype=str)
+        largura = textos.dtype.itemsize // 4
+        tamanhos = np.char.str_len(textos)
+        caracteres = np.zeros((len(textos), largura + 3), dtype=np.int64)
+        caracteres[:, :2] = ord(" ")
+        caracteres[:, 2:largura + 2] = textos.view(np.uint32).reshape(len(textos), largura)
+        caracteres[np.arange(len(textos)), tamanhos + 2] = ord(" ")
+        codigos = (caracteres[:, :-2] << 42) | (caracteres[:, 1:-1] << 21) | caracteres[:, 2:] #Pontos de código < 2^21
+        validos = np.arange(largura + 1) <= tamanhos[:, None] #Um trigrama por caractere, mais o final ("ra ")
+        return codigos[validos], np.nonzero(validos)[0]
+
+    @staticmethod
+    def trigramas(texto):
+        """Códigos dos trigramas distintos de um texto (em minúsculas e completado por espaços)."""
+        caracteres = [ord(c) for c in "  " + texto.lower() + " "]
+        return np.unique(np.array([(a << 42) | (b << 21) | c for a, b, c in zip(caracteres, caracteres[1:], caracteres[2:])],
+                                  dtype=np.int64))
+
+    def corrigir(self, medicamento):
+        """
+        Corrige as maiúsculas do texto digitado quando a família (primeiro nome) corresponde ao início de alguma
+        família do conjunto sem diferenciar maiúsculas (por exemplo, "ALLEGRA" -> "Allegra").
+        Retorno: medicamento (str): Texto com a grafia da família mais frequente, ou None se não houver correspondência.
+        """
+        medicamento = str(medicamento).strip()
+        familia, _, restante = medicamento.partition(" ")
+        chave = familia.lower()
+        if not chave:
+            return None
+        inicio = np.searchsorted(self.chaves, chave, side="left")
+        fim = np.searchsorted(self.chaves, chave + "\U0010ffff", side="left")
+        if fim == inicio:
+            return None
+        grafia = self.familias[inicio + np.argmax(self.frequencias[inicio:fim])]
+        prefixo = grafia[:len(familia)] if grafia[:len(familia)].lower() == chave else grafia
+        return prefixo + (" " + restante if restante else "")
+
+    def sugerir(self, medicamento, limite=5, similaridade_minima=0.3):
+        """
+        Famílias mais parecidas com o texto digitado (primeiro nome), para as sugestões "você quis dizer".
+        Parâmetros:
+          medicamento (str): Texto digitado.
+          limite (int): Quantidade máxima de sugestões.
+          similaridade_minima (float): Similaridade de Jaccard mínima entre os trigramas (0 a 1).
+        Retorno: sugestoes (list): Pares (família, similaridade), da mais para a menos parecida.
+        """
+        familia = str(medicamento).strip().split(" ")[0]
+        if not familia or not len(self.codigos):
+            return []
+        consulta = self.trigramas(familia)
+        posicoes = np.minimum(np.searchsorted(self.codigos, consulta), len(self.codigos) - 1)
+        posicoes = posicoes[self.codigos[posicoes] == consulta] #Trigramas do texto que existem em alguma família
+        if not len(posicoes):
+            return []
+        compartilhados = np.bincount(np.concatenate([self.listas[self.inicios[p]:self.inicios[p + 1]] for p in posicoes]),
+                                     minlength=len(self.chaves))
+        candidatos = np.flatnonzero(compartilhados)
+        comuns = compartilhados[candidatos]
+        similaridades = comuns / (len(consulta) + self.n_trigramas[candidatos] - comuns)
+        selecionados = similaridades >= similaridade_minima
+        candidatos, similaridades = candidatos[selecionados], similaridades[selecionados]
+        ordem = np.lexsort((-self.frequencias[candidatos], -similaridades))[:limite]
+        return [(self.familias[c], float(s)) for c, s in zip(candidatos[ordem], similaridades[ordem])]
+
+
+@cache_resource(max_entries=4, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def obter_indice_trigramas(conjunto):
+    """
+    Retorna o índice de trigramas dos nomes do conjunto de dados, compartilhado entre as sessões e reconstruído
+    apenas quando uma nova versão do conjunto é carregada.
+    Parâmetros: conjunto (ConjuntoDados): Conjunto com a coluna "name".
+    Retorno: indice (IndiceTrigramas): Índice para correção de maiúsculas e sugestões de nomes.
+    """
+    return IndiceTrigramas(conjunto["name"])
+
+
+@instrumentar
+def load_and_process_data(indice, medicamento):
+    """Função para localizar os dados de acordo com o medicamento inserido.
+    Parâmetros:
+      indice (IndiceNomes): Índice dos nomes e dosagens do conjunto de dados.
       medicamento (str): O nome do medicamento a ser filtrado.
-      Retorno: data (DataFrame): DataFrame filtrado com os dados do medicamento.
+      Retorno: posicoes (array): Posições das linhas com o nome do medicamento inserido.
       dosagens (array): Array com as dosagens disponíveis para o medicamento."""     
     medicamento = str(medicamento).split(" ")[0]  # Transformação do medicamento inserido para string e seleção do primeiro nome        
-    nomes = data.loc[:,"name"] #Localização da Coluna Nome
-    nomes_separados = nomes.str.split(" ").str[0] #Separação dos Nomes nas colunas do DataFrame
-    medicamentos_df = data.loc[nomes_separados.str.contains(medicamento), :] #Localização das Linhas com o nome do medicamento inserido      
-    dosagens = medicamentos_df["name"].str.extract(r"(\d+)").fillna(0).astype(int) #Extração das dosagens disponíveis para a caixa de seleção
-    data["dosage"] = dosagens
-    dosagens = np.unique(dosagens)
+    posicoes = indice.buscar(medicamento) #Localização das Linhas com o nome do medicamento inserido (pelo índice)
+    dosagens = indice.dosagens(medicamento) #Dosagens disponíveis para a caixa de seleção (grupos pré-calculados)
     
-    return data, dosagens
+    return posicoes, dosagens
 
 
 
@@ -107,8 +1125,11 @@ def load_and_process_data(data, medicamento):
 
 
 #Gráficos de Barras Simples para Análise
+@instrumentar
 def plot_barras_st(df, x, y):
     """Função para criar um gráfico de barras simples usando Plotly Express."""
+    import plotly.express as px
+
     if df.shape[0] > 20:
         df = df.iloc[:20, :] # Limitar a 20 linhas para evitar sobrecarga visual
     fig = px.bar(df, x, y, color_discrete_sequence=["#2268EE"])    
@@ -118,16 +1139,19 @@ def plot_barras_st(df, x, y):
 #============================================================================================================
 
 #Filtro de Dosagens dos Medicamentos
-def filter_dosage(medicamentos_df, dosagem):
+@instrumentar
+def filter_dosage(indice, medicamento, dosagem):
     """Função para filtrar os medicamentos de acordo com a dosagem inserida.
     Parâmetros:
-      medicamentos_df (DataFrame): O conjunto de dados de entrada com uma coluna 'dosage' (dosagem).
-      dosagem (int): A dosagem a ser filtrada e retornada no dataframe.
-      Retorno: medicamentos_df (DataFrame): DataFrame filtrado com os dados do(s) medicamento(s)."""
-    if dosagem is not None:
-        medicamentos_df = medicamentos_df.loc[medicamentos_df["dosage"]==dosagem, :]
+      indice (IndiceNomes): Índice dos nomes e dosagens do conjunto de dados.
+      medicamento (str): O nome do medicamento (apenas o primeiro nome é considerado).
+      dosagem (int): A dosagem a ser filtrada (se None, todas as dosagens do medicamento são mantidas).
+      Retorno: posicoes (array): Posições das linhas do(s) medicamento(s) com a dosagem informada."""
+    medicamento = str(medicamento).split(" ")[0]
+    if dosagem is None:
+        return indice.buscar(medicamento)
 
-    return medicamentos_df
+    return indice.buscar_dosagem(medicamento, dosagem)
 
 #============================================================================================================
 
@@ -144,115 +1168,637 @@ def limit_unique_values(df, column, limit):
     Retorno:
         - df (DataFrame): O DataFrame processado com os valores únicos limitados.        
     """
-    value_counts = df[column].value_counts()
-    top_values = value_counts.nlargest(limit).index
-    df[column] = df[column].apply(lambda x: x if x in top_values else "Others")
+    #ausente=None: valores ausentes viram "Others", como na versão original desta função
+    df[column] = LimitadorCategorias(limit, [column], ausente=None).fit_transform(df)[column]
     return df
 
 
+class LimitadorCategorias:
+    """
+    Mantém as 'limite' categorias mais frequentes de cada coluna (aprendidas no fit) e substitui as demais por "Others".
+    O ajuste é uma contagem por hash (value_counts) e a transformação é vetorizada (isin + where),
+    sem chamadas Python por linha. Salvo junto dos encoders, garante que a inferência reproduza
+    exatamente o agrupamento feito no treinamento.
+    Os valores ausentes viram 'ausente' antes do agrupamento, como em montar_medicamentos_ml, e o conjunto completo
+    de categorias vistas no fit (vistas_) permite recusar na inferência os valores que o treinamento nunca viu
+    (erros de digitação, categorias novas), em vez de agrupá-los silenciosamente em "Others".
+    Parâmetros:
+        - limite (int): O número máximo de categorias a serem mantidas por coluna.
+        - colunas (list): Colunas a serem limitadas (padrão: CATEGORICAS).
+        - outros (str): Valor atribuído às categorias descartadas.
+        - ausente (str): Valor atribuído aos valores ausentes (None: ficam fora da contagem e viram 'outros',
+          como no limit_unique_values original).
+    """
+
+    def __init__(self, limite=20, colunas=None, outros="Others", ausente="Not Applicable"):
+        self.limite = limite
+        self.colunas = list(colunas) if colunas is not None else list(CATEGORICAS)
+        self.outros = outros
+        self.ausente = ausente
+        self.mantidas_ = {}
+        self.vistas_ = {}
+        self._indexar()
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        for nome in ("_conjuntos", "_vistas"): #Conjuntos de consulta reconstruídos na leitura
+            estado.pop(nome, None)
+        return estado
+
+    def __setstate__(self, estado):
+        #Limitadores salvos antes de 'ausente' e 'vistas_': as categorias conhecidas são as mantidas e 'outros'
+        estado.setdefault("ausente", "Not Applicable")
+        estado.setdefault("vistas_", {coluna: np.append(mantidas, estado["outros"]).astype(object)
+                                      for coluna, mantidas in estado["mantidas_"].items()})
+        self.__dict__.update(estado)
+        self._indexar()
+
+    def _indexar(self):
+        """
+        Conjuntos usados nas consultas de um único valor (limitar_valor), montados no fit e na leitura:
+        o limitador é compartilhado entre as sessões do Streamlit e não é alterado depois de pronto.
+        """
+        self._conjuntos = {nome: frozenset(mantidas) for nome, mantidas in self.mantidas_.items()}
+        self._vistas = {nome: frozenset(vistas) for nome, vistas in self.vistas_.items()}
+
+    @classmethod
+    def a_partir_dos_encoders(cls, encoders, outros="Others"):
+        """Reconstrói o limitador a partir das classes dos encoders (artefatos anteriores ao limitador)."""
+        limitador = cls(limite=None, colunas=list(encoders), outros=outros)
+        limitador.mantidas_ = {coluna: np.asarray([valor for valor in encoder.classes_ if valor != outros], dtype=object)
+                               for coluna, encoder in encoders.items()}
+        limitador.vistas_ = {coluna: np.append(mantidas, outros).astype(object) for coluna, mantidas in limitador.mantidas_.items()}
+        limitador._indexar()
+        return limitador
+
+    def _preencher(self, serie):
+        """Substitui os valores ausentes por 'ausente' (ou por 'outros', se ausente for None)."""
+        valor = self.outros if self.ausente is None else self.ausente
+        if isinstance(serie.dtype, pd.CategoricalDtype) and valor not in serie.cat.categories:
+            serie = serie.cat.add_categories(valor)
+        return serie.fillna(valor)
+
+    def fit(self, df):
+        """Aprende as categorias mais frequentes de cada coluna e o conjunto de todas as categorias vistas."""
+        #Com ausente=None os valores ausentes não entram na contagem (value_counts os descarta)
+        series = {coluna: df[coluna] if self.ausente is None else self._preencher(df[coluna]) for coluna in self.colunas}
+        self.mantidas_ = {coluna: serie.value_counts().nlargest(self.limite).index.to_numpy(dtype=object)
+                          for coluna, serie in series.items()}
+        self.vistas_ = {coluna: np.append(pd.unique(serie.dropna().to_numpy(dtype=object)), self.outros).astype(object)
+                        for coluna, serie in series.items()}
+        self._indexar()
+        return self
+
+    def transform(self, df):
+        """Retorna uma cópia do DataFrame com as categorias fora das mantidas substituídas por 'outros'."""
+        df = df.copy()
+        for coluna, mantidas in self.mantidas_.items():
+            if coluna not in df.columns:
+                continue
+            serie = self._preencher(df[coluna])
+            if isinstance(serie.dtype, pd.CategoricalDtype) and self.outros not in serie.cat.categories:
+                serie = serie.cat.add_categories(self.outros)
+            df[coluna] = serie.where(serie.isin(mantidas), self.outros)
+        return df
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def desconhecidas(self, df):
+        """
+        Indica, para cada coluna limitada presente em df, as linhas com categorias que não foram vistas no fit.
+        Retorno: mascaras (dict): Coluna -> array booleano (True nas linhas desconhecidas).
+        """
+        return {coluna: ~self._preencher(df[coluna]).isin(vistas).to_numpy()
+                for coluna, vistas in self.vistas_.items() if coluna in df.columns}
+
+    def limitar_valor(self, coluna, valor):
+        """
+        Aplica o agrupamento a um único valor (consulta O(1) em um conjunto).
+        Retorno: O valor, 'outros' ou None se o valor não foi visto no fit.
+        """
+        if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+            valor = self.outros if self.ausente is None else self.ausente
+        if valor not in self._vistas[coluna]:
+            return None
+        return valor if valor in self._conjuntos[coluna] else self.outros
+
+
 #==========================================================================================================
 
 #Função para geração de Nuvem de Palavras
-@cache_resource
-def plot_cloud(data, classe, output_file="wordcloud.png"):
-    """
-    Gera uma nuvem de palavras a partir de um DataFrame filtrado de acordo com a classe terapêutica.
-    data (DataFrame): O DataFrame contendo os dados.
-    classe (str): A classe terapêutica a ser filtrada e retornada no dataframe.
-    output_file (str): O nome de salvamento da nuvem.
-    Retorno: fig (Figure): A figura da nuvem de palavras gerada com plotly."""
-    # Verificar se a classe está presente na coluna "Therapeutic Class"
-    if classe not in data["Therapeutic Class"].unique():
-        raise ValueError(f"O valor '{classe}' não foi encontrado no DataFrame.")
-    
-    # Filtrar os dados pela classe selecionada
-    dados_filtrados = data[data["Therapeutic Class"] == classe]
-    
-    # Combinar o texto de todas as colunas (exceto "Therapeutic Class")
-    colunas = [col for col in data.columns if col != "Therapeutic Class"]
-    texto_completo = " ".join([
-        " ".join(map(str, dados_filtrados[col].dropna().tolist()))
-        for col in colunas
-    ])
-    
-    # Converter o texto para minúsculas e dividir em palavras
-    palavras = texto_completo.lower()            
-        
-    # Definir stop words personalizadas e remover do contador
-    stops = STOPWORDS.union({"not", "applicable", "not applicable"})    
-        
-    # Criar a nuvem de palavras com as frequências filtradas
-    wordcloud = WordCloud(max_words=50, width=350, height=200, colormap="cool", stopwords=stops, repeat=True).generate(palavras)
-    
-    # Inicializar a figura, plotar a nuvem e salvar a imagem
-    fig, ax = plt.subplots(figsize=(5, 5))
-    ax.imshow(wordcloud, interpolation="bilinear")
-    ax.axis("off")
-    fig.savefig(output_file, bbox_inches="tight", dpi=600)
-    plt.close(fig)
-    
-    return fig
+DIRETORIO_NUVENS = os.path.join("cache", "nuvens")
+
+
+def palavras_ignoradas():
+    """Stop words removidas dos efeitos colaterais (as do WordCloud e "not applicable"), como na nuvem original."""
+    from wordcloud import STOPWORDS
+
+    return STOPWORDS.union({"not", "applicable", "not applicable"})
+
+
+#Cubo de frequências de efeitos colaterais por classe terapêutica
+class CuboEfeitos:
+    """
+    Matriz esparsa (classe terapêutica x efeito colateral) com a quantidade de medicamentos
+    de cada classe que citam cada efeito, construída uma única vez a partir das colunas sideEffect*.
+    Os efeitos são normalizados como na nuvem de palavras original: convertidos para minúsculas
+    (grafias diferentes do mesmo efeito são unidas) e sem as stop words do WordCloud e "not applicable".
+    Parâmetros:
+      data (ConjuntoDados ou DataFrame): Os dados com as colunas sideEffect* e "Therapeutic Class".
+    """
+
+    def __init__(self, data):
+        colunas = [coluna for coluna in data.columns if coluna.startswith("sideEffect")]
+        codigos_classes, self.classes = pd.factorize(data["Therapeutic Class"].astype(object), sort=True)
+        self.classes = np.asarray(self.classes, dtype=object)
+        self.n_medicamentos = np.bincount(codigos_classes[codigos_classes >= 0], minlength=len(self.classes))
+
+        # Formato longo (melt) de todas as colunas de efeitos de uma só vez
+        efeitos = np.concatenate([data[coluna].to_numpy(dtype=object) for coluna in colunas]) if colunas else np.empty(0, dtype=object)
+        classes_longas = np.tile(codigos_classes, len(colunas))
+        linhas_longas = np.tile(np.arange(len(codigos_classes)), len(colunas))
+        efeitos = pd.Series(efeitos, dtype=object).str.strip().str.lower().to_numpy(dtype=object)
+        validos = (classes_longas >= 0) & pd.notna(efeitos) & ~pd.Series(efeitos).isin(palavras_ignoradas()).to_numpy()
+        codigos_efeitos, self.efeitos = pd.factorize(efeitos[validos], sort=True)
+        self.efeitos = np.asarray(self.efeitos, dtype=object)
+        # Cada medicamento conta uma única vez por efeito (grafias unidas pela normalização não são somadas duas vezes)
+        _, unicos = np.unique(linhas_longas[validos] * max(len(self.efeitos), 1) + codigos_efeitos, return_index=True)
+        classes_longas, codigos_efeitos = classes_longas[validos][unicos], codigos_efeitos[unicos]
+        self._posicao_efeito = {efeito: posicao for posicao, efeito in enumerate(self.efeitos)}
+        self._posicao_classe = {classe: posicao for posicao, classe in enumerate(self.classes)}
+
+        # Contagem (classe, efeito) com soma das duplicatas na conversão para CSR
+        from scipy.sparse import coo_matrix
+        self.contagens = coo_matrix((np.ones(len(codigos_efeitos), dtype=np.int32), (classes_longas, codigos_efeitos)),
+                                    shape=(len(self.classes), len(self.efeitos))).tocsr()
+
+    def _linha(self, classe):
+        """Contagens (efeitos e valores) de uma classe, apenas dos efeitos presentes."""
+        if classe not in self._posicao_classe:
+            raise ValueError(f"O valor '{classe}' não foi encontrado no DataFrame.")
+        linha = self.contagens.getrow(self._posicao_classe[classe])
+        return linha.indices, linha.data
+
+    def frequencias(self, classe):
+        """Dicionário {efeito: contagem} de uma classe, no formato de WordCloud.generate_from_frequencies."""
+        indices, contagens = self._linha(classe)
+        return dict(zip(self.efeitos[indices], contagens.tolist()))
+
+    def top_k(self, classe, k=10):
+        """Os k efeitos mais citados de uma classe (Series ordenada de forma decrescente)."""
+        indices, contagens = self._linha(classe)
+        ordem = np.argsort(-contagens, kind="stable")[:k]
+        return pd.Series(contagens[ordem], index=self.efeitos[indices[ordem]], name=classe)
+
+    def comparar(self, classe_a, classe_b, k=10):
+        """
+        Compara os efeitos de duas classes pela proporção de medicamentos que citam cada efeito.
+        Retorno: comparacao (DataFrame): Os k efeitos com maior diferença absoluta entre as proporções.
+        """
+        linhas = [self._posicao_classe[classe] for classe in (classe_a, classe_b) if classe in self._posicao_classe]
+        if len(linhas) < 2:
+            raise ValueError(f"As classes '{classe_a}' e '{classe_b}' precisam existir no DataFrame.")
+        contagens = self.contagens[linhas].toarray()
+        proporcoes = contagens / np.maximum(self.n_medicamentos[linhas], 1)[:, None]
+        diferenca = proporcoes[0] - proporcoes[1]
+        ordem = np.argsort(-np.abs(diferenca), kind="stable")[:k]
+        return pd.DataFrame({f"{classe_a} (%)": proporcoes[0, ordem] * 100, f"{classe_b} (%)": proporcoes[1, ordem] * 100,
+                             "Diferença (p.p.)": diferenca[ordem] * 100}, index=self.efeitos[ordem])
+
+    def buscar_efeito(self, efeito):
+        """Quantidade de medicamentos de cada classe que citam o efeito (Series ordenada de forma decrescente)."""
+        efeito = str(efeito).strip().lower() #Mesma normalização da construção do cubo
+        if efeito not in self._posicao_efeito:
+            return pd.Series(dtype=np.int32, name=efeito)
+        contagens = self.contagens[:, self._posicao_efeito[efeito]].toarray().ravel()
+        presentes = np.flatnonzero(contagens)
+        return pd.Series(contagens[presentes], index=self.classes[presentes], name=efeito).sort_values(ascending=False)
+
+
+@cache_resource(max_entries=4, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def obter_cubo_efeitos(data):
+    """
+    Retorna o cubo de frequências dos efeitos colaterais, construído uma única vez por versão dos dados.
+    Parâmetros: data (ConjuntoDados): Conjunto de dados dos efeitos colaterais.
+    Retorno: cubo (CuboEfeitos): Cubo de frequências por classe terapêutica.
+    """
+    return CuboEfeitos(data)
+
+
+def gerar_nuvem(cubo, classe, escala=1):
+    """
+    Gera a nuvem de palavras dos efeitos colaterais de uma classe terapêutica
+    diretamente das frequências pré-agregadas (sem montar e reprocessar o texto).
+    Parâmetros:
+      cubo (CuboEfeitos): Cubo de frequências dos efeitos colaterais.
+      classe (str): A classe terapêutica a ser filtrada.
+      escala (int): Fator de resolução da imagem (350x200 pixels multiplicados pela escala).
+    Retorno: wordcloud (WordCloud): A nuvem de palavras gerada."""
+    from wordcloud import WordCloud
+
+    frequencias = cubo.frequencias(classe)
+    if not frequencias:
+        frequencias = {"not applicable": 1} #Classe sem efeitos colaterais informados
+    return WordCloud(max_words=50, width=350, height=200, scale=escala, colormap="cool", repeat=True).generate_from_frequencies(frequencias)
+
+
+def arquivo_nuvem(versao, classe, diretorio=DIRETORIO_NUVENS):
+    """Caminho da nuvem pré-renderizada de uma classe para uma versão dos dados."""
+    nome = re.sub(r"[^\w]+", "_", str(classe)).strip("_")
+    return os.path.join(diretorio, versao, f"{nome}.png")
+
+
+def nuvem_png(wordcloud):
+    """Codifica a nuvem de palavras como PNG, sem passar pelo Matplotlib."""
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+@cache_resource(max_entries=32, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def nuvem_classe(data, classe, diretorio=DIRETORIO_NUVENS):
+    """
+    Retorna a nuvem de palavras da classe como bytes PNG, mantida em memória com descarte das menos usadas.
+    Se a nuvem foi pré-renderizada (construir_dados.py nuvens) para esta versão dos dados, apenas lê o arquivo;
+    caso contrário, gera a nuvem em memória (nada é gravado em disco durante a requisição).
+    Parâmetros:
+      data (ConjuntoDados): Conjunto de dados dos efeitos colaterais.
+      classe (str): A classe terapêutica.
+      diretorio (str): Pasta das nuvens pré-renderizadas.
+    Retorno: png (bytes): Imagem da nuvem de palavras.
+    """
+    arquivo = arquivo_nuvem(data.versao, classe, diretorio)
+    if os.path.exists(arquivo):
+        with open(arquivo, "rb") as imagem:
+            return imagem.read()
+    return nuvem_png(gerar_nuvem(obter_cubo_efeitos(data), classe, escala=3))
+
+
+_dados_nuvens = None
+_cubo_nuvens = None
+
+
+def _iniciar_processo_nuvens(path):
+    """Carrega os dados e constrói o cubo uma única vez em cada processo de pré-renderização."""
+    global _dados_nuvens, _cubo_nuvens
+    _dados_nuvens = carregar_conjunto(path)
+    _cubo_nuvens = CuboEfeitos(_dados_nuvens)
+
+
+def _renderizar_nuvem(classe, diretorio):
+    """Renderiza e grava a nuvem de uma classe (executado nos processos de pré-renderização)."""
+    arquivo = arquivo_nuvem(_dados_nuvens.versao, classe, diretorio)
+    conteudo = nuvem_png(gerar_nuvem(_cubo_nuvens, classe, escala=3))
+    with open(arquivo + ".tmp", "wb") as imagem:
+        imagem.write(conteudo)
+    os.replace(arquivo + ".tmp", arquivo)
+    return classe, arquivo
+
+
+def pre_renderizar_nuvens(path="effects.csv", diretorio=DIRETORIO_NUVENS, processos=None):
+    """
+    Renderiza as nuvens de todas as classes terapêuticas em paralelo e grava os PNGs por versão dos dados.
+    Parâmetros:
+      path (str): Arquivo dos efeitos colaterais.
+      diretorio (str): Pasta de destino das nuvens.
+      processos (int): Quantidade de processos (se omitido, um por núcleo).
+    Retorno: arquivos (dict): Caminho da nuvem gerada para cada classe.
+    """
+    data = carregar_conjunto(path)
+    classes = data["Therapeutic Class"].dropna().unique().tolist()
+    os.makedirs(os.path.join(diretorio, data.versao), exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo_nuvens, initargs=(path,)) as executor:
+        resultados = executor.map(_renderizar_nuvem, classes, [diretorio] * len(classes))
+        return dict(resultados)
 
 #==========================================================================================================
 
 
 
+#Grafo de substitutos (rede de concorrentes) com adjacência CSR
+class GrafoSubstitutos:
+    """
+    Rede de medicamentos e substitutos construída uma única vez a partir do catálogo.
+    Os nomes são codificados em ids inteiros e as arestas (medicamento -> substituto) ficam
+    em uma matriz de adjacência CSR, permitindo consultas de vizinhança, grau de entrada
+    e agrupamentos de mercado sem percorrer o DataFrame.
+    Parâmetros:
+      data (ConjuntoDados ou DataFrame): Dados com as colunas name, substitute0...substitute4, use0 e n_effects.
+    """
+
+    def __init__(self, data):
+        colunas = [coluna for coluna in data.columns if coluna.startswith("substitute")]
+        nomes_linhas = data["name"].to_numpy(dtype=object)
+        substitutos = np.concatenate([data[coluna].to_numpy(dtype=object) for coluna in colunas]) if colunas else np.empty(0, dtype=object)
+        validos = pd.notna(substitutos) & (substitutos != "Not Applicable")
+
+        # Dicionário de nomes: medicamentos do catálogo e substitutos citados recebem ids inteiros
+        codigos, self.nomes = pd.factorize(np.concatenate([nomes_linhas, substitutos[validos]]))
+        self.nomes = np.asarray(self.nomes, dtype=object)
+        self.ids_linhas = codigos[:len(nomes_linhas)] #Id do medicamento de cada linha do catálogo
+        self._ids = {nome: posicao for posicao, nome in enumerate(self.nomes)}
+
+        origens = np.tile(self.ids_linhas, len(colunas))[validos]
+        destinos = codigos[len(nomes_linhas):]
+        n = len(self.nomes)
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+        self.adjacencia = csr_matrix((np.ones(len(origens), dtype=np.int8), (origens, destinos)), shape=(n, n))
+        self.adjacencia.sum_duplicates()
+        self.adjacencia.data[:] = 1
+        self.vizinhos = (self.adjacencia + self.adjacencia.T).tocsr() #Concorrência em qualquer direção
+        self.grau_entrada = np.bincount(self.adjacencia.indices, minlength=n) #Quantos medicamentos citam cada nome como substituto
+        self.n_agrupamentos, self.agrupamentos = connected_components(self.adjacencia, directed=True, connection="weak")
+        self.tamanho_agrupamentos = np.bincount(self.agrupamentos, minlength=self.n_agrupamentos)
+
+        # Atributos exibidos nos nós dos medicamentos principais
+        self.uso = {}
+        self.efeitos = {}
+        if "use0" in data.columns and "n_effects" in data.columns:
+            self.uso = dict(zip(self.ids_linhas.tolist(), data["use0"].astype(object).tolist()))
+            self.efeitos = dict(zip(self.ids_linhas.tolist(), data["n_effects"].tolist()))
+
+    def ids(self, nomes):
+        """Converte nomes de medicamentos em ids (nomes desconhecidos são ignorados)."""
+        return np.array([self._ids[nome] for nome in nomes if nome in self._ids], dtype=np.int64)
+
+    def substitutos(self, ids):
+        """Arestas (origem, destino) que saem dos ids informados."""
+        ids = np.asarray(ids, dtype=np.int64)
+        linhas = self.adjacencia[ids]
+        return np.repeat(ids, np.diff(linhas.indptr)), linhas.indices.astype(np.int64)
+
+    def vizinhanca(self, ids, k=1):
+        """
+        Concorrentes a até k saltos dos medicamentos informados (arestas em qualquer direção).
+        Parâmetros: ids (array): Ids dos medicamentos de origem.
+        k (int): Quantidade máxima de saltos.
+        Retorno: ids (array), distancias (array): Ids alcançados (incluindo os de origem) e a distância de cada um.
+        """
+        distancias = np.full(len(self.nomes), -1, dtype=np.int32)
+        fronteira = np.unique(np.asarray(ids, dtype=np.int64))
+        distancias[fronteira] = 0
+        for salto in range(1, k + 1):
+            if len(fronteira) == 0:
+                break
+            alcancados = np.unique(self.vizinhos[fronteira].indices)
+            fronteira = alcancados[distancias[alcancados] < 0]
+            distancias[fronteira] = salto
+        alcancados = np.flatnonzero(distancias >= 0)
+        return alcancados, distancias[alcancados]
+
+    def agrupamento(self, nome):
+        """Ids de todos os medicamentos do mesmo agrupamento de mercado (componente conexo) do nome informado (vazio se o nome é desconhecido)."""
+        if nome not in self._ids:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.agrupamentos == self.agrupamentos[self._ids[nome]])
+
+
+@cache_resource(max_entries=2, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def obter_grafo_substitutos(data):
+    """
+    Retorna o grafo de substitutos do catálogo, construído uma única vez por versão dos dados.
+    Parâmetros: data (ConjuntoDados): Tabela de medicamentos com as colunas de substitutos.
+    Retorno: grafo (GrafoSubstitutos): Rede de medicamentos e substitutos.
+    """
+    return GrafoSubstitutos(data)
+
+
+@cache_resource(max_entries=128, show_spinner=False, hash_funcs=HASH_CONJUNTO)
+def layout_concorrentes(data, medicamento, dosagem=None, saltos=1, max_nos=600):
+    """
+    Calcula no servidor (uma única vez por consulta) as posições dos nós da rede de concorrentes
+    de um medicamento/dosagem, para que o navegador não precise executar o layout.
+    Parâmetros:
+      data (ConjuntoDados): Tabela de medicamentos.
+      medicamento (str): Nome (família) do medicamento.
+      dosagem (int): Dosagem selecionada (se None, todas as dosagens).
+      saltos (int): Distância máxima (em arestas) dos concorrentes exibidos.
+      max_nos (int): Quantidade máxima de nós (os mais próximos dos medicamentos principais são mantidos).
+    Retorno: layout (dict): Nomes, coordenadas, distâncias e atributos dos nós, e as arestas entre eles.
+    """
+    import networkx as nx
+
+    rede = obter_grafo_substitutos(data)
+    posicoes = filter_dosage(obter_indice_nomes(data), medicamento, dosagem)
+    principais = pd.unique(rede.ids_linhas[posicoes])
+    ids, distancias = rede.vizinhanca(principais, saltos)
+    ordem = np.argsort(distancias, kind="stable")[:max_nos]
+    ids, distancias = ids[ordem], distancias[ordem]
+
+    # Arestas apenas entre os nós exibidos, com os ids convertidos para posições locais
+    subgrafo = rede.adjacencia[ids][:, ids].tocoo()
+    grafo = nx.Graph()
+    grafo.add_nodes_from(range(len(ids)))
+    grafo.add_edges_from(zip(subgrafo.row.tolist(), subgrafo.col.tolist()))
+    coordenadas = nx.spring_layout(grafo, seed=42, k=1.5 / np.sqrt(max(len(ids), 1)))
+    coordenadas = np.array([coordenadas[no] for no in range(len(ids))]).reshape(-1, 2)
+
+    return {
+        "nomes": rede.nomes[ids],
+        "x": coordenadas[:, 0],
+        "y": coordenadas[:, 1],
+        "distancias": distancias,
+        "grau_entrada": rede.grau_entrada[ids],
+        "uso": [rede.uso.get(no, "-") for no in ids.tolist()],
+        "efeitos": [rede.efeitos.get(no, "-") for no in ids.tolist()],
+        "origens": subgrafo.row,
+        "destinos": subgrafo.col,
+    }
+
+
+@instrumentar
+def plot_rede(layout):
+    """
+    Desenha a rede de concorrentes com as posições já calculadas (Plotly), sem layout no navegador.
+    Parâmetros: layout (dict): Resultado de layout_concorrentes.
+    Retorno: fig (Figure): Figura do Plotly com arestas e nós.
+    """
+    x, y = layout["x"], layout["y"]
+    separador = np.full(len(layout["origens"]), np.nan)
+    arestas_x = np.column_stack((x[layout["origens"]], x[layout["destinos"]], separador)).ravel()
+    arestas_y = np.column_stack((y[layout["origens"]], y[layout["destinos"]], separador)).ravel()
+    principais = layout["distancias"] == 0
+    textos = [f"{nome}<br>Uso: {uso}<br>Efeitos Colaterais: {efeitos}<br>Citado como substituto por: {grau}"
+              for nome, uso, efeitos, grau in zip(layout["nomes"], layout["uso"], layout["efeitos"], layout["grau_entrada"])]
+    textos = np.array(textos, dtype=object)
+
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=arestas_x, y=arestas_y, mode="lines", line=dict(color="white", width=0.5),
+                               hoverinfo="skip", showlegend=False))
+    fig.add_trace(go.Scattergl(x=x[~principais], y=y[~principais], mode="markers", name="Concorrentes",
+                               marker=dict(color="grey", size=8, line=dict(color="green", width=1)),
+                               text=textos[~principais], hovertemplate="%{text}<extra></extra>"))
+    fig.add_trace(go.Scattergl(x=x[principais], y=y[principais], mode="markers+text", name="Medicamento analisado",
+                               marker=dict(color="lightblue", size=14, line=dict(color="blue", width=2)),
+                               text=layout["nomes"][principais], textposition="top center",
+                               customdata=textos[principais], hovertemplate="%{customdata}<extra></extra>"))
+    fig.update_layout(plot_bgcolor="#0E1117", height=700, showlegend=True,
+                      xaxis=dict(visible=False), yaxis=dict(visible=False), margin=dict(l=10, r=10, t=10, b=10))
+    return fig
+
+
 # Função para criar o grafo usando Graphviz
-def criar_grafo(dataframe):
+def criar_grafo(rede, posicoes):
     """
     Cria um grafo utilizando Graphviz para visualizar medicamentos e substitutos,
     incluindo efeitos colaterais diretamente nos nós do medicamento principal.
+    As arestas vêm da adjacência pré-calculada da rede, sem percorrer as linhas do DataFrame.
     
     Parâmetros:
-        - dataframe (pd.DataFrame): Dados contendo colunas name, substitute0...substitute4, n_substitutes, use0, n_effects.
+        - rede (GrafoSubstitutos): Rede de substitutos do catálogo.
+        - posicoes (array): Posições (no catálogo) dos medicamentos principais a serem exibidos.
     Retorno:
         - grafo (Digraph): Objeto Graphviz representando o grafo.        
     """
+    from graphviz import Digraph
+
     # Inicializa o grafo
     grafo = Digraph(format='png', engine='fdp', graph_attr={'splines': "neato", "bgcolor": "#0E1117"})
+    principais = pd.unique(rede.ids_linhas[np.asarray(posicoes, dtype=np.int64)])
+    origens, destinos = rede.substitutos(principais)
     
-    # Loop pelos medicamentos principais e substitutos
-    for _, row in dataframe.iterrows():
-        medicamento = row['name']
-        uso = row['use0']
-        n_effects = row['n_effects']
-        
-        # Medicamento principal com informações adicionais
+    # Medicamentos principais com informações adicionais
+    for principal in principais.tolist():
+        medicamento = rede.nomes[principal]
         grafo.node(
             medicamento, 
-            label=f"{medicamento}\nUso: {uso}\nEfeitos Colaterais: {n_effects}", 
+            label=f"{medicamento}\nUso: {rede.uso.get(principal)}\nEfeitos Colaterais: {rede.efeitos.get(principal)}", 
             color="blue", 
             shape="oval", 
             style="filled", 
             fillcolor="lightblue"
         )
-        
-        # Adiciona substitutos ao redor        
-        for i in range(5):  # Para substitute0 até substitute4            
-            substituto = row[f'substitute{i}']
-            if pd.notna(substituto):
-                if substituto == "Not Applicable":
-                    substituto = "No Substitute Known"
-                grafo.node(
-                    substituto, 
-                    label=substituto, 
-                    color="green", 
-                    shape="box",
-                    style="filled", 
-                    fillcolor="grey"
-                )
-                grafo.edge(
-                    medicamento, substituto, 
-                    color="white"
-                )                
+    
+    # Substitutos ao redor
+    for substituto in pd.unique(destinos[~np.isin(destinos, principais)]).tolist():
+        grafo.node(rede.nomes[substituto], label=rede.nomes[substituto], color="green", shape="box", style="filled", fillcolor="grey")
+    for origem, destino in zip(rede.nomes[origens], rede.nomes[destinos]):
+        grafo.edge(origem, destino, color="white")
+    
+    # Medicamentos sem substitutos conhecidos
+    sem_substitutos = np.setdiff1d(principais, origens)
+    if len(sem_substitutos):
+        grafo.node("No Substitute Known", label="No Substitute Known", color="green", shape="box", style="filled", fillcolor="grey")
+        for principal in sem_substitutos.tolist():
+            grafo.edge(rede.nomes[principal], "No Substitute Known", color="white")
     
     return grafo
 
 
 #==========================================================================================================
 
+#Explicador SHAP reutilizável com cache das explicações
+class ExplicadorSHAP:
+    """
+    Mantém um único shap.TreeExplainer por modelo e memoriza os valores SHAP de cada linha codificada.
+    As features são categóricas codificadas (e uma dosagem escalonada), então as mesmas entradas
+    se repetem com frequência e não precisam percorrer todas as árvores novamente.
+
+    Parâmetros:
+        - model: O modelo de árvore de decisão treinado.
+        - tamanho_cache: Quantidade máxima de linhas memorizadas (as usadas há mais tempo são descartadas).
+        - classe: Índice da classe explicada (0 = baixo risco, a mesma usada no gráfico de força).
 
-def Treexplainer(model, novos_dados):
+    Florestas do sklearn são explicadas na escala de probabilidade, uma saída por classe. Modelos binários de saída única
+    (XGBoost, LightGBM, GradientBoosting) são explicados na margem da classe 1 em log-odds: para a classe 0 os valores
+    e o valor base são negados, e a função de ligação ("logit" ou "identity") fica em self.ligacao.
+    """
+
+    def __init__(self, model, tamanho_cache=4096, classe=0):
+        import shap
+        self.explainer = shap.TreeExplainer(model)
+        self.tamanho_cache = tamanho_cache
+        self.classe = classe
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+        self._cache = OrderedDict()
+        self._trava = threading.Lock()
+
+        # Se o expected_value tiver um valor por classe, usamos o elemento da classe explicada
+        valor_base = np.ravel(self.explainer.expected_value)
+        self.saida_unica = len(valor_base) == 1
+        self.ligacao = "logit" if self.saida_unica else "identity"
+        self._sinal = -1.0 if self.saida_unica and classe == 0 else 1.0 #log-odds da classe 0 = -log-odds da classe 1
+        self.expected_value = self._sinal * float(valor_base[0 if self.saida_unica else classe])
+
+    def _calcular(self, matriz):
+        """Executa uma única passagem do TreeSHAP para todas as linhas recebidas."""
+        shap_values = self.explainer.shap_values(matriz)
+        if isinstance(shap_values, list): #Versões antigas do SHAP retornam uma lista por classe
+            shap_values = shap_values[self.classe]
+        elif shap_values.ndim == 3:
+            shap_values = shap_values[..., self.classe]
+        return self._sinal * np.asarray(shap_values, dtype=float)
+
+    def explicar(self, novos_dados):
+        """
+        Calcula os valores SHAP de várias linhas de uma vez, consultando o cache antes.
+        As linhas que não estão no cache são explicadas juntas em uma única passagem.
+
+        Parâmetros:
+            - novos_dados: DataFrame ou array com as features já codificadas, na ordem do treinamento.
+
+        Retorno:
+            - shap_values: Array (linhas x features) com as contribuições de cada feature.
+            - expected_value: Valor base do modelo para a classe explicada (na escala de self.ligacao).
+        """
+        matriz = np.asarray(novos_dados, dtype=float)
+        chaves = [tuple(linha) for linha in matriz.tolist()]
+        shap_values = np.empty_like(matriz)
+        pendentes = {}
+        with self._trava:
+            for posicao, chave in enumerate(chaves):
+                valores = self._cache.get(chave)
+                if valores is None:
+                    pendentes.setdefault(chave, []).append(posicao)
+                    self.falhas += 1
+                else:
+                    self._cache.move_to_end(chave)
+                    shap_values[posicao] = valores
+                    self.acertos += 1
+
+        if pendentes:
+            novas_chaves = list(pendentes)
+            calculados = self._calcular(np.array(novas_chaves, dtype=float))
+            with self._trava:
+                for chave, valores in zip(novas_chaves, calculados):
+                    shap_values[pendentes[chave]] = valores
+                    self._cache[chave] = valores
+                while len(self._cache) > self.tamanho_cache:
+                    self._cache.popitem(last=False)
+                    self.descartes += 1
+
+        return shap_values, self.expected_value
+
+    def estatisticas(self):
+        """Retorna os contadores do cache (acertos, falhas, descartes e tamanho atual)."""
+        with self._trava:
+            return {"acertos": self.acertos, "falhas": self.falhas,
+                    "descartes": self.descartes, "tamanho": len(self._cache)}
+
+
+@cache_resource(max_entries=1, show_spinner=False)
+def _obter_explicador(versao, _model):
+    """Cria o explicador uma única vez para cada versão do pacote de artefatos."""
+    return ExplicadorSHAP(_model)
+
+
+@instrumentar
+def obter_explicador(artefatos):
+    """
+    Retorna o explicador SHAP de longa duração associado ao modelo do pacote de artefatos.
+    Parâmetros: artefatos (dict): Pacote retornado por carregar_artefatos.
+    Retorno: explicador (ExplicadorSHAP): Explicador compartilhado entre as sessões.
+    """
+    return _obter_explicador(artefatos["versao"], artefatos["modelo"])
+
+
+@instrumentar
+def Treexplainer(model, novos_dados, explicador=None):
     """
     Gera o gráfico de força local usando SHAP (SHapley Additive exPlanations), 
     filtrando as contribuições com valor absoluto abaixo do threshold.
@@ -260,7 +1806,7 @@ def Treexplainer(model, novos_dados):
     Parâmetros:
         - model: O modelo de árvore de decisão treinado.
         - novos_dados: O conjunto de dados para o qual os valores SHAP serão calculados.
-        - threshold: Valores com magnitude abaixo deste serão definidos como zero.
+        - explicador: ExplicadorSHAP já inicializado (se omitido, um novo explicador é criado para o modelo).
 
     Retorno:
         - force_plot: O gráfico de força local gerado com os valores filtrados.
@@ -269,27 +1815,22 @@ def Treexplainer(model, novos_dados):
         A filtragem pode alterar a soma dos SHAP values e, consequentemente, a previsão final.
         Se for importante preservar a soma original, será necessário ajustar o expected_value.
     """
-    # Inicializa o TreeExplainer e calcula os valores SHAP
-    tree_explainer = shap.TreeExplainer(model)
-    shap_values = tree_explainer.shap_values(novos_dados)    
+    # Reutiliza o explicador (e o cache) ou inicializa um novo para o modelo
+    if explicador is None:
+        explicador = ExplicadorSHAP(model)
+    shap_values, expected_value = explicador.explicar(novos_dados)
+    import shap
     #shap.initjs()
-
-    # Se o expected_value for uma lista/array, usamos o primeiro elemento
-    if isinstance(tree_explainer.expected_value, (list, tuple, np.ndarray)):
-        expected_value = float(tree_explainer.expected_value[0])
-        shap_values = shap_values[..., 0]
-    else:
-        expected_value = float(tree_explainer.expected_value)
-    
     
     # Gera o force plot usando os valores filtrados
-    force_plot = shap.plots.force(expected_value, shap_values, novos_dados)
+    force_plot = shap.plots.force(expected_value, shap_values, novos_dados, link=explicador.ligacao) #"logit": eixo em probabilidade
 
     return force_plot
 
 
 #==========================================================================================================
 
+@instrumentar
 def st_shap(plot, height=300, width=600):
     """
     Recebe um objeto force_plot do SHAP, converte para HTML e o renderiza no Streamlit.
@@ -299,6 +1840,8 @@ def st_shap(plot, height=300, width=600):
       - height: Altura do componente HTML exibido.
       - width: Largura do componente HTML exibido.      
     """
+    import shap
+
     custom_css = """
     <style type="text/css">
       html, body {
@@ -326,3 +1869,679 @@ def st_shap(plot, height=300, width=600):
     components.html(shap_html, height=height, width=width)
 
 
+#==========================================================================================================
+
+#Cubo SHAP global (explicações do conjunto de treino agregadas por grupo de medicamentos)
+ARQUIVO_CUBO_SHAP = "cubo_shap.parquet"
+DIMENSOES_CUBO_SHAP = ["Therapeutic Class", "Action Class", "faixa_dosagem"]
+QUANTIS_DOSAGEM = [0.5, 0.75, 0.9] #Faixas de dosagem do notebook de modelagem (sem dosagem, baixa, média, alta e muito alta)
+
+
+def limites_dosagem(dosagens):
+    """Limites superiores das faixas de dosagem: sem dosagem (até 0.01) e os quantis de QUANTIS_DOSAGEM, como no notebook."""
+    return [0.01] + np.quantile(np.asarray(dosagens, dtype=float), QUANTIS_DOSAGEM).tolist()
+
+
+def nomes_faixas_dosagem(limites):
+    """Nomes das faixas de dosagem, na ordem dos limites (a última faixa não tem limite superior)."""
+    return (["Sem dosagem"] + [f"{nome} (até {limite:g}mg)" for nome, limite in zip(["Baixa", "Média", "Alta"], limites[1:])]
+            + [f"Muito alta (acima de {limites[-1]:g}mg)"])
+
+
+def faixas_dosagem(dosagens, limites):
+    """Nome da faixa de cada dosagem (intervalos fechados à direita, como o pd.cut do notebook)."""
+    posicoes = np.searchsorted(limites, np.asarray(dosagens, dtype=float), side="left")
+    return np.asarray(nomes_faixas_dosagem(limites), dtype=object)[posicoes]
+
+
+class CuboSHAP:
+    """
+    Valores SHAP de todo o conjunto de treino agregados por classe terapêutica, classe de ação e faixa de dosagem,
+    calculados offline e consultados pela página do modelo sem executar o TreeSHAP.
+    A tabela é longa (uma linha por grupo e feature) com a quantidade de linhas do grupo, a média do valor absoluto
+    (importância) e a média com sinal (direção) das contribuições; as consultas agregam os grupos selecionados
+    pela média ponderada pela quantidade de linhas.
+    Parâmetros:
+      tabela (DataFrame): Colunas de DIMENSOES_CUBO_SHAP, "feature", "n", "media_abs" e "media".
+      valor_base (float): Valor base do modelo (probabilidade média de alto risco no treino, ou log-odds com ligacao="logit").
+      limites_dosagem (list): Limites superiores das faixas de dosagem (a última faixa não tem limite).
+      classe (int): Classe explicada (1 = alto risco: contribuições positivas aumentam o risco).
+      ligacao (str): Escala dos valores SHAP: "identity" (probabilidade) ou "logit" (log-odds, modelos de saída única).
+    """
+
+    def __init__(self, tabela, valor_base, limites_dosagem, classe=1, ligacao="identity"):
+        self.tabela = tabela.reset_index(drop=True)
+        self.valor_base = float(valor_base)
+        self.limites_dosagem = [float(limite) for limite in limites_dosagem]
+        self.classe = classe
+        self.ligacao = ligacao
+        # Arrays usados nas consultas (a tabela tem no máximo algumas dezenas de milhares de linhas)
+        self._dimensoes = {coluna: self.tabela[coluna].to_numpy(dtype=object) for coluna in DIMENSOES_CUBO_SHAP}
+        self._features, self.features = pd.factorize(self.tabela["feature"], sort=False)
+        self._n = self.tabela["n"].to_numpy(dtype=float)
+        self._soma_abs = self._n * self.tabela["media_abs"].to_numpy(dtype=float)
+        self._soma = self._n * self.tabela["media"].to_numpy(dtype=float)
+
+    def consultar(self, classe_terapeutica=None, classe_acao=None, faixa=None):
+        """
+        Importância e direção médias de cada feature nas linhas de treino do grupo informado.
+        Parâmetros: classe_terapeutica, classe_acao, faixa (str): Filtros do grupo (None = todos os valores).
+        Retorno:
+          resumo (DataFrame): "media_abs" e "media" por feature, da mais para a menos importante (vazio se não houver linhas).
+          n (int): Quantidade de linhas de treino do grupo.
+        """
+        selecao = np.ones(len(self._n), dtype=bool)
+        for coluna, valor in zip(DIMENSOES_CUBO_SHAP, (classe_terapeutica, classe_acao, faixa)):
+            if valor is not None:
+                selecao &= self._dimensoes[coluna] == valor
+        n = np.bincount(self._features[selecao], weights=self._n[selecao], minlength=len(self.features))
+        if not n.any():
+            return pd.DataFrame(columns=["media_abs", "media"], dtype=float), 0
+        resumo = pd.DataFrame({
+            "media_abs": np.bincount(self._features[selecao], weights=self._soma_abs[selecao], minlength=len(self.features)) / n,
+            "media": np.bincount(self._features[selecao], weights=self._soma[selecao], minlength=len(self.features)) / n,
+        }, index=pd.Index(self.features, name="feature"))
+        return resumo.sort_values("media_abs", ascending=False), int(n[0])
+
+    def consultar_medicamento(self, classe_terapeutica, classe_acao, dosagem):
+        """
+        Consulta o grupo mais específico do medicamento que possui linhas de treino:
+        classe terapêutica, classe de ação e faixa de dosagem; depois sem a classe de ação; depois apenas a classe terapêutica.
+        Retorno: resumo (DataFrame), n (int) e descricao (str) do grupo encontrado (n = 0 se nenhum grupo tiver linhas).
+        """
+        faixa = faixas_dosagem([dosagem], self.limites_dosagem)[0]
+        tentativas = [((classe_terapeutica, classe_acao, faixa), f"{classe_terapeutica} | {classe_acao} | {faixa}"),
+                      ((classe_terapeutica, None, faixa), f"{classe_terapeutica} | {faixa}"),
+                      ((classe_terapeutica, None, None), classe_terapeutica)]
+        for filtros, descricao in tentativas:
+            resumo, n = self.consultar(*filtros)
+            if n:
+                return resumo, n, descricao
+        return resumo, 0, tentativas[-1][1]
+
+    def salvar(self, caminho):
+        """Grava a tabela em Parquet (gravação atômica), com o valor base e as faixas de dosagem nos metadados."""
+        tabela = pa.Table.from_pandas(self.tabela, preserve_index=False)
+        metadados = {"valor_base": self.valor_base, "limites_dosagem": self.limites_dosagem, "classe": self.classe,
+                     "ligacao": self.ligacao}
+        tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}),
+                                                 b"cubo_shap": json.dumps(metadados).encode("utf-8")})
+        pq.write_table(tabela, caminho + ".tmp")
+        os.replace(caminho + ".tmp", caminho)
+        return caminho
+
+    @classmethod
+    def carregar(cls, caminho):
+        """Lê o cubo gravado por salvar."""
+        tabela = pq.read_table(caminho)
+        metadados = json.loads(tabela.schema.metadata[b"cubo_shap"])
+        return cls(tabela.to_pandas(), metadados["valor_base"], metadados["limites_dosagem"], metadados["classe"],
+                   metadados.get("ligacao", "identity"))
+
+
+_explicador_cubo = None
+
+
+def _iniciar_processo_shap(modelo, classe):
+    """Cria o TreeExplainer uma única vez em cada processo do cálculo do cubo."""
+    global _explicador_cubo
+    _explicador_cubo = ExplicadorSHAP(modelo, tamanho_cache=0, classe=classe)
+
+
+def _explicar_bloco(matriz):
+    """Valores SHAP de um bloco de linhas (executado nos processos do cálculo do cubo)."""
+    return _explicador_cubo._calcular(matriz)
+
+
+def calcular_cubo_shap(modelo, X, grupos, dosagens, processos=None, tamanho_bloco=256, classe=1):
+    """
+    Calcula os valores SHAP de todas as linhas de treino em blocos distribuídos entre processos e os agrega no CuboSHAP.
+    As features são categóricas codificadas e dosagens repetidas, então o TreeSHAP é executado apenas nas linhas distintas
+    e o resultado de cada uma é reaproveitado pelas suas repetições.
+    Parâmetros:
+      modelo: Modelo de árvores servido.
+      X (DataFrame): Features codificadas do treino, na ordem de COLUNAS_MODELO.
+      grupos (DataFrame): "Therapeutic Class" e "Action Class" de cada linha (categorias já limitadas, sem codificação).
+      dosagens (array): Dosagem original (sem escalonamento) de cada linha.
+      processos (int): Quantidade de processos (se omitido, um por núcleo).
+      tamanho_bloco (int): Linhas distintas por tarefa (o TreeSHAP leva dezenas de milissegundos por linha).
+      classe (int): Classe explicada.
+    Retorno: cubo (CuboSHAP): Tabela agregada por grupo e feature.
+    """
+    colunas = list(X.columns)
+    distintas, inversas = np.unique(np.asarray(X, dtype=float), axis=0, return_inverse=True)
+    blocos = [distintas[inicio:inicio + tamanho_bloco] for inicio in range(0, len(distintas), tamanho_bloco)]
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo_shap, initargs=(modelo, classe)) as executor:
+        shap_values = np.vstack(list(executor.map(_explicar_bloco, blocos)))[inversas.ravel()]
+
+    limites = limites_dosagem(dosagens)
+    celulas = [pd.Series(np.asarray(grupos["Therapeutic Class"], dtype=object), name="Therapeutic Class"),
+               pd.Series(np.asarray(grupos["Action Class"], dtype=object), name="Action Class"),
+               pd.Series(faixas_dosagem(dosagens, limites), name="faixa_dosagem")]
+    # Médias com sinal e do valor absoluto de cada feature por grupo, em formato longo (grupo, feature)
+    medias = [pd.DataFrame(valores, columns=colunas).groupby(celulas, sort=True).mean()
+              .melt(ignore_index=False, var_name="feature", value_name=nome)
+              for valores, nome in ((shap_values, "media"), (np.abs(shap_values), "media_abs"))]
+    tabela = medias[0].assign(media_abs=medias[1]["media_abs"].to_numpy())
+    tabela = tabela.join(pd.Series(1, index=range(len(shap_values))).groupby(celulas).size().rename("n")).reset_index()
+    tabela = tabela.astype({**{coluna: "category" for coluna in DIMENSOES_CUBO_SHAP + ["feature"]},
+                            "n": np.int32, "media_abs": np.float32, "media": np.float32})
+    explicador = ExplicadorSHAP(modelo, tamanho_cache=0, classe=classe)
+    return CuboSHAP(tabela.loc[:, DIMENSOES_CUBO_SHAP + ["feature", "n", "media_abs", "media"]], explicador.expected_value,
+                    limites, classe, explicador.ligacao)
+
+
+def exportar_cubo_shap(diretorio="objects", dados="medicamentos_final.csv", tamanho_teste=0.2, semente=42, processos=None):
+    """
+    Calcula o cubo SHAP do modelo servido no conjunto de treino e o grava em objects/.
+    O conjunto de treino é reconstruído com a mesma divisão estratificada do treinamento (mesma proporção e semente).
+    Parâmetros:
+      diretorio (str): Pasta dos artefatos do modelo.
+      dados (str): Conjunto usado no treinamento (medicamentos_final.csv, com a coluna HighRisk).
+      tamanho_teste, semente: Parâmetros da divisão em treino/teste usados no treinamento.
+      processos (int): Quantidade de processos do TreeSHAP (se omitido, um por núcleo).
+    Retorno: cubo (CuboSHAP): Cubo gravado em objects/cubo_shap.parquet.
+    """
+    from sklearn.model_selection import train_test_split
+
+    artefatos = carregar_artefatos(diretorio)
+    dados = pd.read_csv(dados)
+    treino, _ = train_test_split(dados, test_size=tamanho_teste, random_state=semente, stratify=dados["HighRisk"])
+    X, erros = codificar_lote(treino, artefatos)
+    if (erros != "").any():
+        raise ValueError(f"{int((erros != '').sum())} linhas do conjunto de treino não correspondem aos encoders: {erros[erros != ''].iloc[0]}")
+    grupos = artefatos["limitador"].transform(treino.loc[:, artefatos["colunas"]])
+    cubo = calcular_cubo_shap(artefatos["modelo"], X, grupos, treino["dosage"], processos)
+    cubo.salvar(os.path.join(diretorio, ARQUIVO_CUBO_SHAP))
+    return cubo
+
+
+@cache_resource(max_entries=1, show_spinner=False)
+def _carregar_cubo_shap(caminho, versao):
+    """Lê o cubo uma única vez para cada versão do arquivo."""
+    return CuboSHAP.carregar(caminho)
+
+
+@instrumentar
+def carregar_cubo_shap(diretorio="objects"):
+    """
+    Retorna o cubo SHAP compartilhado entre as sessões, recarregado quando o arquivo é regerado.
+    Parâmetros: diretorio (str): Pasta dos artefatos.
+    Retorno: cubo (CuboSHAP): Cubo do modelo, ou None se ainda não foi calculado para o modelo atual (python construir_dados.py cubo_shap).
+    """
+    caminho = os.path.join(diretorio, ARQUIVO_CUBO_SHAP)
+    modelo = os.path.join(diretorio, "best_model.joblib")
+    if not os.path.exists(caminho) or (os.path.exists(modelo) and os.path.getmtime(caminho) < os.path.getmtime(modelo)):
+        return None #Cubo ainda não calculado ou de um modelo anterior
+    return _carregar_cubo_shap(caminho, assinatura_arquivos([caminho]))
+
+
+@instrumentar
+def figura_cubo_shap(resumo, geral, ligacao="identity"):
+    """
+    Gráfico de barras da importância média (|SHAP|) de cada feature no grupo do medicamento e em todo o treino,
+    com a direção média (SHAP com sinal) no texto de cada barra.
+    O eixo indica a escala dos valores SHAP do cubo (ligacao: "identity" = probabilidade, "logit" = log-odds).
+    """
+    import plotly.express as px
+
+    dados = pd.concat([resumo.assign(grupo="Grupo do medicamento"), geral.assign(grupo="Todo o treino")]).reset_index()
+    figura = px.bar(dados, x="feature", y="media_abs", color="grupo", barmode="group",
+                    color_discrete_sequence=["#2268EE", "#33A6F9"], text="media",
+                    category_orders={"feature": resumo.index.tolist()})
+    figura.update_traces(texttemplate="%{text:+.3f}", textposition="outside",
+                         hovertemplate="%{x}<br>|SHAP| médio: %{y:.4f}<br>SHAP médio: %{text:+.4f}")
+    escala = "log-odds" if ligacao == "logit" else "probabilidade"
+    figura.update_layout(yaxis_title=f"|SHAP| médio (impacto na {escala} de alto risco)", xaxis_title="Variável",
+                         legend_title_text="")
+    return figura
+
+
+#==========================================================================================================
+
+#Pontuação em lote de arquivos CSV
+@instrumentar
+def codificar_lote(df, artefatos):
+    """
+    Aplica o limitador de categorias, os encoders e o scaler do pacote de artefatos em um DataFrame inteiro, coluna a coluna.
+    Valores ausentes viram "Not Applicable" e categorias fora das mantidas no treinamento viram "Others", como no treinamento.
+    Categorias nunca vistas no treinamento e dosagens inválidas não interrompem o processamento:
+    o problema é registrado na série de erros da linha correspondente.
+    Parâmetros:
+      df (DataFrame): Dados com as colunas de COLUNAS_MODELO (colunas extras são ignoradas).
+      artefatos (dict): Pacote retornado por carregar_artefatos.
+    Retorno:
+      X (DataFrame): Features codificadas na ordem usada no treinamento.
+      erros (Series): Mensagem de erro por linha (string vazia para linhas válidas).
+    """
+    faltantes = [coluna for coluna in artefatos["colunas"] if coluna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Colunas ausentes no arquivo: {faltantes}")
+
+    brutos = df.loc[:, artefatos["colunas"]]
+    fora_do_treino = artefatos["limitador"].desconhecidas(brutos) #Categorias nunca vistas no treinamento (não viram "Others")
+    df = artefatos["limitador"].transform(brutos) #Mesmo agrupamento de categorias do treinamento
+    X = pd.DataFrame(index=df.index)
+    erros = pd.Series("", index=df.index, dtype=object)
+    for coluna in CATEGORICAS:
+        classes = artefatos["encoders"][coluna].classes_
+        codigos = pd.Categorical(df[coluna], categories=classes).codes #Categorias fora do encoder recebem -1
+        desconhecidas = (codigos < 0) | fora_do_treino.get(coluna, False)
+        if desconhecidas.any():
+            erros[desconhecidas] += f"{coluna} desconhecida: " + brutos.loc[desconhecidas, coluna].astype(str) + "; " #Valor enviado, antes do agrupamento
+        X[coluna] = codigos.astype(np.int64)
+
+    dosagem = pd.to_numeric(df["dosage"], errors="coerce")
+    invalidas = dosagem.isna().to_numpy()
+    if invalidas.any():
+        erros[invalidas] += "dosage inválida; "
+    X["dosage"] = artefatos["scaler"].transform(pd.DataFrame({"dosage": dosagem.fillna(0)}))[:, 0]
+    return X, erros
+
+
+def pontuar_lote(arquivo, artefatos, tamanho_lote=10000, com_shap=False):
+    """
+    Lê um CSV de medicamentos candidatos em partes e gera as previsões de cada parte.
+    A floresta compacta é avaliada uma única vez por parte (vetorizada) e as linhas com erro
+    são reportadas na coluna "erro" sem abortar o processamento.
+    Parâmetros:
+      arquivo (str ou buffer): Caminho ou arquivo aberto no formato CSV.
+      artefatos (dict): Pacote retornado por carregar_artefatos.
+      tamanho_lote (int): Quantidade de linhas lidas por vez.
+      com_shap (bool): Se True, adiciona as colunas shap_<coluna> com as contribuições de cada feature
+        para a classe prevista (a mesma da coluna "probabilidade").
+    Retorno (gerador): DataFrames com as colunas originais mais "previsao", "probabilidade" e "erro".
+    """
+    floresta = artefatos["floresta"]
+    explicador = obter_explicador(artefatos) if com_shap else None
+    for lote in pd.read_csv(arquivo, chunksize=tamanho_lote):
+        X, erros = codificar_lote(lote, artefatos)
+        validas = (erros == "").to_numpy()
+        lote["previsao"] = pd.Series(pd.NA, index=lote.index, dtype="Int64")
+        lote["probabilidade"] = np.nan
+        if com_shap:
+            for coluna in artefatos["colunas"]:
+                lote[f"shap_{coluna}"] = np.nan
+
+        if validas.any():
+            X_validas = X.loc[validas, artefatos["colunas"]]
+            probabilidades = floresta.predict_proba(X_validas.to_numpy())
+            indices = probabilidades.argmax(axis=1)
+            lote.loc[validas, "previsao"] = floresta.classes[indices]
+            lote.loc[validas, "probabilidade"] = probabilidades[np.arange(len(indices)), indices]
+            if com_shap:
+                valores_shap, _ = explicador.explicar(X_validas)
+                # Modelo binário: as contribuições para uma classe são as da outra com o sinal trocado
+                # (as probabilidades somam 1; na margem em log-odds, idem), então basta ajustar o sinal pela classe prevista
+                valores_shap = valores_shap * np.where(indices == explicador.classe, 1.0, -1.0)[:, None]
+                lote.loc[validas, [f"shap_{coluna}" for coluna in artefatos["colunas"]]] = valores_shap
+
+        lote["erro"] = erros
+        yield lote
+
+
+
+#================================================================================
+
+#Floresta Compacta (RandomForest achatado em arrays contíguos)
+DIRETORIO_FLORESTA = "floresta_compacta"
+_PERCURSO_NUMBA = None
+
+
+def _percurso_numba():
+    """
+    Compila uma única vez (com cache em disco) o percurso das árvores com numba, já instalado como dependência do shap.
+    Retorno: a função compilada, ou None se o numba não estiver disponível (a avaliação usa então apenas numpy).
+    """
+    global _PERCURSO_NUMBA
+    if _PERCURSO_NUMBA is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _PERCURSO_NUMBA = False
+        else:
+            @njit(cache=True, nogil=True)
+            def percorrer(X, filhos, atributos, limiares, valores, raizes, saida):
+                # Árvore a árvore (os nós da árvore atual ficam no cache do processador), somando na ordem do sklearn
+                saida[:] = 0.0
+                for arvore in range(raizes.shape[0]):
+                    for linha in range(X.shape[0]):
+                        no = raizes[arvore]
+                        while True:
+                            proximo = filhos[2 * no + (1 if X[linha, atributos[no]] > limiares[no] else 0)]
+                            if proximo == no:
+                                break
+                            no = proximo
+                        for classe in range(valores.shape[1]):
+                            saida[linha, classe] += valores[no, classe]
+                saida /= raizes.shape[0]
+            _PERCURSO_NUMBA = percorrer
+    return _PERCURSO_NUMBA or None
+
+
+def _limiares_float32(limiares):
+    """
+    Maior float32 menor ou igual a cada limiar. Como o RandomForest compara as features em float32,
+    x <= limiar e x <= limiar_float32 têm o mesmo resultado para qualquer x: a quantização não altera as previsões.
+    """
+    quantizados = limiares.astype(np.float32)
+    acima = quantizados.astype(np.float64) > limiares
+    quantizados[acima] = np.nextafter(quantizados[acima], np.float32(-np.inf))
+    return quantizados
+
+
+class FlorestaCompacta:
+    """
+    Representação achatada de um RandomForestClassifier: todas as árvores concatenadas em arrays contíguos
+    (filhos, atributo e limiar de cada nó e probabilidades das folhas), com as folhas apontando para si mesmas.
+    A avaliação usa um percurso compilado com numba quando disponível e, caso contrário, numpy:
+    todos os pares (linha, árvore) avançam juntos um nível por iteração.
+    Salva como arquivos .npy + metadados JSON, pode ser carregada com mmap e compartilhada entre processos.
+    As probabilidades são idênticas às de predict_proba.
+    Parâmetros:
+        - filhos (ndarray): Pares (esquerda, direita) de cada nó, com índices globais.
+        - atributos (ndarray): Feature comparada em cada nó (0 nas folhas).
+        - limiares (ndarray): Limiar de cada nó (infinito nas folhas).
+        - valores (ndarray): Probabilidades de cada classe em cada nó (usadas apenas nas folhas).
+        - raizes (ndarray): Nó raiz de cada árvore.
+        - classes (array): Classes do modelo.
+        - profundidade (int): Profundidade máxima das árvores.
+    """
+
+    def __init__(self, filhos, atributos, limiares, valores, raizes, classes, profundidade):
+        self.filhos = filhos
+        self.atributos = atributos
+        self.limiares = limiares
+        self.valores = valores
+        self.raizes = raizes
+        self.classes = np.asarray(classes)
+        self.profundidade = int(profundidade)
+
+    @staticmethod
+    def suporta(modelo):
+        """Indica se o modelo é uma floresta de classificação do sklearn (a média das probabilidades das árvores)."""
+        from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+        return isinstance(modelo, (RandomForestClassifier, ExtraTreesClassifier))
+
+    @classmethod
+    def exportar(cls, modelo, dominios=None, quantizar=True, podar=True):
+        """
+        Achata um RandomForestClassifier treinado.
+        Parâmetros:
+          - modelo (RandomForestClassifier): Modelo treinado.
+          - dominios (dict): {posição da feature: (mínimo, máximo)} dos valores possíveis (ex.: códigos dos encoders).
+          - quantizar (bool): Armazena os limiares em float32 (sem alterar nenhuma previsão).
+          - podar (bool): Remove os ramos inalcançáveis, dado o domínio das features e os limiares dos nós ancestrais.
+        Retorno (FlorestaCompacta): Floresta achatada.
+        """
+        n_atributos = modelo.n_features_in_
+        n_classes = len(modelo.classes_)
+        minimos = [-np.inf] * n_atributos #Intervalo aberto à esquerda: x > mínimo
+        maximos = [np.inf] * n_atributos  #Intervalo fechado à direita: x <= máximo
+        for posicao, (minimo, maximo) in (dominios or {}).items():
+            minimos[posicao] = float(np.nextafter(np.float32(minimo), np.float32(-np.inf)))
+            maximos[posicao] = float(maximo)
+
+        filhos, atributos, limiares, valores, raizes = [], [], [], [], []
+        profundidade, total = 0, 0
+        for estimador in modelo.estimators_:
+            arvore = estimador.tree_
+            esquerda, direita = arvore.children_left, arvore.children_right
+            atributo, limiar = arvore.feature, arvore.threshold
+            originais, filhos_arvore = [], []
+            pilha = [(0, tuple(minimos), tuple(maximos), None, 0)]
+            while pilha:
+                no, inferiores, superiores, destino, nivel = pilha.pop()
+                while podar and esquerda[no] >= 0: #Nós em que apenas um dos lados é alcançável são substituídos por esse lado
+                    if superiores[atributo[no]] <= limiar[no]:
+                        no = esquerda[no]
+                    elif inferiores[atributo[no]] >= limiar[no]:
+                        no = direita[no]
+                    else:
+                        break
+                novo = len(originais)
+                originais.append(no)
+                filhos_arvore.append([novo + total, novo + total])
+                if destino is not None:
+                    filhos_arvore[destino[0]][destino[1]] = novo + total
+                profundidade = max(profundidade, nivel)
+                if esquerda[no] >= 0:
+                    f, t = atributo[no], limiar[no]
+                    pilha.append((direita[no], inferiores[:f] + (max(inferiores[f], t),) + inferiores[f + 1:], superiores, (novo, 1), nivel + 1))
+                    pilha.append((esquerda[no], inferiores, superiores[:f] + (min(superiores[f], t),) + superiores[f + 1:], (novo, 0), nivel + 1))
+
+            originais = np.asarray(originais)
+            folhas = esquerda[originais] < 0
+            valor = arvore.value[originais, 0, :n_classes]
+            normalizador = valor.sum(axis=1)[:, np.newaxis]
+            normalizador[normalizador == 0.0] = 1.0 #Mesma normalização de DecisionTreeClassifier.predict_proba
+            raizes.append(total)
+            filhos.append(np.asarray(filhos_arvore).ravel())
+            atributos.append(np.where(folhas, 0, atributo[originais]))
+            limiares.append(np.where(folhas, np.inf, limiar[originais]))
+            valores.append(valor / normalizador)
+            total += len(originais)
+
+        limiares = np.concatenate(limiares)
+        return cls(filhos=np.concatenate(filhos).astype(np.int32),
+                   atributos=np.concatenate(atributos).astype(np.min_scalar_type(n_atributos)),
+                   limiares=_limiares_float32(limiares) if quantizar else limiares,
+                   valores=np.concatenate(valores),
+                   raizes=np.asarray(raizes, dtype=np.int32),
+                   classes=modelo.classes_, profundidade=profundidade)
+
+    @property
+    def n_nos(self):
+        return len(self.atributos)
+
+    @property
+    def nbytes(self):
+        """Tamanho total dos arrays, em bytes."""
+        return sum(array.nbytes for array in (self.filhos, self.atributos, self.limiares, self.valores, self.raizes))
+
+    def salvar(self, diretorio):
+        """Grava cada array em um arquivo .npy (mapeável em memória) e os metadados em JSON."""
+        os.makedirs(diretorio, exist_ok=True)
+        for nome in ("filhos", "atributos", "limiares", "valores", "raizes"):
+            np.save(os.path.join(diretorio, f"{nome}.npy"), getattr(self, nome))
+        with open(os.path.join(diretorio, "metadados.json"), "w", encoding="utf-8") as arquivo:
+            json.dump({"classes": self.classes.tolist(), "profundidade": self.profundidade, "n_nos": self.n_nos}, arquivo)
+        return diretorio
+
+    @classmethod
+    def carregar(cls, diretorio, mmap_mode="r"):
+        """Carrega uma floresta salva com salvar (por padrão, com os arrays mapeados em memória)."""
+        with open(os.path.join(diretorio, "metadados.json"), encoding="utf-8") as arquivo:
+            metadados = json.load(arquivo)
+        arrays = {nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode=mmap_mode)
+                  for nome in ("filhos", "atributos", "limiares", "valores", "raizes")}
+        return cls(**arrays, classes=metadados["classes"], profundidade=metadados["profundidade"])
+
+    def folhas(self, X):
+        """Folha alcançada em cada árvore por cada linha (matriz linhas x árvores), avaliada apenas com numpy."""
+        X = np.asarray(X, dtype=np.float32) #O RandomForest compara as features em float32
+        n_arvores = len(self.raizes)
+        folha = np.isinf(self.limiares)
+        nos = np.tile(self.raizes.astype(np.intp), len(X))
+        # Apenas os pares (linha, árvore) que ainda não chegaram a uma folha continuam sendo avançados
+        pares = np.flatnonzero(~folha[nos])
+        atuais = nos[pares]
+        inicios = (pares // n_arvores) * X.shape[1]
+        valores_X = X.ravel()
+        while len(pares):
+            atuais = self.filhos[2 * atuais + (valores_X[inicios + self.atributos[atuais]] > self.limiares[atuais])]
+            chegaram = folha[atuais]
+            nos[pares[chegaram]] = atuais[chegaram]
+            pares, atuais, inicios = pares[~chegaram], atuais[~chegaram], inicios[~chegaram]
+        return nos.reshape(len(X), n_arvores)
+
+    def predict_proba(self, X, tamanho_lote=4096):
+        """Probabilidades de cada classe (idênticas às de RandomForestClassifier.predict_proba)."""
+        X = np.ascontiguousarray(X, dtype=np.float32) #O RandomForest compara as features em float32
+        probabilidades = np.empty((len(X), len(self.classes)))
+        percorrer = _percurso_numba()
+        if percorrer is not None:
+            percorrer(X, self.filhos, self.atributos, self.limiares, self.valores, self.raizes, probabilidades)
+            return probabilidades
+        for inicio in range(0, len(X), tamanho_lote): #Lotes limitam as matrizes intermediárias (linhas x árvores)
+            folhas = self.folhas(X[inicio:inicio + tamanho_lote])
+            #Soma acumulada na ordem das árvores, como no predict_proba do sklearn
+            probabilidades[inicio:inicio + tamanho_lote] = self.valores[folhas].cumsum(axis=1)[:, -1] / len(self.raizes)
+        return probabilidades
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def prever_linha(self, x):
+        """Classe e probabilidades de uma única linha (vetor de features)."""
+        probabilidades = self.predict_proba(np.reshape(x, (1, -1)))[0]
+        return self.classes[np.argmax(probabilidades)], probabilidades
+
+
+class ModeloDireto:
+    """
+    Mesma interface da FlorestaCompacta (classes, predict_proba, predict e prever_linha) para modelos que não são
+    florestas do sklearn, como um XGBoost ou LightGBM vencedor da seleção de modelos: as previsões usam o próprio modelo.
+    Parâmetros: modelo: Classificador treinado com predict_proba.
+    """
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.classes = np.asarray(modelo.classes_)
+
+    def predict_proba(self, X, tamanho_lote=None):
+        return np.asarray(self.modelo.predict_proba(np.asarray(X, dtype=float)), dtype=float)
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def prever_linha(self, x):
+        """Classe e probabilidades de uma única linha (vetor de features)."""
+        probabilidades = self.predict_proba(np.reshape(x, (1, -1)))[0]
+        return self.classes[np.argmax(probabilidades)], probabilidades
+
+
+def dominios_encoders(encoders):
+    """Domínio (menor e maior código) de cada feature categórica, na ordem de COLUNAS_MODELO."""
+    return {COLUNAS_MODELO.index(coluna): (0, len(encoder.classes_) - 1) for coluna, encoder in encoders.items()}
+
+
+def exportar_floresta(diretorio="objects", quantizar=True, podar=True):
+    """
+    Exporta o best_model.joblib da pasta de artefatos para a floresta compacta (objects/floresta_compacta).
+    Parâmetros:
+      diretorio (str): Pasta dos artefatos.
+      quantizar, podar (bool): Opções de FlorestaCompacta.exportar.
+    Retorno (FlorestaCompacta): Floresta exportada (None se o modelo não for uma floresta do sklearn, servido por ModeloDireto).
+    """
+    modelo = load(os.path.join(diretorio, "best_model.joblib"))
+    if not FlorestaCompacta.suporta(modelo):
+        return None
+    encoders = {coluna: load(os.path.join(diretorio, f"encoder_{coluna}.joblib")) for coluna in CATEGORICAS}
+    floresta = FlorestaCompacta.exportar(modelo, dominios_encoders(encoders), quantizar, podar)
+    floresta.salvar(os.path.join(diretorio, DIRETORIO_FLORESTA))
+    return floresta
+
+
+#================================================================================
+
+#Inferência Compilada (uma linha por requisição, sem pandas)
+class InferenciaCompilada:
+    """
+    Caminho de inferência de baixa latência para uma única linha, montado uma vez a partir do pacote de artefatos.
+    As categorias são convertidas em códigos por dicionários pré-calculados (no lugar de LabelEncoder.transform),
+    a dosagem é escalonada por uma operação afim direto em uma linha numpy pré-alocada (uma por thread)
+    e classe e probabilidades saem de uma única passagem pela floresta compacta (FlorestaCompacta),
+    com probabilidades idênticas às de predict_proba.
+    Parâmetros:
+        - artefatos (dict): Pacote retornado por carregar_artefatos.
+    """
+
+    def __init__(self, artefatos):
+        self.colunas = list(artefatos["colunas"])
+        self.limitador = artefatos["limitador"]
+        self.codigos = {coluna: {classe: codigo for codigo, classe in enumerate(encoder.classes_)}
+                        for coluna, encoder in artefatos["encoders"].items()}
+        self.posicoes_categoricas = [(self.colunas.index(coluna), coluna) for coluna in CATEGORICAS]
+        self.posicao_dosagem = self.colunas.index("dosage")
+        scaler = artefatos["scaler"]
+        self.media = float(scaler.mean_[0]) if scaler.with_mean else 0.0
+        self.escala = float(scaler.scale_[0]) if scaler.with_std else 1.0
+        self.floresta = artefatos["floresta"]
+        self.classes = self.floresta.classes
+        self._local = threading.local()
+
+    def _linha(self):
+        """Linha pré-alocada da thread atual (as sessões do Streamlit rodam em threads distintas)."""
+        linha = getattr(self._local, "linha", None)
+        if linha is None:
+            linha = self._local.linha = np.empty(len(self.colunas))
+        return linha
+
+    def codificar(self, valores):
+        """
+        Converte os valores de entrada na linha de features do modelo.
+        Parâmetros: valores (dict): Valor de cada coluna de COLUNAS_MODELO.
+        Retorno: linha (ndarray): Linha pré-alocada (reutilizada na próxima chamada da mesma thread; copie se precisar guardar).
+        """
+        linha = self._linha()
+        for posicao, coluna in self.posicoes_categoricas:
+            valor = self.limitador.limitar_valor(coluna, valores[coluna]) #None para categorias nunca vistas no treinamento
+            try:
+                linha[posicao] = self.codigos[coluna][valor]
+            except KeyError:
+                raise ValueError(f"Valor desconhecido em '{coluna}': {valores[coluna]!r}") from None
+        linha[self.posicao_dosagem] = (float(valores["dosage"]) - self.media) / self.escala
+        return linha
+
+    def prever_linha(self, linha):
+        """Classe prevista e probabilidades de uma linha já codificada, com uma única passagem pela floresta."""
+        return self.floresta.prever_linha(linha)
+
+    def prever(self, valores):
+        """Codifica os valores de entrada e retorna a classe prevista e as probabilidades."""
+        return self.prever_linha(self.codificar(valores))
+
+
+@cache_resource(max_entries=1, show_spinner=False)
+def _obter_inferencia(versao, _artefatos):
+    """Compila o caminho de inferência uma única vez para cada versão do pacote de artefatos."""
+    return InferenciaCompilada(_artefatos)
+
+
+@instrumentar
+def obter_inferencia(artefatos):
+    """
+    Retorna o caminho de inferência compilado compartilhado entre as sessões.
+    Parâmetros: artefatos (dict): Pacote retornado por carregar_artefatos.
+    Retorno: inferencia (InferenciaCompilada): Inferência de uma linha sem pandas.
+    """
+    return _obter_inferencia(artefatos["versao"], artefatos)
+
+
+#================================================================================
+
+#Custo de Importação dos Módulos (tempo de inicialização das páginas)
+def custo_importacoes(codigo="import funcoes", executavel=sys.executable):
+    """
+    Mede o custo de cada importação em um interpretador novo (python -X importtime),
+    sem interferência dos módulos já carregados no processo atual.
+    Parâmetros:
+      codigo (str): Código executado na medição (por padrão, a importação deste módulo).
+      executavel (str): Interpretador Python utilizado.
+    Retorno (DataFrame): Colunas modulo, nivel, proprio_ms e acumulado_ms, ordenadas pelo custo acumulado.
+    Exemplo (teste de regressão em tests/test_importacoes.py): assert "shap" not in set(custo_importacoes()["modulo"])
+    """
+    processo = subprocess.run([executavel, "-X", "importtime", "-c", codigo], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        raise RuntimeError(f"Falha ao executar '{codigo}': {processo.stderr.strip().splitlines()[-1:]}")
+
+    registros = []
+    for linha in processo.stderr.splitlines():
+        encontrado = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)", linha)
+        if encontrado:
+            proprio, acumulado, recuo, modulo = encontrado.groups()
+            registros.append((modulo, (len(recuo) - 1) // 2, int(proprio) / 1000, int(acumulado) / 1000))
+    custos = pd.DataFrame(registros, columns=["modulo", "nivel", "proprio_ms", "acumulado_ms"])
+    return custos.sort_values("acumulado_ms", ascending=False, ignore_index=True)
@@ -0,0 +1,116 @@
+"""
+Gerador de carga local para o serviço HTTP (servico.py): mede a vazão e a latência (p50, p90 e p99)
+das rotas /predict e /explain com linhas sorteadas entre as categorias conhecidas pelos encoders.
+
+Com --concorrencia, cada cliente envia a próxima requisição assim que recebe a resposta (carga fechada);
+com --taxa, as requisições são enviadas em ritmo fixo, independente das respostas (carga aberta),
+o que revela as filas e as respostas 503 quando o serviço não acompanha a taxa pedida.
+
+Uso:
+    python gerador_carga.py --rota /predict --concorrencia 64 --duracao 20
+    python gerador_carga.py --rota /explain --taxa 300 --duracao 20 --saida carga.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+import numpy as np
+from joblib import load
+from tornado.httpclient import AsyncHTTPClient
+from funcoes import CATEGORICAS
+
+
+def corpos_requisicoes(objetos, quantidade, semente=42):
+    """Corpos JSON de requisições válidas, com categorias sorteadas entre as classes de cada encoder."""
+    rng = np.random.default_rng(semente)
+    classes = {coluna: load(os.path.join(objetos, f"encoder_{coluna}.joblib")).classes_.tolist() for coluna in CATEGORICAS}
+    dosagens = [0, 5, 10, 20, 50, 100, 250, 500, 650, 1000]
+    corpos = []
+    for _ in range(quantidade):
+        valores = {coluna: opcoes[rng.integers(len(opcoes))] for coluna, opcoes in classes.items()}
+        valores["dosage"] = dosagens[rng.integers(len(dosagens))]
+        corpos.append(json.dumps(valores))
+    return corpos
+
+
+async def enviar(cliente, url, corpo, timeout, latencias, status):
+    inicio = time.perf_counter()
+    resposta = await cliente.fetch(url, method="POST", body=corpo, raise_error=False, request_timeout=timeout)
+    latencias.append(time.perf_counter() - inicio)
+    status[resposta.code] += 1 #599: tempo esgotado ou falha de conexão
+
+
+async def carga_fechada(cliente, url, corpos, concorrencia, duracao, timeout, latencias, status):
+    """Cada um dos clientes envia uma nova requisição assim que a anterior é respondida."""
+    fim = time.perf_counter() + duracao
+
+    async def usuario(numero):
+        while time.perf_counter() < fim:
+            await enviar(cliente, url, corpos[numero % len(corpos)], timeout, latencias, status)
+            numero += concorrencia
+
+    await asyncio.gather(*(usuario(numero) for numero in range(concorrencia)))
+
+
+async def carga_aberta(cliente, url, corpos, taxa, duracao, timeout, latencias, status):
+    """As requisições são disparadas a cada 1/taxa segundos, sem esperar as respostas anteriores."""
+    inicio = time.perf_counter()
+    tarefas = []
+    for numero in range(int(taxa * duracao)):
+        espera = inicio + numero / taxa - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        tarefas.append(asyncio.ensure_future(enviar(cliente, url, corpos[numero % len(corpos)], timeout, latencias, status)))
+    await asyncio.gather(*tarefas)
+
+
+async def executar(args):
+    corpos = corpos_requisicoes(args.objetos, args.corpos, args.semente)
+    AsyncHTTPClient.configure(None, max_clients=args.conexoes)
+    cliente = AsyncHTTPClient()
+    url = args.url.rstrip("/") + args.rota
+    latencias, status = [], Counter()
+
+    inicio = time.perf_counter()
+    if args.taxa:
+        await carga_aberta(cliente, url, corpos, args.taxa, args.duracao, args.timeout, latencias, status)
+    else:
+        await carga_fechada(cliente, url, corpos, args.concorrencia, args.duracao, args.timeout, latencias, status)
+    duracao = time.perf_counter() - inicio
+
+    latencias = np.array(latencias) * 1e3
+    sucesso = status.get(200, 0)
+    p50, p90, p99 = np.percentile(latencias, [50, 90, 99]) if len(latencias) else (np.nan,) * 3
+    resultado = {"rota": args.rota, "modo": f"taxa {args.taxa}/s" if args.taxa else f"concorrência {args.concorrencia}",
+                 "duracao_s": duracao, "requisicoes": len(latencias), "vazao_rps": sucesso / duracao,
+                 "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "status": {str(codigo): n for codigo, n in sorted(status.items())}}
+    print(f"{args.rota} ({resultado['modo']}): {len(latencias):,} requisições em {duracao:.1f}s | "
+          f"vazão {resultado['vazao_rps']:,.0f} respostas 200/s | p50 {p50:.1f} ms | p90 {p90:.1f} ms | p99 {p99:.1f} ms | "
+          f"status {resultado['status']}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para o serviço HTTP de previsão.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rota", choices=["/predict", "/explain"], default="/predict")
+    parser.add_argument("--concorrencia", type=int, default=32, help="Clientes simultâneos (carga fechada).")
+    parser.add_argument("--taxa", type=float, help="Requisições por segundo (carga aberta; substitui --concorrencia).")
+    parser.add_argument("--duracao", type=float, default=10.0, help="Duração da carga, em segundos.")
+    parser.add_argument("--conexoes", type=int, default=256, help="Conexões HTTP simultâneas do cliente.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Tempo máximo de cada requisição, em segundos.")
+    parser.add_argument("--corpos", type=int, default=5000, help="Quantidade de linhas distintas sorteadas.")
+    parser.add_argument("--objetos", default="objects", help="Pasta com os encoders do modelo.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="Arquivo JSON com o resumo da carga.")
+    args = parser.parse_args()
+    asyncio.run(executar(args))
+
+
+if __name__ == "__main__":
+    main()
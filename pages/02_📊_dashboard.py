@@ -1,7 +1,7 @@
 import streamlit as st
 from funcoes import *
 
-
+medir_pagina("dashboard") #Duração de cada execução da página (métricas exportadas pelo funcoes)
 #Configuração da página
 st.set_page_config(page_title="Dashboards para Análises de Medicamentos", layout="wide")
 st.title(":blue[Pharma Insights (Dashboard)]")
@@ -9,15 +9,27 @@ st.title(":blue[Pharma Insights (Dashboard)]")
 #Configuração da Barra Lateral
 with st.sidebar:
     with st.expander("Expanda para filtrar os medicamentos", expanded=True):
-        efeitos = pd.read_csv("effects.csv")
-        dados = load_data("medicamentos.csv") #Carregamento do conjunto de dados
-        dados = pd.concat((dados, efeitos["n_effects"]), axis=1) #Concatenar os efeitos ao conjunto de dados        
-        del efeitos #Deletar o dataframe efeitos para evitar confusão e sobrecarga de memória
-        medicamento = st.text_input("Insira um medicamento para analisar", "allegra", help="Digite o nome do medicamento\
+        dados = carregar_tabela_medicamentos() #Tabela unida e verificada de medicamentos e efeitos (compartilhada entre as sessões)
+        indice = obter_indice_nomes(dados) #Índice dos nomes (construído uma única vez por versão do arquivo)
+        rede = obter_grafo_substitutos(dados) #Rede de substitutos (construída uma única vez por versão do arquivo)
+        st.session_state.setdefault("medicamento", "allegra") #Valor inicial (as sugestões abaixo alteram o texto pela chave)
+        medicamento = st.text_input("Insira um medicamento para analisar", key="medicamento", help="Digite o nome do medicamento\
                                     \n(ou parte dele) para analisar" ) #Medicamento a ser analisado        
-        if not dados["name"].str.contains(medicamento).any(): #Verifica se o medicamento existe no dataframe
-            st.error("Medicamento não encontrado nos dados disponíveis. Por favor, tente outro medicamento.")
-        dados, dosagens = load_and_process_data(dados, medicamento) #Tratamentos necessários no conjunto de dados        
+        if not indice.existe(medicamento): #Verifica se o medicamento existe no dataframe
+            trigramas = obter_indice_trigramas(dados) #Índice de trigramas (construído apenas no primeiro nome não encontrado)
+            corrigido = trigramas.corrigir(medicamento) #Mesmo nome com outras maiúsculas/minúsculas
+            if corrigido and indice.existe(corrigido):
+                st.caption(f"Exibindo os resultados para **{corrigido}**")
+                medicamento = corrigido
+            else:
+                st.error("Medicamento não encontrado nos dados disponíveis. Por favor, tente outro medicamento.")
+                sugestoes = trigramas.sugerir(medicamento) #Nomes parecidos, do mais para o menos parecido
+                if sugestoes:
+                    st.markdown("Você quis dizer:")
+                    for familia, _ in sugestoes:
+                        st.button(familia, key=f"sugestao_{familia}", on_click=st.session_state.update,
+                                  kwargs={"medicamento": familia})
+        posicoes, dosagens = load_and_process_data(indice, medicamento) #Posições e dosagens do medicamento pelo índice        
         filtro_dosagem = st.checkbox(":blue[Selecione para filtrar a dosagem]", help="Insira a dosagem para gerar uma visualização mais focada,\
                                      \n ou deixe em branco para gerar uma viualização de \
                                      \n todos os medicamentos com o mesmo nome.")
@@ -35,7 +47,8 @@ if processar:
         col1, col2 = st.columns([0.6,0.4], gap="large")
         with col1: 
             st.subheader("Análise de Concorrência", divider="blue")
-            dados = dados[dados["name"].str.contains(medicamento)]  # Filtrar os dados
+            posicoes = indice.buscar(medicamento)
+            dados = dados.linhas(posicoes)  # Filtrar os dados
             figura = plot_barras_st(dados, "name", "n_substitutes")
             figura.update_traces(text= dados["n_substitutes"], textposition="none",
                                    hovertemplate="Medicamento: %{x}<br>Número de Concorrentes: %{y}", textfont_size=12)
@@ -60,36 +73,17 @@ if processar:
 
         
     else: #Página exibida caso a dosagem seja selecionada       
-        dados = filter_dosage(dados, dosagem)  # Filtrar os dados
         if "n_effects" not in dados.columns:  # Verificação da coluna "n_effects"
             raise ValueError("A coluna 'n_effects' não foi encontrada no DataFrame.")
         
-
-        # Dividir o DataFrame caso o filtro resulte em mais de 2 medicamentos
-        if len(dados['name'].unique()) >= 5:
-            dados = dados.iloc[:4, :]  # Limitar a 5 medicamentos para evitar sobrecarga visual
-        if len(dados['name'].unique()) >2 and len(dados['name'].unique()) <=4:
-            st.warning("Número de medicamentos filtrados é maior que 2. Dividindo a visualização em duas partes.")        
-            
-            # Divisão do DataFrame em duas partes
-            metade = len(dados) // 2
-            dados_parte1 = dados.iloc[:metade, :]
-            dados_parte2 = dados.iloc[metade:, :]
-            
-            # Criar e exibir o primeiro grafo
-            grafo1 = criar_grafo(dados_parte1)
-            st.subheader("Parte 1")
-            st.graphviz_chart(grafo1.source, use_container_width=True)            
-            
-            # Criar e exibir o segundo grafo
-            grafo2 = criar_grafo(dados_parte2)
-            st.subheader("Parte 2")
-            st.graphviz_chart(grafo2.source, use_container_width=True)
-        else:
-            # Criar e exibir o grafo normalmente
-            st.markdown("<h2 style='text-align: left; color: #33A6F9'>Análise de Concorrentes</h2>", unsafe_allow_html=True)            
-            grafo = criar_grafo(dados)
-            st.graphviz_chart(grafo.source, use_container_width=True)      
+        # Rede de concorrentes com posições calculadas no servidor (em cache por medicamento e dosagem)
+        st.markdown("<h2 style='text-align: left; color: #33A6F9'>Análise de Concorrentes</h2>", unsafe_allow_html=True)            
+        layout = layout_concorrentes(dados, medicamento, dosagem)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Medicamentos analisados", f"{int((layout['distancias'] == 0).sum()):,}")
+        col2.metric("Concorrentes diretos", f"{int((layout['distancias'] == 1).sum()):,}")
+        col3.metric("Citações como substituto", f"{int(layout['grau_entrada'][layout['distancias'] == 0].sum()):,}")
+        st.plotly_chart(plot_rede(layout), use_container_width=True)      
         
         st.markdown("<h2 style='text-align: center;'>Descrição da Visualização</h2>", unsafe_allow_html=True)
         st.markdown("O grafo acima ilustra a relação entre os medicamentos e seus concorrentes conhecidos no mercado. \
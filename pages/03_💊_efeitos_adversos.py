@@ -1,29 +1,33 @@
 import streamlit as st
 from funcoes import *
 
-
+medir_pagina("efeitos_adversos") #Duração de cada execução da página (métricas exportadas pelo funcoes)
 #Configuração da página
 st.set_page_config(page_title="Dashboard para Análise de Medicamentos", layout="wide")
 st.title(":blue[Pharma Insights (Efeitos Adversos)]")
 
 with st.sidebar:    
-    data = load_data("effects.csv") #Carregamento do conjunto de dados
+    data = carregar_conjunto("effects.csv") #Conjunto de dados compartilhado entre as sessões (sem cópias)
     classe = st.selectbox(":blue[Selecione a classe terapêutica]", options=data["Therapeutic Class"].dropna().unique(), 
                           help="Selecione a classe terapêutica para\
                              \n visualizar os efeitos adversos dos medicamentos")
+    comparar = st.checkbox(":blue[Comparar com outra classe]", help="Selecione para comparar os efeitos adversos de duas classes terapêuticas")
+    classe_comparada = None
+    if comparar:
+        classe_comparada = st.selectbox("Classe para comparação", options=[opcao for opcao in data["Therapeutic Class"].dropna().unique() if opcao != classe])
     processar = st.button(":blue[Gerar a Nuvem de Palavras]") 
 
 st.markdown(f"<div style='font-size: 18px; font-weight: bold'>Número de Classes Terapêuticas disponíveis:\
             {data['Therapeutic Class'].dropna().nunique()}", unsafe_allow_html=True) #Exibição das classes terapêuticas disponíveis
 if processar:
         progresso = st.progress(50, text="Carregando a nuvem de palavras... Por favor aguarde um momento.")        
-        wordcloud = plot_cloud(data, classe)
+        wordcloud = nuvem_classe(data, classe) #Imagem PNG em cache (ou pré-renderizada) por classe
         progresso.progress(100, text="Processamento concluído!")
         col1, col2 = st.columns([0.75,0.25], gap="large")        
         with col1:            
             st.subheader(f"Efeitos Colaterais mais frequentes nos \
                             medicamentos da classe :blue[{classe.capitalize()}] ", divider="blue")            
-            st.pyplot(wordcloud, use_container_width=True)            
+            st.image(wordcloud, use_column_width=True)            
         
         with col2:
             st.subheader(":blue[***Análise de Efeitos Colaterais***]")
@@ -36,5 +40,9 @@ if processar:
             st.markdown("*Escolha entre as classes dispomíveis e visualize os efeitos adversos mais comuns associados a cada uma delas. \
                     \n Isso pode ajudar a identificar padrões e tendências, permitindo uma análise mais aprofundada dos riscos associados a cada classe de medicamentos.*")
             st.markdown("*Interaja com o filtro e conheça os sintomas e reações mais recorrentes para embasar decisões clínicas,\
-                         otimizando o acompanhamento e a intervenção terapêutica quando necessário.*")            
-            
\ No newline at end of file
+                         otimizando o acompanhamento e a intervenção terapêutica quando necessário.*")
+
+        if classe_comparada is not None:
+            st.subheader(f"Comparação entre :blue[{classe.capitalize()}] e :blue[{classe_comparada.capitalize()}]", divider="blue")
+            st.markdown("*Percentual de medicamentos de cada classe que citam o efeito, ordenado pelas maiores diferenças.*")
+            st.dataframe(obter_cubo_efeitos(data).comparar(classe, classe_comparada, k=15).round(1), use_container_width=True)
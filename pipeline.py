@@ -0,0 +1,398 @@
+"""
+Pipeline de construção dos conjuntos de dados e dos artefatos do modelo, com as etapas dos notebooks
+preparacao_dataset.ipynb e analise_modelagem.ipynb (limpeza, imputação KNN, efeitos colaterais, dosagem,
+limitação de categorias, codificação/escalonamento, treinamento, avaliação e cubo SHAP global).
+
+Cada etapa é memorizada em disco pelo hash do seu código, dos seus parâmetros e das chaves das etapas
+de que depende (a chave da leitura é o hash do conteúdo do arquivo original): alterar uma etapa
+recalcula apenas ela e as etapas que dependem dela. Resultados em cache só são lidos do disco
+quando alguma etapa posterior precisa ser executada ou quando são gravados como saída.
+
+Uso:
+    python pipeline.py medicine_dataset.csv
+    python pipeline.py medicine_dataset.csv --limite 30 --arvores 200
+    python pipeline.py medicine_dataset.csv --tamanho-lote 20000 --processos 4
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, dump, load
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
+from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from funcoes import (ARQUIVO_CUBO_SHAP, ARQUIVO_LIMITADOR, CATEGORICAS, PREFIXOS_CATEGORIAS, CuboSHAP, LimitadorCategorias,
+                     calcular_cubo_shap, exportar_floresta, extrair_dosagem, faixas_dosagem, limites_dosagem,
+                     montar_pacote_artefatos)
+
+
+DIRETORIO_CACHE = os.path.join("cache", "pipeline")
+
+#Correções de inconsistências nos nomes (coluna, valor original, valor corrigido)
+CORRECOES = [
+    ("use0", " Gastroesophageal reflux disease (Acid reflux)", "Treatment of Gastroesophageal reflux disease (Acid reflux)"),
+    ("use0", " Hypertension (high blood pressure)", "Treatment of Hypertension (high blood pressure)"),
+    ("use0", " Bacterial infections", "Treatment of Bacterial infections"),
+    ("Chemical Class", "Broad spectrum (Third & fourth generation cephalosporins}", "Broad Spectrum (Third & fourth generation cephalosporins)"),
+    ("Therapeutic Class", "OTHERS", "Others"),
+]
+COLUNAS_SUBSTITUTOS = [f"substitute{i}" for i in range(5)]
+COLUNAS_EFEITOS = [f"sideEffect{i}" for i in range(42)]
+COLUNAS_ML = ["use0", "Chemical Class", "Habit Forming", "Therapeutic Class", "Action Class", "n_effects", "dosage"]
+
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    """Hash (sha1) do conteúdo de um arquivo, lido em blocos."""
+    resumo = hashlib.sha1()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo principal desde o início da execução, em MB."""
+    try:
+        import resource
+    except ImportError: #Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1e6
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1e6 if sys.platform == "darwin" else pico / 1e3 #ru_maxrss em bytes no macOS e em KB no Linux
+
+
+def preencher_ausentes(df, valor="Not Applicable"):
+    """fillna que também funciona nas colunas categóricas (o valor é incluído nas categorias quando necessário)."""
+    for coluna in df.select_dtypes("category").columns:
+        if valor not in df[coluna].cat.categories:
+            df[coluna] = df[coluna].cat.add_categories(valor)
+    return df.fillna(valor)
+
+
+def corrigir_nomes(dados, correcoes=CORRECOES):
+    """Aplica as correções de inconsistências nos nomes das colunas categóricas."""
+    for coluna, original, corrigido in correcoes:
+        if coluna in dados.columns:
+            dados.loc[dados[coluna] == original, coluna] = corrigido
+    return dados
+
+
+#================================================================================
+
+#Etapas do pipeline (cada uma recebe apenas os dados e parâmetros dos quais depende)
+def ler_bruto(caminho, tamanho_lote=50000):
+    """
+    Leitura do conjunto de dados original em partes, com tipos definidos de antemão.
+    Cada parte é consumida e descartada antes da leitura da próxima: as colunas esparsas (substitute*/sideEffect*)
+    guardam apenas os códigos inteiros da parte, sobre uma união das categorias atualizada a cada parte,
+    e as colunas de texto densas são lidas como string[pyarrow] (buffers do Arrow, sem um objeto Python por valor)
+    e unidas sem cópia. A memória de pico fica próxima do tamanho do resultado tipado, e não do texto repetido.
+    """
+    colunas = pd.read_csv(caminho, nrows=0).columns
+    esparsas = [coluna for coluna in colunas if coluna.startswith(PREFIXOS_CATEGORIAS)]
+    tipos = {coluna: "category" for coluna in esparsas}
+    tipos.update({coluna: "string[pyarrow]" for coluna in colunas if coluna not in tipos and coluna != "id"})
+
+    categorias = {coluna: pd.Index([], dtype=object) for coluna in esparsas} #União das categorias, na ordem de aparição
+    codigos = {coluna: [] for coluna in esparsas}
+    densas = {coluna: [] for coluna in colunas if coluna not in tipos or tipos[coluna] != "category"}
+    for parte in pd.read_csv(caminho, dtype=tipos, chunksize=tamanho_lote):
+        for coluna in esparsas:
+            serie = parte[coluna]
+            categorias[coluna] = categorias[coluna].append(serie.cat.categories.difference(categorias[coluna], sort=False))
+            codigos[coluna].append(serie.cat.set_categories(categorias[coluna]).cat.codes.to_numpy())
+        for coluna, valores in densas.items():
+            valores.append(parte[coluna])
+        del parte, serie
+
+    dados = {}
+    for coluna in colunas: #As partes de cada coluna são liberadas assim que a coluna é montada
+        if coluna in codigos:
+            dados[coluna] = pd.Categorical.from_codes(np.concatenate(codigos.pop(coluna)), categorias.pop(coluna))
+        else:
+            dados[coluna] = pd.concat(densas.pop(coluna), ignore_index=True)
+    return pd.DataFrame(dados, copy=False) #Sem columns=: com a lista de colunas o pandas copiaria todas elas
+
+
+def limpar(dados, correcoes=CORRECOES):
+    """Remoção dos nomes duplicados e correção das inconsistências nos nomes."""
+    dados = dados.drop_duplicates(subset="name", keep="first")
+    return corrigir_nomes(dados.copy(), correcoes)
+
+
+def extrair_dosagens(dados):
+    """Dosagem (primeiro número do nome) de cada medicamento, extraída uma única vez para medicamentos.csv e medicamentos_ml.csv."""
+    return extrair_dosagem(dados["name"])
+
+
+def extrair_medicamentos(dados, dosagens):
+    """Conjunto de medicamentos e substitutos (medicamentos.csv), com a dosagem extraída do nome."""
+    medicamentos = dados.loc[:, ["name"] + COLUNAS_SUBSTITUTOS].copy()
+    medicamentos["n_substitutes"] = medicamentos[COLUNAS_SUBSTITUTOS].notnull().sum(axis=1)
+    medicamentos = preencher_ausentes(medicamentos)
+    medicamentos["use0"] = dados["use0"]
+    medicamentos["dosage"] = dosagens
+    return medicamentos
+
+
+def extrair_efeitos(dados):
+    """Conjunto dos 11 primeiros efeitos colaterais e da contagem total de efeitos (effects.csv)."""
+    efeitos = dados.loc[:, COLUNAS_EFEITOS].copy()
+    efeitos["n_effects"] = efeitos.notnull().sum(axis=1)
+    efeitos = preencher_ausentes(efeitos.loc[:, COLUNAS_EFEITOS[:11] + ["n_effects"]])
+    return pd.concat((dados["name"], efeitos, dados["Therapeutic Class"]), axis=1) #O nome é a chave de união com medicamentos.csv
+
+
+def imputar_coluna(dados, alvo, preditoras, n_vizinhos, n_processos=-1, tamanho_lote=20000):
+    """
+    Preenche os valores nulos de uma coluna com um KNN treinado nas linhas conhecidas.
+    As previsões (a parte cara do KNN) são feitas em lotes distribuídos entre os núcleos;
+    cada linha é prevista de forma independente, então o resultado não depende do paralelismo.
+    """
+    #Mesmos códigos do LabelEncoder (categorias ordenadas e ausentes por último), também nas colunas string[pyarrow]
+    X = np.column_stack([pd.factorize(dados[coluna], sort=True, use_na_sentinel=False)[0] for coluna in preditoras])
+    nulos = dados[alvo].isnull().to_numpy()
+    if not nulos.any():
+        return dados[alvo]
+    knn = KNeighborsClassifier(n_neighbors=n_vizinhos).fit(X[~nulos], dados.loc[~nulos, alvo])
+    X_nulos = X[nulos]
+    previsoes = Parallel(n_jobs=n_processos)(delayed(knn.predict)(X_nulos[inicio:inicio + tamanho_lote])
+                                             for inicio in range(0, len(X_nulos), tamanho_lote))
+    return dados[alvo].fillna(pd.Series(np.concatenate(previsoes), index=dados.index[nulos]))
+
+
+def imputar_classes(dados, n_vizinhos=7, n_processos=-1):
+    """Imputação de "Action Class" e, em seguida, de "Chemical Class" pelos vizinhos mais próximos."""
+    dados = dados.loc[:, ["use0", "Habit Forming", "Therapeutic Class", "Action Class", "Chemical Class"]].copy()
+    dados["Action Class"] = imputar_coluna(dados, "Action Class", ["use0", "Habit Forming", "Therapeutic Class"],
+                                           n_vizinhos, n_processos)
+    #Action Class agora se tornou uma variável independente, ajudando a prever os valores de "Chemical Class"
+    dados["Chemical Class"] = imputar_coluna(dados, "Chemical Class", ["use0", "Habit Forming", "Therapeutic Class", "Action Class"],
+                                             n_vizinhos, n_processos)
+    return dados
+
+
+def montar_medicamentos_ml(classes, efeitos, dosagens):
+    """Conjunto usado na modelagem (medicamentos_ml.csv): classes imputadas, contagem de efeitos e dosagem."""
+    medicamentos_ml = classes.copy()
+    medicamentos_ml["n_effects"] = efeitos["n_effects"]
+    medicamentos_ml["dosage"] = dosagens
+    return medicamentos_ml.fillna("Not Applicable").loc[:, COLUNAS_ML]
+
+
+def ajustar_limitador(medicamentos_ml, limite=20, correcoes=CORRECOES):
+    """Aprende as categorias mais frequentes de cada coluna (salvas em objects/ para a inferência)."""
+    return LimitadorCategorias(limite, CATEGORICAS).fit(corrigir_nomes(medicamentos_ml.copy(), correcoes))
+
+
+def limitar_categorias(medicamentos_ml, limitador, correcoes=CORRECOES):
+    """Limita as categorias de cada coluna às mais frequentes e cria a variável alvo HighRisk (medicamentos_final.csv)."""
+    dados = limitador.transform(corrigir_nomes(medicamentos_ml.copy(), correcoes))
+    dados["HighRisk"] = (dados["n_effects"] > dados["n_effects"].mean()).astype(int)
+    return dados.drop(columns="n_effects")
+
+
+def codificar(dados, tamanho_teste=0.2, semente=42):
+    """Escalonamento da dosagem, divisão estratificada em treino/teste e codificação das categorias."""
+    scaler = StandardScaler()
+    X = dados.loc[:, CATEGORICAS].copy()
+    X["dosage"] = scaler.fit_transform(dados[["dosage"]])[:, 0]
+    X_train, X_test, y_train, y_test = train_test_split(X, dados["HighRisk"], test_size=tamanho_teste,
+                                                        random_state=semente, stratify=dados["HighRisk"])
+    encoders = {}
+    for coluna in CATEGORICAS:
+        encoders[coluna] = LabelEncoder()
+        X_train[coluna] = encoders[coluna].fit_transform(X_train[coluna])
+        X_test[coluna] = encoders[coluna].transform(X_test[coluna])
+    return {"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test,
+            "encoders": encoders, "scaler": scaler}
+
+
+def treinar(matrizes, n_arvores=100, semente=42):
+    """Treinamento do RandomForest."""
+    return RandomForestClassifier(random_state=semente, n_estimators=n_arvores).fit(matrizes["X_train"], matrizes["y_train"])
+
+
+def avaliar(modelo, matrizes):
+    """Métricas do modelo no conjunto de teste (a validação cruzada segue o notebook de modelagem)."""
+    X_test, y_test = matrizes["X_test"], matrizes["y_test"]
+    previsoes = modelo.predict(X_test)
+    return {"acuracia": accuracy_score(y_test, previsoes),
+            "roc_auc": roc_auc_score(y_test, previsoes),
+            "cross_val": float(np.mean(cross_val_score(modelo, X_test, y_test))),
+            "relatorio": classification_report(y_test, previsoes)}
+
+
+def explicar_treino(modelo, matrizes, final, n_processos=-1):
+    """Cubo SHAP global: valores SHAP do treino agregados por classe terapêutica, classe de ação e faixa de dosagem."""
+    X_train = matrizes["X_train"]
+    grupos = final.loc[X_train.index]
+    return calcular_cubo_shap(modelo, X_train, grupos, grupos["dosage"], None if n_processos == -1 else n_processos)
+
+
+#================================================================================
+
+class Resultado:
+    """
+    Resultado de uma etapa, identificado pela sua chave. O valor é lido do cache apenas no primeiro acesso.
+    Parâmetros:
+      - chave (str): Hash que identifica o resultado.
+      - caminho (str): Arquivo do cache com o valor (None quando o valor já está em memória).
+      - valor: Valor já calculado (opcional).
+    """
+
+    def __init__(self, chave, caminho=None, valor=None):
+        self.chave = chave
+        self.caminho = caminho
+        self._valor = valor
+        self._carregado = caminho is None
+
+    @property
+    def valor(self):
+        if not self._carregado:
+            self._valor = load(self.caminho)
+            self._carregado = True
+        return self._valor
+
+
+class Pipeline:
+    """
+    Executa as etapas com cache em disco e registra, para cada uma, se foi recalculada, quanto tempo levou
+    e o pico de memória do processo ao final da etapa.
+    A chave de uma etapa é o hash do código da etapa (e das funções auxiliares informadas),
+    dos seus parâmetros e das chaves das entradas.
+    Parâmetros:
+      - diretorio_cache (str): Pasta onde os resultados das etapas são gravados.
+    """
+
+    def __init__(self, diretorio_cache=DIRETORIO_CACHE):
+        self.diretorio_cache = diretorio_cache
+        self.registro = []
+        os.makedirs(diretorio_cache, exist_ok=True)
+
+    def fonte(self, caminho):
+        """Arquivo de entrada do pipeline, identificado pelo hash do seu conteúdo (e não pelo caminho)."""
+        return Resultado(hash_arquivo(caminho), valor=caminho)
+
+    def etapa(self, funcao, *entradas, auxiliares=(), execucao=None, **parametros):
+        """
+        Executa uma etapa, ou reaproveita o resultado gravado quando código, parâmetros e entradas não mudaram.
+        Parâmetros:
+          - funcao: Função da etapa (recebe os valores das entradas e os parâmetros).
+          - entradas (Resultado): Resultados das etapas anteriores.
+          - auxiliares: Funções chamadas pela etapa cujo código também faz parte da chave.
+          - execucao (dict): Parâmetros que não alteram o resultado (tamanho dos lotes, processos) e ficam fora da chave.
+          - parametros: Parâmetros da etapa (devem ter representação estável com repr).
+        Retorno (Resultado): Resultado da etapa.
+        """
+        identificacao = {"etapa": funcao.__name__,
+                         "codigo": [inspect.getsource(f) for f in (funcao, *auxiliares)],
+                         "entradas": [entrada.chave for entrada in entradas],
+                         "parametros": repr(sorted(parametros.items()))}
+        chave = hashlib.sha1(json.dumps(identificacao).encode("utf-8")).hexdigest()
+        caminho = os.path.join(self.diretorio_cache, f"{funcao.__name__}-{chave[:16]}.joblib")
+
+        inicio = time.perf_counter()
+        if os.path.exists(caminho):
+            resultado, situacao = Resultado(chave, caminho), "cache"
+        else:
+            valor = funcao(*(entrada.valor for entrada in entradas), **parametros, **(execucao or {}))
+            temporario = caminho + ".tmp"
+            dump(valor, temporario)
+            os.replace(temporario, caminho) #Gravação atômica: uma execução interrompida não deixa resultado parcial
+            resultado, situacao = Resultado(chave, valor=valor), "executada"
+
+        duracao = time.perf_counter() - inicio
+        pico = pico_memoria_mb()
+        self.registro.append((funcao.__name__, situacao, duracao, pico))
+        print(f"{funcao.__name__:<22} {situacao:<10} {duracao:6.1f}s  pico {pico:7.0f} MB  {chave[:12]}", flush=True)
+        return resultado
+
+
+def executar(origem, destino=".", objetos="objects", diretorio_cache=DIRETORIO_CACHE,
+             n_vizinhos=7, limite=20, n_arvores=100, semente=42, tamanho_lote=50000, n_processos=-1):
+    """
+    Executa o pipeline completo e grava os CSVs e os artefatos consumidos pelo Streamlit.
+    Parâmetros:
+      - origem (str): Conjunto de dados original (medicine_dataset.csv).
+      - destino (str): Pasta dos CSVs gerados.
+      - objetos (str): Pasta dos artefatos do modelo.
+      - diretorio_cache (str): Pasta do cache das etapas.
+      - n_vizinhos, limite, n_arvores, semente: Parâmetros da imputação, da limitação de categorias e do modelo.
+      - tamanho_lote (int): Linhas lidas por vez do conjunto original.
+      - n_processos (int): Processos usados nas previsões da imputação KNN e no TreeSHAP do cubo (-1 = todos os núcleos).
+    Retorno (dict): Métricas do modelo treinado.
+    """
+    pipeline = Pipeline(diretorio_cache)
+    bruto = pipeline.etapa(ler_bruto, pipeline.fonte(origem), execucao={"tamanho_lote": tamanho_lote})
+    dados = pipeline.etapa(limpar, bruto, auxiliares=(corrigir_nomes,), correcoes=CORRECOES)
+    dosagens = pipeline.etapa(extrair_dosagens, dados, auxiliares=(extrair_dosagem,))
+    medicamentos = pipeline.etapa(extrair_medicamentos, dados, dosagens, auxiliares=(preencher_ausentes,))
+    efeitos = pipeline.etapa(extrair_efeitos, dados, auxiliares=(preencher_ausentes,))
+    classes = pipeline.etapa(imputar_classes, dados, auxiliares=(imputar_coluna,), n_vizinhos=n_vizinhos,
+                             execucao={"n_processos": n_processos})
+    medicamentos_ml = pipeline.etapa(montar_medicamentos_ml, classes, efeitos, dosagens)
+    limitador = pipeline.etapa(ajustar_limitador, medicamentos_ml, auxiliares=(corrigir_nomes, LimitadorCategorias),
+                               limite=limite, correcoes=CORRECOES)
+    final = pipeline.etapa(limitar_categorias, medicamentos_ml, limitador, auxiliares=(corrigir_nomes, LimitadorCategorias),
+                           correcoes=CORRECOES)
+    matrizes = pipeline.etapa(codificar, final, semente=semente)
+    modelo = pipeline.etapa(treinar, matrizes, n_arvores=n_arvores, semente=semente)
+    metricas = pipeline.etapa(avaliar, modelo, matrizes).valor
+    cubo = pipeline.etapa(explicar_treino, modelo, matrizes, final,
+                          auxiliares=(calcular_cubo_shap, CuboSHAP, limites_dosagem, faixas_dosagem),
+                          execucao={"n_processos": n_processos})
+
+    # Persistência dos conjuntos de dados e dos artefatos
+    os.makedirs(destino, exist_ok=True)
+    medicamentos.valor.to_csv(os.path.join(destino, "medicamentos.csv"), index=False)
+    efeitos.valor.to_csv(os.path.join(destino, "effects.csv"), index=False)
+    medicamentos_ml.valor.to_csv(os.path.join(destino, "medicamentos_ml.csv"), index=False)
+    final.valor.to_csv(os.path.join(destino, "medicamentos_final.csv"), index=False)
+
+    os.makedirs(objetos, exist_ok=True)
+    dump(limitador.valor, os.path.join(objetos, ARQUIVO_LIMITADOR))
+    dump(matrizes.valor["scaler"], os.path.join(objetos, "scaler.joblib"))
+    for coluna, encoder in matrizes.valor["encoders"].items():
+        dump(encoder, os.path.join(objetos, f"encoder_{coluna}.joblib"))
+    dump(modelo.valor, os.path.join(objetos, "best_model.joblib"))
+    np.save(os.path.join(objetos, "cross_val"), metricas["cross_val"])
+    exportar_floresta(objetos)
+    cubo.valor.salvar(os.path.join(objetos, ARQUIVO_CUBO_SHAP))
+    montar_pacote_artefatos(objetos)
+    return metricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline incremental de dados e modelo do Pharma Insights.")
+    parser.add_argument("origem", help="Conjunto de dados original (medicine_dataset.csv).")
+    parser.add_argument("--destino", default=".", help="Pasta dos CSVs gerados.")
+    parser.add_argument("--objetos", default="objects", help="Pasta dos artefatos do modelo.")
+    parser.add_argument("--cache", default=DIRETORIO_CACHE, help="Pasta do cache das etapas.")
+    parser.add_argument("--vizinhos", type=int, default=7, help="Vizinhos da imputação KNN.")
+    parser.add_argument("--limite", type=int, default=20, help="Quantidade máxima de categorias por coluna.")
+    parser.add_argument("--arvores", type=int, default=100, help="Quantidade de árvores do RandomForest.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--tamanho-lote", type=int, default=50000, help="Linhas lidas por vez do conjunto original.")
+    parser.add_argument("--processos", type=int, default=-1, help="Processos da imputação KNN e do cubo SHAP (padrão: todos os núcleos).")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    metricas = executar(args.origem, args.destino, args.objetos, args.cache, args.vizinhos, args.limite,
+                        args.arvores, args.semente, args.tamanho_lote, args.processos)
+    print(metricas["relatorio"])
+    print(f"Acurácia: {metricas['acuracia']:.4f} | Roc-Auc: {metricas['roc_auc']:.4f} | "
+          f"Validação cruzada: {metricas['cross_val']:.4f}")
+    print(f"Tempo total: {time.perf_counter() - inicio:.1f}s | Pico de memória: {pico_memoria_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
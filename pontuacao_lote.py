@@ -0,0 +1,38 @@
+"""
+Pontuação em lote de catálogos de medicamentos candidatos pela linha de comando.
+O arquivo de entrada é lido em partes e o resultado é gravado parte a parte,
+permitindo processar dezenas de milhares de formulações sem carregar tudo em memória.
+
+Uso:
+    python pontuacao_lote.py candidatos.csv resultado.csv --tamanho-lote 20000 --shap
+"""
+
+import argparse
+import time
+from funcoes import carregar_artefatos, pontuar_lote
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pontuação em lote do risco de efeitos adversos.")
+    parser.add_argument("entrada", help="CSV com as colunas Action Class, Chemical Class, Habit Forming, Therapeutic Class, use0 e dosage.")
+    parser.add_argument("saida", help="CSV de saída com as colunas previsao, probabilidade e erro.")
+    parser.add_argument("--tamanho-lote", type=int, default=10000, help="Quantidade de linhas processadas por vez.")
+    parser.add_argument("--shap", action="store_true", help="Inclui as contribuições SHAP de cada feature para a classe prevista.")
+    parser.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    artefatos = carregar_artefatos(args.objetos)
+    total, com_erro = 0, 0
+    for numero, lote in enumerate(pontuar_lote(args.entrada, artefatos, args.tamanho_lote, args.shap)):
+        lote.to_csv(args.saida, mode="w" if numero == 0 else "a", header=numero == 0, index=False)
+        total += len(lote)
+        com_erro += int((lote["erro"] != "").sum())
+        print(f"Lote {numero + 1}: {total:,} linhas processadas", flush=True)
+
+    duracao = time.perf_counter() - inicio
+    print(f"Concluído em {duracao:.1f}s: {total:,} linhas, {com_erro:,} com erro (ver coluna 'erro').")
+
+
+if __name__ == "__main__":
+    main()
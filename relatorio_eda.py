@@ -0,0 +1,31 @@
+"""
+Geração do relatório de Análise Exploratória sem interface (execução em lote).
+Os gráficos de barras de todas as colunas categóricas são renderizados em paralelo
+e gravados em uma pasta com index.html, imagens PNG e os tempos de cada figura.
+
+Uso:
+    python relatorio_eda.py medicine_dataset.csv --destino relatorio_eda --maiores 15 --cor Greens_r
+"""
+
+import argparse
+from funcoes import ler_dados, gerar_relatorio_eda
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório estático de Análise Exploratória.")
+    parser.add_argument("arquivo", help="Conjunto de dados (CSV ou Parquet/Feather).")
+    parser.add_argument("--destino", default="relatorio_eda", help="Pasta de saída do relatório.")
+    parser.add_argument("--maiores", type=int, default=15, help="Quantidade de valores mais frequentes por coluna.")
+    parser.add_argument("--cor", default="Blues_r", help="Paleta de cores do Seaborn.")
+    parser.add_argument("--processos", type=int, default=None, help="Quantidade de processos (padrão: um por núcleo).")
+    args = parser.parse_args()
+
+    dados = ler_dados(args.arquivo)
+    relatorio = gerar_relatorio_eda(dados, args.destino, args.cor, args.maiores, args.processos)
+    lenta = max(relatorio["figuras"], key=relatorio["figuras"].get, default=None)
+    print(f"{len(relatorio['figuras'])} gráficos gravados em {args.destino} em {relatorio['total']:.1f}s "
+          f"(agregação: {relatorio['agregacao'] * 1000:.0f} ms, figura mais lenta: {lenta})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Seleção de modelos com validação cruzada estratificada (K-fold) em todo o conjunto de treino.
+
+O notebook de modelagem treina cada modelo uma única vez e calcula o cross_val_score apenas sobre o X_test
+(5 folds em 20% dos dados). Aqui, cada combinação de hiperparâmetros de cada modelo é avaliada nos K folds
+do treino, com os candidatos e os folds distribuídos entre processos (--processos, como o n_jobs do sklearn).
+As matrizes codificadas/escalonadas de cada fold (encoders e scaler ajustados apenas na parte de treino do fold)
+são calculadas uma única vez e memorizadas em disco pelo hash do conjunto e dos parâmetros da divisão,
+então nenhum candidato recodifica os dados.
+
+O vencedor é reajustado em todo o treino, avaliado no conjunto de teste separado (nunca usado na seleção)
+e gravado em objects/ com os encoders, o scaler e as métricas (avaliacao_modelo.json) exibidas pelo aplicativo;
+o cubo SHAP global é recalculado para o vencedor (--sem-cubo apenas remove o cubo do modelo anterior).
+XGBoost e LightGBM entram na busca apenas se estiverem instalados.
+
+Uso:
+    python selecao_modelos.py medicamentos_final.csv --folds 5 --processos -1
+    python selecao_modelos.py medicamentos_final.csv --modelos RandomForest LightGBM --metrica roc_auc
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, dump
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from funcoes import (ARQUIVO_AVALIACAO, ARQUIVO_CUBO_SHAP, CATEGORICAS, COLUNAS_MODELO, exportar_cubo_shap, exportar_floresta,
+                     montar_pacote_artefatos)
+from pipeline import Pipeline
+
+
+DIRETORIO_CACHE = os.path.join("cache", "selecao")
+METRICAS = {"acuracia": "Acurácia", "roc_auc": "ROC-AUC", "f1": "F1"}
+
+
+def espacos_busca(semente=42):
+    """
+    Modelos candidatos e suas grades de hiperparâmetros (cada modelo usa um único núcleo: o paralelismo é
+    entre candidatos e folds). XGBoost e LightGBM são opcionais.
+    Retorno: espacos (dict): Nome do modelo -> (estimador base, grade de hiperparâmetros).
+    """
+    espacos = {"RandomForest": (RandomForestClassifier(random_state=semente, n_jobs=1),
+                                {"n_estimators": [100, 200], "max_depth": [None, 20], "min_samples_leaf": [1, 3]})}
+    try:
+        from xgboost import XGBClassifier
+    except ImportError:
+        print("XGBoost não instalado: modelo ignorado na busca.")
+    else:
+        espacos["XGBoost"] = (XGBClassifier(random_state=semente, n_jobs=1, eval_metric="logloss"),
+                              {"n_estimators": [200, 400], "max_depth": [6, 10], "learning_rate": [0.1, 0.3]})
+    try:
+        from lightgbm import LGBMClassifier
+    except ImportError:
+        print("LightGBM não instalado: modelo ignorado na busca.")
+    else:
+        espacos["LightGBM"] = (LGBMClassifier(random_state=semente, n_jobs=1, verbose=-1),
+                               {"n_estimators": [200, 400], "num_leaves": [31, 127], "learning_rate": [0.05, 0.1]})
+    return espacos
+
+
+#================================================================================
+
+#Folds codificados (memorizados em disco pelo Pipeline)
+def codificar_fold(treino, validacao):
+    """
+    Ajusta o scaler da dosagem e os encoders das categorias apenas nas linhas de treino, como em pipeline.codificar,
+    e aplica nas linhas de validação (categorias ausentes do treino recebem o código -1).
+    Retorno (dict): Matrizes "X_treino", "y_treino", "X_validacao" e "y_validacao", encoders e scaler.
+    """
+    scaler = StandardScaler().fit(treino[["dosage"]])
+    encoders = {coluna: LabelEncoder().fit(treino[coluna]) for coluna in CATEGORICAS}
+
+    def matriz(dados):
+        colunas = [pd.Categorical(dados[coluna], categories=encoders[coluna].classes_).codes for coluna in CATEGORICAS]
+        colunas.append(scaler.transform(dados[["dosage"]])[:, 0])
+        return np.column_stack(colunas).astype(np.float64) #Ordem de COLUNAS_MODELO
+
+    return {"X_treino": matriz(treino), "y_treino": treino["HighRisk"].to_numpy(),
+            "X_validacao": matriz(validacao), "y_validacao": validacao["HighRisk"].to_numpy(),
+            "encoders": encoders, "scaler": scaler}
+
+
+def preparar_folds(caminho, n_folds=5, tamanho_teste=0.2, semente=42):
+    """
+    Divide o conjunto em treino/teste (mesma divisão estratificada do treinamento) e o treino em K folds estratificados.
+    Retorno (dict): "folds" (matrizes de cada fold), "treino" (todo o treino, para o reajuste do vencedor) e "teste".
+    """
+    dados = pd.read_csv(caminho)
+    treino, teste = train_test_split(dados, test_size=tamanho_teste, random_state=semente, stratify=dados["HighRisk"])
+    divisao = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=semente)
+    folds = [codificar_fold(treino.iloc[indices_treino], treino.iloc[indices_validacao])
+             for indices_treino, indices_validacao in divisao.split(treino, treino["HighRisk"])]
+    return {"folds": folds, "treino": codificar_fold(treino, teste), "n_treino": len(treino), "n_teste": len(teste)}
+
+
+#================================================================================
+
+#Avaliação dos candidatos
+def metricas(y, probabilidades, classes):
+    """Acurácia, ROC-AUC (pelas probabilidades da classe positiva) e F1 das previsões."""
+    previsoes = classes[np.argmax(probabilidades, axis=1)]
+    return {"acuracia": accuracy_score(y, previsoes), "roc_auc": roc_auc_score(y, probabilidades[:, 1]),
+            "f1": f1_score(y, previsoes)}
+
+
+def avaliar_candidato(estimador, fold):
+    """Ajusta o candidato na parte de treino do fold e o avalia na parte de validação (executado nos processos)."""
+    inicio = time.perf_counter()
+    modelo = clone(estimador).fit(fold["X_treino"], fold["y_treino"])
+    resultado = metricas(fold["y_validacao"], modelo.predict_proba(fold["X_validacao"]), modelo.classes_)
+    resultado["tempo_s"] = time.perf_counter() - inicio
+    return resultado
+
+
+def buscar(nome, estimador, grade, folds, processos):
+    """
+    Avalia todas as combinações da grade em todos os folds em paralelo.
+    Retorno: candidatos (list): Parâmetros, métricas médias e desvios de cada combinação; duracao (float): Tempo até o resultado.
+    """
+    combinacoes = list(ParameterGrid(grade))
+    inicio = time.perf_counter()
+    resultados = Parallel(n_jobs=processos)(delayed(avaliar_candidato)(clone(estimador).set_params(**parametros), fold)
+                                            for parametros in combinacoes for fold in folds)
+    duracao = time.perf_counter() - inicio
+
+    candidatos = []
+    for numero, parametros in enumerate(combinacoes):
+        por_fold = pd.DataFrame(resultados[numero * len(folds):(numero + 1) * len(folds)])
+        resumo = {"modelo": nome, "parametros": parametros, "tempo_ajuste_s": float(por_fold["tempo_s"].sum())}
+        for metrica in METRICAS:
+            resumo[metrica] = float(por_fold[metrica].mean())
+            resumo[f"{metrica}_desvio"] = float(por_fold[metrica].std(ddof=0))
+        candidatos.append(resumo)
+    return candidatos, duracao
+
+
+#================================================================================
+
+def gravar_vencedor(vencedor, preparados, espacos, objetos, resumo, processos_cubo=None, com_cubo=True):
+    """
+    Reajusta o vencedor em todo o treino, avalia no teste e grava o modelo, encoders, scaler e métricas em objects/.
+    O cubo SHAP é recalculado para o novo modelo com a mesma divisão em treino/teste (com_cubo=False apenas remove
+    o cubo do modelo anterior, para que a página não exiba as médias de outro modelo).
+    """
+    treino = preparados["treino"]
+    estimador = clone(espacos[vencedor["modelo"]][0]).set_params(**vencedor["parametros"])
+    inicio = time.perf_counter()
+    modelo = estimador.fit(treino["X_treino"], treino["y_treino"])
+    tempo_ajuste = time.perf_counter() - inicio
+    teste = metricas(treino["y_validacao"], modelo.predict_proba(treino["X_validacao"]), modelo.classes_)
+
+    os.makedirs(objetos, exist_ok=True)
+    dump(treino["scaler"], os.path.join(objetos, "scaler.joblib"))
+    for coluna, encoder in treino["encoders"].items():
+        dump(encoder, os.path.join(objetos, f"encoder_{coluna}.joblib"))
+    dump(modelo, os.path.join(objetos, "best_model.joblib"))
+    np.save(os.path.join(objetos, "cross_val"), vencedor["acuracia"]) #Acurácia exibida pelas versões anteriores do aplicativo
+    avaliacao = {**resumo, "modelo": vencedor["modelo"], "parametros": vencedor["parametros"],
+                 "validacao_cruzada": {"folds": resumo["folds"], "linhas": preparados["n_treino"],
+                                       **{chave: vencedor[chave] for metrica in METRICAS for chave in (metrica, f"{metrica}_desvio")}},
+                 "teste": {"linhas": preparados["n_teste"], **teste}, "tempo_ajuste_final_s": tempo_ajuste}
+    with open(os.path.join(objetos, ARQUIVO_AVALIACAO), "w", encoding="utf-8") as arquivo:
+        json.dump(avaliacao, arquivo, indent=2, ensure_ascii=False)
+    exportar_floresta(objetos)
+    montar_pacote_artefatos(objetos)
+    caminho_cubo = os.path.join(objetos, ARQUIVO_CUBO_SHAP)
+    if com_cubo:
+        exportar_cubo_shap(objetos, resumo["dados"], resumo["tamanho_teste"], resumo["semente"], processos_cubo)
+    elif os.path.exists(caminho_cubo):
+        os.remove(caminho_cubo)
+    return avaliacao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seleção de modelos com validação cruzada estratificada no treino.")
+    parser.add_argument("dados", nargs="?", default="medicamentos_final.csv", help="Conjunto de modelagem (com a coluna HighRisk).")
+    parser.add_argument("--folds", type=int, default=5, help="Quantidade de folds da validação cruzada.")
+    parser.add_argument("--teste", type=float, default=0.2, help="Proporção do conjunto de teste (fora da seleção).")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--processos", type=int, default=-1, help="Processos entre candidatos e folds (padrão: todos os núcleos).")
+    parser.add_argument("--metrica", choices=list(METRICAS), default="acuracia", help="Métrica usada para escolher o vencedor.")
+    parser.add_argument("--modelos", nargs="+", help="Modelos avaliados (padrão: todos os instalados).")
+    parser.add_argument("--objetos", default="objects", help="Pasta onde o vencedor e as métricas são gravados.")
+    parser.add_argument("--cache", default=DIRETORIO_CACHE, help="Pasta dos folds memorizados.")
+    parser.add_argument("--sem-gravar", action="store_true", help="Apenas compara os modelos, sem gravar o vencedor.")
+    parser.add_argument("--sem-cubo", action="store_true",
+                        help="Não recalcula o cubo SHAP do vencedor (o cubo do modelo anterior é removido).")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    pipeline = Pipeline(args.cache)
+    preparados = pipeline.etapa(preparar_folds, pipeline.fonte(args.dados), auxiliares=(codificar_fold,),
+                                n_folds=args.folds, tamanho_teste=args.teste, semente=args.semente).valor
+    espacos = espacos_busca(args.semente)
+    if args.modelos:
+        desconhecidos = set(args.modelos) - set(espacos)
+        if desconhecidos:
+            parser.error(f"Modelos indisponíveis: {sorted(desconhecidos)} (disponíveis: {sorted(espacos)})")
+        espacos = {nome: espacos[nome] for nome in args.modelos}
+
+    candidatos, tempos = [], {}
+    for nome, (estimador, grade) in espacos.items():
+        resultados, tempos[nome] = buscar(nome, estimador, grade, preparados["folds"], args.processos)
+        candidatos += resultados
+        melhor = max(resultados, key=lambda candidato: candidato[args.metrica])
+        print(f"{nome:<14} {len(resultados)} candidatos x {args.folds} folds em {tempos[nome]:.1f}s | melhor "
+              f"{METRICAS[args.metrica]} {melhor[args.metrica]:.4f} ± {melhor[args.metrica + '_desvio']:.4f} {melhor['parametros']}",
+              flush=True)
+
+    vencedor = max(candidatos, key=lambda candidato: candidato[args.metrica])
+    print(f"Vencedor: {vencedor['modelo']} {vencedor['parametros']} | " +
+          " | ".join(f"{rotulo} {vencedor[metrica]:.4f} ± {vencedor[metrica + '_desvio']:.4f}" for metrica, rotulo in METRICAS.items()))
+    if args.sem_gravar:
+        return
+
+    resumo = {"data": datetime.now().isoformat(timespec="seconds"), "dados": args.dados, "folds": args.folds,
+              "metrica_selecao": args.metrica, "tamanho_teste": args.teste, "semente": args.semente, "colunas": COLUNAS_MODELO,
+              "tempo_ate_resultado_s": tempos, "candidatos": candidatos}
+    processos_cubo = args.processos if args.processos > 0 else max(1, os.cpu_count() + 1 + args.processos) #Convenção do joblib
+    avaliacao = gravar_vencedor(vencedor, preparados, espacos, args.objetos, resumo, processos_cubo, not args.sem_cubo)
+    print("Teste: " + " | ".join(f"{rotulo} {avaliacao['teste'][metrica]:.4f}" for metrica, rotulo in METRICAS.items()))
+    gravados = "Vencedor e métricas" if args.sem_cubo else "Vencedor, métricas e cubo SHAP"
+    print(f"{gravados} gravados em {args.objetos}/ "
+          f"({time.perf_counter() - inicio:.1f}s).")
+
+
+if __name__ == "__main__":
+    main()
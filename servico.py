@@ -0,0 +1,214 @@
+"""
+Serviço HTTP (sem a interface do Streamlit) para previsão e explicação do risco de efeitos adversos,
+usando os mesmos encoders, scaler e modelo do aplicativo (pacote de artefatos de objects/).
+
+As requisições de uma única linha que chegam dentro de uma janela de poucos milissegundos são agrupadas
+em um lote: uma única passagem pela floresta (e uma única chamada do TreeSHAP) atende vários clientes.
+A fila de cada rota é limitada: com a fila cheia o serviço responde 503 (com Retry-After) em vez de
+acumular latência.
+
+Uso:
+    python servico.py --porta 8000 --janela-ms 2 --lote-maximo 256 --fila-maxima 2048
+    curl -X POST localhost:8000/predict -d '{"Action Class": "...", "Chemical Class": "...", "Habit Forming": "No",
+                                           "Therapeutic Class": "...", "use0": "...", "dosage": 500}'
+    curl localhost:8000/metrics
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tornado.web
+from funcoes import METRICAS, ExplicadorSHAP, InferenciaCompilada, carregar_artefatos
+
+
+class AgrupadorLotes:
+    """
+    Agrupa as linhas enviadas por requisições concorrentes em lotes processados de uma só vez.
+    O lote começa com a primeira linha da fila, espera a janela para juntar as próximas (sem esperar se a fila
+    já tiver um lote completo) e é processado em uma thread, então o loop de eventos continua aceitando requisições
+    (que formam o lote seguinte) enquanto o lote atual é calculado.
+    Parâmetros:
+      processar (callable): Recebe a matriz (linhas x features) e retorna um resultado por linha.
+      executor (Executor): Threads onde os lotes são processados.
+      rota (str): Nome da rota (rótulo das métricas).
+      janela (float): Espera máxima (em segundos) para completar um lote.
+      tamanho_maximo (int): Quantidade máxima de linhas por lote.
+      fila_maxima (int): Quantidade máxima de linhas aguardando (além dela, enviar levanta asyncio.QueueFull).
+    """
+
+    def __init__(self, processar, executor, rota, janela=0.002, tamanho_maximo=256, fila_maxima=2048):
+        self.processar = processar
+        self.executor = executor
+        self.rotulos = (("rota", rota),)
+        self.janela = janela
+        self.tamanho_maximo = tamanho_maximo
+        self.fila = asyncio.Queue(maxsize=fila_maxima)
+
+    def enviar(self, linha):
+        """Enfileira uma linha codificada e retorna o futuro com o seu resultado."""
+        futuro = asyncio.get_running_loop().create_future()
+        self.fila.put_nowait((linha, futuro))
+        return futuro
+
+    async def executar(self):
+        """Laço de formação e processamento dos lotes (executado como tarefa durante toda a vida do serviço)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self.fila.get()]
+            if self.janela > 0 and self.fila.qsize() < self.tamanho_maximo - 1:
+                await asyncio.sleep(self.janela)
+            while len(lote) < self.tamanho_maximo and not self.fila.empty():
+                lote.append(self.fila.get_nowait())
+
+            linhas = np.vstack([linha for linha, _ in lote])
+            try:
+                resultados = await loop.run_in_executor(self.executor, self.processar, linhas)
+            except Exception as erro: #O erro é repassado a todas as requisições do lote
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(erro)
+            else:
+                for (_, futuro), resultado in zip(lote, resultados):
+                    if not futuro.done(): #Clientes que desistiram da requisição são ignorados
+                        futuro.set_result(resultado)
+            METRICAS.incrementar("pharma_servico_lotes_total", self.rotulos)
+            METRICAS.incrementar("pharma_servico_linhas_total", self.rotulos, len(lote))
+
+
+class Servico:
+    """
+    Modelo servido pelas rotas HTTP: codificação de uma linha (InferenciaCompilada), previsão em lote pela
+    floresta compacta e explicação em lote pelo ExplicadorSHAP (com cache das linhas já explicadas).
+    Parâmetros:
+      artefatos (dict): Pacote retornado por carregar_artefatos.
+      bloco_shap (int): Linhas por chamada do TreeSHAP. O TreeSHAP mantém o GIL durante toda a chamada (~40 ms por linha),
+        então blocos pequenos permitem que o loop de eventos responda (inclusive com 503) entre um bloco e outro.
+    """
+
+    def __init__(self, artefatos, bloco_shap=4):
+        self.bloco_shap = bloco_shap
+        self.inferencia = InferenciaCompilada(artefatos)
+        self.floresta = artefatos["floresta"]
+        self.explicador = ExplicadorSHAP(artefatos["modelo"])
+        self.colunas = self.inferencia.colunas
+        self.floresta.predict_proba(np.zeros((1, len(self.colunas)))) #Compila o percurso da floresta antes da primeira requisição
+
+    def codificar(self, corpo):
+        """Converte o corpo JSON de uma requisição em uma linha de features (cópia da linha pré-alocada)."""
+        valores = json.loads(corpo)
+        if not isinstance(valores, dict):
+            raise ValueError("O corpo da requisição deve ser um objeto JSON com as colunas " + ", ".join(self.colunas))
+        faltantes = [coluna for coluna in self.colunas if coluna not in valores]
+        if faltantes:
+            raise ValueError(f"Colunas ausentes: {faltantes}")
+        return self.inferencia.codificar(valores).copy()
+
+    def _previsoes(self, linhas):
+        probabilidades = self.floresta.predict_proba(linhas)
+        classes = self.floresta.classes[np.argmax(probabilidades, axis=1)]
+        return [{"previsao": classe.item(), "probabilidades": dict(zip(map(str, self.floresta.classes.tolist()), linha))}
+                for classe, linha in zip(classes, probabilidades.tolist())]
+
+    def prever_lote(self, linhas):
+        """Classe prevista e probabilidades de cada linha, com uma única passagem pela floresta."""
+        return self._previsoes(linhas)
+
+    def explicar_lote(self, linhas):
+        """Previsão e contribuições SHAP de cada linha (as linhas repetidas e as já explicadas saem do cache do explicador)."""
+        previsoes = self._previsoes(linhas)
+        blocos = [self.explicador.explicar(linhas[inicio:inicio + self.bloco_shap])
+                  for inicio in range(0, len(linhas), self.bloco_shap)]
+        shap_values, valor_base = np.vstack([valores for valores, _ in blocos]), blocos[0][1]
+        for previsao, contribuicoes in zip(previsoes, shap_values.tolist()):
+            previsao.update({"classe_explicada": self.explicador.classe, "ligacao": self.explicador.ligacao, "valor_base": valor_base,
+                             "contribuicoes": dict(zip(self.colunas, contribuicoes))})
+        return previsoes
+
+
+class RequisicaoMetrificada(tornado.web.RequestHandler):
+    """Base das rotas: registra a latência e o status de cada requisição."""
+
+    def on_finish(self):
+        rota = (("rota", self.request.path),)
+        METRICAS.observar("pharma_servico_duracao_segundos", rota, self.request.request_time())
+        METRICAS.incrementar("pharma_servico_requisicoes_total", rota + (("status", str(self.get_status())),))
+
+
+class RequisicaoModelo(RequisicaoMetrificada):
+    """POST com um objeto JSON (uma linha): enfileira a linha no agrupador da rota e aguarda o resultado do lote."""
+
+    def initialize(self, servico, agrupador):
+        self.servico = servico
+        self.agrupador = agrupador
+
+    async def post(self):
+        try:
+            linha = self.servico.codificar(self.request.body)
+        except (ValueError, TypeError) as erro: #JSON inválido, colunas ausentes, categorias desconhecidas ou dosagem inválida
+            self.set_status(400)
+            self.write({"erro": str(erro)})
+            return
+        try:
+            futuro = self.agrupador.enviar(linha)
+        except asyncio.QueueFull: #Contrapressão: o cliente deve tentar novamente mais tarde
+            self.set_status(503)
+            self.set_header("Retry-After", "1")
+            self.write({"erro": "Fila cheia, tente novamente em instantes."})
+            return
+        self.write(await futuro)
+
+
+class RequisicaoMetricas(RequisicaoMetrificada):
+    """GET /metrics: métricas do serviço e das funções de funcoes.py no formato de texto do Prometheus."""
+
+    def initialize(self, agrupadores):
+        self.agrupadores = agrupadores
+
+    def get(self):
+        for agrupador in self.agrupadores:
+            METRICAS.definir("pharma_servico_fila", agrupador.rotulos, agrupador.fila.qsize())
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(METRICAS.texto_prometheus())
+
+
+def criar_aplicacao(servico, janela=0.002, tamanho_maximo=256, fila_maxima=2048, threads=1):
+    """
+    Monta a aplicação Tornado e os agrupadores de lotes das rotas /predict e /explain.
+    Retorno: aplicacao (Application), agrupadores (list): As tarefas executar() dos agrupadores devem ser iniciadas no loop.
+    """
+    executor = ThreadPoolExecutor(max_workers=threads) #Threads compartilhadas pelos lotes das duas rotas
+    previsao = AgrupadorLotes(servico.prever_lote, executor, "/predict", janela, tamanho_maximo, fila_maxima)
+    explicacao = AgrupadorLotes(servico.explicar_lote, executor, "/explain", janela, tamanho_maximo, fila_maxima)
+    aplicacao = tornado.web.Application([
+        (r"/predict", RequisicaoModelo, {"servico": servico, "agrupador": previsao}),
+        (r"/explain", RequisicaoModelo, {"servico": servico, "agrupador": explicacao}),
+        (r"/metrics", RequisicaoMetricas, {"agrupadores": [previsao, explicacao]}),
+    ])
+    return aplicacao, [previsao, explicacao]
+
+
+async def servir(args):
+    servico = Servico(carregar_artefatos(args.objetos), args.bloco_shap)
+    aplicacao, agrupadores = criar_aplicacao(servico, args.janela_ms / 1000, args.lote_maximo, args.fila_maxima, args.threads)
+    aplicacao.listen(args.porta)
+    print(f"Serviço disponível em http://localhost:{args.porta} (/predict, /explain e /metrics)", flush=True)
+    await asyncio.gather(*(agrupador.executar() for agrupador in agrupadores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP de previsão e explicação do risco de efeitos adversos.")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--objetos", default="objects", help="Pasta com os artefatos do modelo.")
+    parser.add_argument("--janela-ms", type=float, default=2.0, help="Espera máxima para juntar requisições em um lote.")
+    parser.add_argument("--lote-maximo", type=int, default=256, help="Quantidade máxima de linhas por lote.")
+    parser.add_argument("--fila-maxima", type=int, default=2048, help="Linhas aguardando por rota antes de responder 503.")
+    parser.add_argument("--threads", type=int, default=1, help="Threads que processam os lotes.")
+    parser.add_argument("--bloco-shap", type=int, default=4, help="Linhas por chamada do TreeSHAP em /explain.")
+    args = parser.parse_args()
+    asyncio.run(servir(args))
+
+
+if __name__ == "__main__":
+    main()
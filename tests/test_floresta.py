@@ -0,0 +1,74 @@
+"""
+Equivalência da floresta compacta (achatada, com limiares em float32 e ramos inalcançáveis podados)
+com o predict_proba do RandomForestClassifier, nos percursos com numba e apenas com numpy.
+"""
+
+import numpy as np
+import pytest
+from joblib import dump
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+
+import funcoes
+from funcoes import CATEGORICAS, COLUNAS_MODELO, DIRETORIO_FLORESTA, FlorestaCompacta, exportar_floresta
+
+
+@pytest.fixture(scope="module")
+def artefatos(tmp_path_factory):
+    """Modelo treinado em dados aleatórios codificados como no pipeline, exportado com exportar_floresta."""
+    rng = np.random.default_rng(0)
+    n = 3000
+    diretorio = tmp_path_factory.mktemp("objects")
+    colunas = {}
+    for coluna, n_categorias in zip(CATEGORICAS, (25, 21, 2, 21, 21)):
+        encoder = LabelEncoder().fit([f"{coluna} {i}" for i in range(n_categorias)])
+        colunas[coluna] = encoder.transform(rng.choice(encoder.classes_, n))
+        dump(encoder, diretorio / f"encoder_{coluna}.joblib")
+    colunas["dosage"] = rng.normal(size=n) #Dosagem escalonada (contínua)
+    X = np.column_stack([colunas[coluna] for coluna in COLUNAS_MODELO]).astype(float)
+    y = (X[:, COLUNAS_MODELO.index("dosage")] + 0.3 * rng.normal(size=n) > 0) ^ (rng.random(n) < 0.2)
+    modelo = RandomForestClassifier(n_estimators=30, min_samples_leaf=2, random_state=0).fit(X, y.astype(int))
+    dump(modelo, diretorio / "best_model.joblib")
+    return modelo, exportar_floresta(str(diretorio)), X, diretorio
+
+
+def perto_dos_limiares(modelo, coluna="dosage", quantidade=300):
+    """Linhas com a dosagem exatamente em um limiar das árvores e nos floats vizinhos (float32 e float64)."""
+    posicao = COLUNAS_MODELO.index(coluna)
+    limiares = np.unique(np.concatenate([estimador.tree_.threshold[estimador.tree_.feature == posicao]
+                                         for estimador in modelo.estimators_]))[:quantidade]
+    dosagens = np.concatenate([limiares, np.nextafter(limiares, np.inf), np.nextafter(limiares, -np.inf),
+                               np.nextafter(limiares.astype(np.float32), np.float32(np.inf)).astype(float),
+                               np.nextafter(limiares.astype(np.float32), np.float32(-np.inf)).astype(float)])
+    X = np.zeros((len(dosagens), len(COLUNAS_MODELO)))
+    X[:, posicao] = dosagens
+    X[:, [COLUNAS_MODELO.index(c) for c in CATEGORICAS]] = np.arange(len(dosagens))[:, np.newaxis] % 2
+    return X
+
+
+@pytest.fixture(params=["numba", "numpy"])
+def percurso(request, monkeypatch):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(funcoes, "_percurso_numba", lambda: None)
+    return request.param
+
+
+def test_probabilidades_iguais_as_do_sklearn(artefatos, percurso):
+    modelo, compacta, X, _ = artefatos
+    assert np.allclose(compacta.predict_proba(X), modelo.predict_proba(X))
+
+
+def test_dosagem_perto_dos_limiares(artefatos, percurso):
+    modelo, compacta, _, _ = artefatos
+    X = perto_dos_limiares(modelo)
+    assert len(X) > 0
+    assert np.allclose(compacta.predict_proba(X), modelo.predict_proba(X))
+
+
+def test_floresta_salva_e_carregada_com_mmap(artefatos, percurso):
+    modelo, _, X, diretorio = artefatos
+    carregada = FlorestaCompacta.carregar(str(diretorio / DIRETORIO_FLORESTA))
+    assert np.allclose(carregada.predict_proba(X), modelo.predict_proba(X))
+    assert np.array_equal(carregada.predict(X), modelo.predict(X))
@@ -0,0 +1,15 @@
+"""
+Regressão do custo de importação: as bibliotecas pesadas devem continuar sendo importadas apenas
+dentro das funções que as utilizam, e não em "import funcoes" (executado por todas as páginas).
+"""
+
+from funcoes import custo_importacoes
+
+BIBLIOTECAS_PESADAS = ["shap", "wordcloud", "matplotlib", "networkx"]
+
+
+def test_import_funcoes_nao_carrega_bibliotecas_pesadas():
+    pacotes = {modulo.split(".")[0] for modulo in custo_importacoes()["modulo"]}
+    assert "funcoes" in pacotes #A medição capturou a importação do módulo
+    carregadas = [biblioteca for biblioteca in BIBLIOTECAS_PESADAS if biblioteca in pacotes]
+    assert not carregadas, f"Bibliotecas pesadas importadas por 'import funcoes': {carregadas}"
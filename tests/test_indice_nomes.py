@@ -0,0 +1,40 @@
+"""
+Busca de medicamentos pelo IndiceNomes: prefixo da família e, quando nenhuma família começa com o texto,
+a busca original por trecho do primeiro nome (str.contains).
+"""
+
+import numpy as np
+import pandas as pd
+
+from funcoes import IndiceNomes, filter_dosage, load_and_process_data
+
+NOMES = pd.Series(["Allegra 120mg Tablet", "Allegra 180mg Tablet", "Augmentin 625 Duo", "Xallegra 5 Syrup",
+                   "Zinc 20 Tablet", "Zinco 10"])
+
+
+def busca_original(medicamento):
+    """Posições encontradas pela versão com varredura (primeiro nome que contém o primeiro nome digitado)."""
+    return np.flatnonzero(NOMES.str.split(" ").str[0].str.contains(medicamento.split(" ")[0]))
+
+
+def test_prefixo_tem_prioridade():
+    posicoes, dosagens = load_and_process_data(IndiceNomes(NOMES), "Allegra")
+    assert posicoes.tolist() == [0, 1]
+    assert dosagens.tolist() == [120, 180]
+
+
+def test_trecho_do_nome_quando_nenhuma_familia_comeca_com_o_texto():
+    indice = IndiceNomes(NOMES)
+    for medicamento in ("llegra", "inc", "ugment"):
+        posicoes, _ = load_and_process_data(indice, medicamento)
+        assert posicoes.tolist() == busca_original(medicamento).tolist()
+    assert load_and_process_data(indice, "llegra")[1].tolist() == [5, 120, 180]
+    assert filter_dosage(indice, "inc", 10).tolist() == [5]
+    assert indice.existe("llegra") and not indice.existe("llegro")
+    assert indice.buscar("llegra 5").tolist() == [3]
+
+
+def test_medicamento_inexistente():
+    posicoes, dosagens = load_and_process_data(IndiceNomes(NOMES), "zzz")
+    assert len(posicoes) == 0 and len(dosagens) == 0
+    assert len(filter_dosage(IndiceNomes(NOMES), "zzz", 10)) == 0
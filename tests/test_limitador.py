@@ -0,0 +1,60 @@
+"""
+Agrupamento de categorias do LimitadorCategorias: ajuste, transformação, serialização e recusa de categorias não vistas.
+"""
+
+import pickle
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from funcoes import LimitadorCategorias, limit_unique_values
+
+
+def dados():
+    return pd.DataFrame({"classe": ["A", "A", "A", "B", "B", "C", None, None, None, None]})
+
+
+def test_fit_transform_mantem_as_mais_frequentes():
+    limitador = LimitadorCategorias(limite=2, colunas=["classe"]).fit(dados())
+    assert set(limitador.mantidas_["classe"]) == {"Not Applicable", "A"}
+    transformado = limitador.transform(dados())["classe"]
+    assert transformado.tolist() == ["A"] * 3 + ["Others"] * 3 + ["Not Applicable"] * 4
+    #A transformação é idempotente: aplicar de novo não muda nada
+    assert limitador.transform(limitador.transform(dados()))["classe"].equals(transformado)
+
+
+def test_desconhecidas_e_limitar_valor_recusam_categorias_nao_vistas():
+    limitador = LimitadorCategorias(limite=2, colunas=["classe"]).fit(dados())
+    novos = pd.DataFrame({"classe": ["A", "C", "Z", None]})
+    assert limitador.desconhecidas(novos)["classe"].tolist() == [False, False, True, False]
+    assert limitador.limitar_valor("classe", "A") == "A"
+    assert limitador.limitar_valor("classe", "C") == "Others"
+    assert limitador.limitar_valor("classe", np.nan) == "Not Applicable"
+    assert limitador.limitar_valor("classe", "Z") is None
+
+
+def test_pickle_e_joblib_preservam_o_limitador(tmp_path):
+    limitador = LimitadorCategorias(limite=2, colunas=["classe"]).fit(dados())
+    assert "_vistas" not in limitador.__getstate__()
+    caminho = tmp_path / "limitador.pkl"
+    joblib.dump(limitador, caminho)
+    for copia in (pickle.loads(pickle.dumps(limitador)), joblib.load(caminho)):
+        assert copia.transform(dados()).equals(limitador.transform(dados()))
+        assert copia.limitar_valor("classe", "C") == "Others"
+        assert copia.limitar_valor("classe", "Z") is None
+
+
+def test_estado_antigo_sem_vistas_aceita_apenas_as_mantidas():
+    limitador = LimitadorCategorias.__new__(LimitadorCategorias)
+    limitador.__setstate__({"limite": 2, "colunas": ["classe"], "outros": "Others",
+                            "mantidas_": {"classe": np.array(["A", "B"], dtype=object)}})
+    assert limitador.ausente == "Not Applicable"
+    assert limitador.limitar_valor("classe", "B") == "B"
+    assert limitador.limitar_valor("classe", "C") is None
+
+
+def test_limit_unique_values_agrupa_ausentes_em_others():
+    resultado = limit_unique_values(dados(), "classe", 1)["classe"]
+    #Os ausentes não entram na contagem: a categoria mantida é "A", e os ausentes viram "Others"
+    assert resultado.tolist() == ["A"] * 3 + ["Others"] * 7